@@ -0,0 +1,7 @@
+"""
+Benchmarks
+----------
+Hot-path benchmarks of the exercise modules on synthetic landmark
+sequences. Run python -m benchmarks from the backend directory (see
+benchmarks.runner).
+"""
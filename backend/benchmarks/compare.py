@@ -0,0 +1,83 @@
+"""
+Benchmark Comparison
+--------------------
+Compares two benchmark result files (from python -m benchmarks) and exits
+with status 1 if any exercise got slower, or allocates more per frame,
+than the threshold allows.
+
+Usage (from the backend directory):
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# Statistics compared: (section, key, statistic)
+COMPARED = (
+    ("latency_us", None, "p50"),
+    ("latency_us", None, "p99"),
+    ("allocations", "peak_bytes_per_frame", "p50"),
+)
+
+def _statistic(result, section, key, statistic):
+    values = result.get(section)
+    if values is not None and key is not None:
+        values = values.get(key)
+    return None if values is None else values.get(statistic)
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compare the exercises present in both result documents.
+
+    Args:
+        baseline: Results document of the reference run
+        current: Results document of the run under test
+        threshold: Allowed relative increase (0.1 = 10%)
+
+    Returns:
+        List of rows (exercise, metric, baseline, current, change, regressed)
+    """
+    rows = []
+    for exercise, result in current["exercises"].items():
+        reference = baseline["exercises"].get(exercise)
+        if reference is None:
+            continue
+        for section, key, statistic in COMPARED:
+            before = _statistic(reference, section, key, statistic)
+            after = _statistic(result, section, key, statistic)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            metric = f"{key or section}.{statistic}"
+            rows.append((exercise, metric, before, after, change, change > threshold))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.compare",
+        description="Compare two benchmark result files"
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed relative increase before a metric counts as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare_results(baseline, current, args.threshold)
+    print(f"{'exercise':<12} {'metric':<26} {'baseline':>12} {'current':>12} {'change':>8}")
+    for exercise, metric, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{exercise:<12} {metric:<26} {before:>12.1f} {after:>12.1f} {change:>+8.1%}{flag}")
+
+    regressions = sum(row[-1] for row in rows)
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
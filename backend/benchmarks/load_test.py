@@ -0,0 +1,390 @@
+"""
+Load Test
+---------
+Simulates concurrent trainees against the API and reports throughput,
+tail latency, error rate and server memory over time.
+
+Every trainee runs a full session: POST /session/start, then a stream of
+POST /landmarks/{exercise}?session_id=... frames at the camera frame rate
+(synthetic sequences, see synthetic), GET /session/{id}/summary polls
+while streaming, and POST /session/{id}/end. Like the frontend, a trainee
+waits for each analysis before sending the next frame; frames whose send
+time passed while a request was in flight are skipped and counted as
+dropped, so an overloaded server shows up as a lower delivered frame rate
+rather than an ever-growing backlog.
+
+By default the app in main.py is driven in process through httpx's ASGI
+transport (the load generator and the server then share one event loop
+and CPU). --url targets a running server instead, and --spawn starts a
+local uvicorn for the run. Server memory (RSS) is read from /proc for the
+current process, the spawned server or --server-pid.
+
+Sessions are journaled to session_logs/ under the server's working
+directory (the current directory for the in-process app and --spawn).
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test --trainees 20 --duration 30 --output load.json
+    python -m benchmarks.load_test --spawn --trainees 100 --ramp-up 10
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --server-pid 4242
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+from benchmarks.runner import distribution, environment
+from benchmarks.synthetic import EXERCISES, generate_sequence, to_landmark_lists
+
+RESULTS_FORMAT_VERSION = 1
+
+# Request kinds reported separately
+REQUEST_KINDS = ("start", "landmarks", "summary", "end")
+
+def read_rss(pid=None):
+    """Resident set size of a process in bytes (None where /proc is unavailable)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class LoadStats:
+    """Latencies and errors of all requests, with a window for the timeline"""
+    def __init__(self):
+        self.latencies = {kind: [] for kind in REQUEST_KINDS}
+        self.errors = {kind: {} for kind in REQUEST_KINDS}
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.sessions_started = 0
+        self.sessions_ended = 0
+        self.active_trainees = 0
+        self._window = []
+        self._window_errors = 0
+
+    def record(self, kind, seconds, error=None):
+        """Record a finished request (error: None, or an error type)"""
+        self.latencies[kind].append(seconds)
+        if kind == "landmarks":
+            self._window.append(seconds)
+        if error is not None:
+            errors = self.errors[kind]
+            errors[error] = errors.get(error, 0) + 1
+            if kind == "landmarks":
+                self._window_errors += 1
+
+    def take_window(self):
+        """Landmark latencies and error count since the last call"""
+        window, errors = self._window, self._window_errors
+        self._window, self._window_errors = [], 0
+        return window, errors
+
+async def timed_request(client, stats, kind, method, url, **kwargs):
+    """
+    Send a request and record its latency and outcome.
+
+    Returns:
+        The decoded JSON response, or None if the request failed
+    """
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        stats.record(kind, time.perf_counter() - started, type(e).__name__)
+        return None
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        stats.record(kind, elapsed, f"http_{response.status_code}")
+        return None
+    try:
+        body = response.json()
+    except ValueError:
+        stats.record(kind, elapsed, "invalid_json")
+        return None
+    stats.record(kind, elapsed, "error_body" if isinstance(body, dict) and "error" in body else None)
+    return body
+
+async def poll_summary(client, stats, session_id, interval, stop):
+    """GET the session summary every interval seconds until stop is set"""
+    while True:
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        await timed_request(client, stats, "summary", "GET", f"/session/{session_id}/summary")
+
+async def run_trainee(index, client, stats, config, frames):
+    """One trainee's session: start, stream frames with summary polls, end"""
+    exercise = config["exercises"][index % len(config["exercises"])]
+    await asyncio.sleep(config["ramp_up"] * index / max(config["trainees"], 1))
+
+    session = await timed_request(client, stats, "start", "POST", "/session/start",
+                                  json={"user_id": f"load-test-{index}", "exercise_type": exercise})
+    if not session or "session_id" not in session:
+        return
+    session_id = session["session_id"]
+    stats.sessions_started += 1
+    stats.active_trainees += 1
+
+    stop = asyncio.Event()
+    poller = asyncio.create_task(
+        poll_summary(client, stats, session_id, config["summary_interval"], stop))
+    try:
+        interval = 1.0 / config["fps"]
+        started = time.monotonic()
+        frame_number = 0
+        url = f"/landmarks/{exercise}"
+        params = {"session_id": session_id}
+        frame_cycle = itertools.cycle(frames[exercise][index % len(frames[exercise])])
+        while True:
+            now = time.monotonic()
+            if now - started >= config["duration"]:
+                break
+            due = int((now - started) / interval)
+            if due > frame_number:
+                # Send times that passed while the last request was in flight
+                skipped = due - frame_number
+                stats.frames_dropped += skipped
+                for _ in range(skipped):
+                    next(frame_cycle)
+                frame_number = due
+            else:
+                await asyncio.sleep(started + frame_number * interval - now)
+            await timed_request(client, stats, "landmarks", "POST", url,
+                                params=params, json={"landmarks": next(frame_cycle)})
+            stats.frames_sent += 1
+            frame_number += 1
+    finally:
+        stop.set()
+        await poller
+        stats.active_trainees -= 1
+
+    await timed_request(client, stats, "end", "POST", f"/session/{session_id}/end")
+    stats.sessions_ended += 1
+
+async def sample_timeline(stats, config, rss_pid, timeline, stop):
+    """Append one timeline point per sample interval until stop is set"""
+    started = last = time.monotonic()
+    while True:
+        try:
+            await asyncio.wait_for(stop.wait(), config["sample_interval"])
+        except asyncio.TimeoutError:
+            pass
+        now = time.monotonic()
+        window, errors = stats.take_window()
+        point = {
+            "elapsed_seconds": round(now - started, 3),
+            "active_trainees": stats.active_trainees,
+            "frames_per_second": len(window) / (now - last) if now > last else 0.0,
+            "error_rate": errors / len(window) if window else 0.0,
+            "rss_bytes": read_rss(rss_pid)
+        }
+        if window:
+            p50, p99 = np.percentile(window, (50, 99)) * 1000.0
+            point["latency_ms_p50"] = float(p50)
+            point["latency_ms_p99"] = float(p99)
+        timeline.append(point)
+        last = now
+        if stop.is_set():
+            return
+
+def build_frames(config):
+    """Landmark lists per exercise, one synthetic sequence per variant"""
+    frames = {}
+    for exercise in set(config["exercises"]):
+        frames[exercise] = [
+            to_landmark_lists(generate_sequence(
+                exercise, config["frames_per_rep"] * 10, config["frames_per_rep"],
+                config["noise"], config["dropout"], seed=config["seed"] + variant
+            ))
+            for variant in range(min(config["variants"], config["trainees"]))
+        ]
+    return frames
+
+async def run_load(config, base_url=None, transport=None, rss_pid=None):
+    """
+    Run the simulated trainees and return the results document.
+
+    Args:
+        config: Dict of load test settings (see parse_args)
+        base_url: URL of the server (None for the in-process app)
+        transport: httpx transport to use instead of the network
+        rss_pid: Process whose memory is sampled (None for this process)
+    """
+    frames = build_frames(config)
+    stats = LoadStats()
+    timeline = []
+    limits = httpx.Limits(max_connections=config["trainees"] * 2,
+                          max_keepalive_connections=config["trainees"] * 2)
+    async with httpx.AsyncClient(base_url=base_url or "http://regenix", transport=transport,
+                                 limits=limits, timeout=config["timeout"]) as client:
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_timeline(stats, config, rss_pid, timeline, stop))
+        rss_before = read_rss(rss_pid)
+        started = time.monotonic()
+        await asyncio.gather(*(
+            run_trainee(index, client, stats, config, frames) for index in range(config["trainees"])
+        ))
+        elapsed = time.monotonic() - started
+        stop.set()
+        await sampler
+
+    requests = {}
+    for kind in REQUEST_KINDS:
+        latencies = stats.latencies[kind]
+        errors = sum(stats.errors[kind].values())
+        requests[kind] = {
+            "count": len(latencies),
+            "errors": stats.errors[kind],
+            "error_rate": errors / len(latencies) if latencies else 0.0,
+            "latency_ms": distribution(np.asarray(latencies) * 1000.0) if latencies else None
+        }
+    rss_values = [point["rss_bytes"] for point in timeline if point["rss_bytes"] is not None]
+    frames_expected = stats.frames_sent + stats.frames_dropped
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "benchmark": "load_test",
+        "created": datetime.now().isoformat(),
+        "environment": environment(),
+        "target": base_url or "in-process",
+        "config": config,
+        "elapsed_seconds": elapsed,
+        "sessions_started": stats.sessions_started,
+        "sessions_ended": stats.sessions_ended,
+        "frames_sent": stats.frames_sent,
+        "frames_dropped": stats.frames_dropped,
+        "frame_delivery": stats.frames_sent / frames_expected if frames_expected else 0.0,
+        "throughput_rps": sum(len(values) for values in stats.latencies.values()) / elapsed,
+        "frames_per_second": stats.frames_sent / elapsed,
+        "requests": requests,
+        "rss_bytes": {
+            "start": rss_before,
+            "peak": max(rss_values) if rss_values else None,
+            "end": rss_values[-1] if rss_values else None
+        },
+        "timeline": timeline
+    }
+
+def format_summary(results):
+    """Human-readable table of the results"""
+    lines = [
+        f"target {results['target']}: {results['config']['trainees']} trainees, "
+        f"{results['elapsed_seconds']:.1f} s, {results['throughput_rps']:.0f} req/s, "
+        f"{results['frames_per_second']:.0f} frames/s "
+        f"({results['frame_delivery']:.1%} of frames delivered)",
+        f"{'request':<10} {'count':>8} {'errors':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    ]
+    for kind, result in results["requests"].items():
+        latency = result["latency_ms"]
+        if latency is None:
+            lines.append(f"{kind:<10} {0:>8}")
+            continue
+        lines.append(
+            f"{kind:<10} {result['count']:>8} {result['error_rate']:>8.2%} {latency['p50']:>9.2f} "
+            f"{latency['p90']:>9.2f} {latency['p99']:>9.2f} {latency['max']:>9.2f}"
+        )
+    rss = results["rss_bytes"]
+    if rss["start"] is not None and rss["peak"] is not None:
+        lines.append(f"RSS {rss['start'] / 2**20:.1f} MiB at start, {rss['peak'] / 2**20:.1f} MiB peak, "
+                     f"{rss['end'] / 2**20:.1f} MiB at end")
+    return "\n".join(lines)
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _wait_until_up(base_url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            try:
+                if (await client.get("/status")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start in time")
+
+async def run(config, url=None, spawn=False, server_pid=None):
+    """Run the load test against the configured target"""
+    if spawn:
+        port = _free_port()
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", backend_dir,
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            await _wait_until_up(base_url, process)
+            return await run_load(config, base_url=base_url, rss_pid=process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+    if url:
+        return await run_load(config, base_url=url, rss_pid=server_pid)
+
+    from main import app
+    return await run_load(config, transport=httpx.ASGITransport(app=app))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load_test",
+        description="Simulate concurrent trainees streaming frames to the API"
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="URL of a running server (default: the app in process)")
+    target.add_argument("--spawn", action="store_true", help="start a local uvicorn for the run")
+    parser.add_argument("--server-pid", type=int, help="process whose RSS is sampled with --url")
+    parser.add_argument("--trainees", type=int, default=10, help="concurrent simulated trainees")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds each trainee streams")
+    parser.add_argument("--ramp-up", type=float, default=5.0,
+                        help="seconds over which the trainees' starts are spread")
+    parser.add_argument("--fps", type=float, default=30.0, help="frames per second per trainee")
+    parser.add_argument("--summary-interval", type=float, default=5.0,
+                        help="seconds between summary polls per trainee")
+    parser.add_argument("--sample-interval", type=float, default=1.0,
+                        help="seconds between timeline points")
+    parser.add_argument("--exercises", nargs="+", choices=EXERCISES, default=list(EXERCISES),
+                        help="exercises assigned to the trainees in turn")
+    parser.add_argument("--frames-per-rep", type=int, default=60)
+    parser.add_argument("--variants", type=int, default=4,
+                        help="distinct synthetic sequences per exercise")
+    parser.add_argument("--noise", type=float, default=0.003, help="x/y jitter standard deviation")
+    parser.add_argument("--dropout", type=float, default=0.0, help="probability of a missing landmark")
+    parser.add_argument("--timeout", type=float, default=10.0, help="request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file (default: stdout)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {key: value for key, value in vars(args).items()
+              if key not in ("output", "url", "spawn", "server_pid")}
+
+    results = asyncio.run(run(config, args.url, args.spawn, args.server_pid))
+    print(format_summary(results), file=sys.stderr)
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
+
+if __name__ == "__main__":
+    main()
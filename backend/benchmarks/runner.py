@@ -0,0 +1,226 @@
+"""
+Benchmark Runner
+----------------
+Times process_landmarks of every exercise module on synthetic sequences
+(see synthetic) and writes the results as JSON.
+
+For each exercise the sequence is fed frame by frame, as the API receives
+it (landmark dict lists), after a warm-up. Every call is timed with
+perf_counter_ns; the latency distribution covers all frames of all passes.
+A separate pass runs under tracemalloc to measure the memory allocated per
+frame (the peak above the memory in use before the call) and the memory
+the run retains, since tracing slows every allocation down.
+
+Usage (from the backend directory):
+    python -m benchmarks --output results.json
+    python -m benchmarks --exercises squats lunges --noise 0.005 --dropout 0.01
+    python -m benchmarks.compare baseline.json results.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic import EXERCISES, generate_sequence, to_landmark_lists
+from geometry import NUMBA_AVAILABLE, resolve_geometry_backend
+from state import exercise_state
+
+RESULTS_FORMAT_VERSION = 1
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+def distribution(values):
+    """Summary statistics of a list of numbers"""
+    values = np.asarray(values, dtype=np.float64)
+    stats = {
+        "mean": float(values.mean()),
+        "stdev": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f"p{percentile:g}"] = float(value)
+    return stats
+
+def rep_count(result):
+    """Rep counter of a module's result (the modules name it differently)"""
+    return result.get("counter", result.get("repCount"))
+
+def run_frames(process, frames, tolerance):
+    """
+    Feed frames to a process_landmarks function from a fresh exercise state.
+
+    Returns:
+        Per-frame latencies (microseconds) and the last result without an error
+    """
+    exercise_state.discard_session(None)
+    latencies = []
+    last_result = {}
+    clock = time.perf_counter_ns
+    for landmarks in frames:
+        started = clock()
+        result = process(landmarks, tolerance, None)
+        latencies.append((clock() - started) / 1000.0)
+        if "error" not in result:
+            last_result = result
+    return latencies, last_result
+
+def measure_allocations(process, frames, tolerance):
+    """
+    Memory allocated by process_landmarks, traced with tracemalloc.
+
+    Returns:
+        Dict with the distribution of the peak bytes allocated per frame and
+        the bytes still held after the run
+    """
+    exercise_state.discard_session(None)
+    peaks = []
+    tracemalloc.start()
+    try:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        for landmarks in frames:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            process(landmarks, tolerance, None)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - start_memory
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes_per_frame": distribution(peaks),
+        "retained_bytes": retained
+    }
+
+def benchmark_exercise(exercise, config):
+    """
+    Benchmark one exercise module.
+
+    Args:
+        exercise: Exercise name
+        config: Dict of benchmark settings (see parse_args)
+
+    Returns:
+        Dict of results for the exercise
+    """
+    module = importlib.import_module(exercise)
+    process = module.process_landmarks
+    array = generate_sequence(
+        exercise, config["frames"], config["frames_per_rep"], config["noise"], config["dropout"],
+        config["visibility_loss"], config["range_of_motion"], config["seed"]
+    )
+    frames = to_landmark_lists(array)
+
+    run_frames(process, frames[:config["warmup"]], config["tolerance"])
+    latencies = []
+    for _ in range(config["repeat"]):
+        pass_latencies, last_result = run_frames(process, frames, config["tolerance"])
+        latencies.extend(pass_latencies)
+
+    results = {
+        "frames": len(frames),
+        "passes": config["repeat"],
+        "reps_generated": len(frames) // config["frames_per_rep"],
+        "reps_detected": rep_count(last_result),
+        "missing_landmark_frames": int(np.isnan(array[..., 0]).any(axis=1).sum()),
+        "latency_us": distribution(latencies),
+        "frames_per_second": 1e6 / float(np.mean(latencies)),
+    }
+    if config["allocations"]:
+        results["allocations"] = measure_allocations(process, frames, config["tolerance"])
+    exercise_state.discard_session(None)
+    return results
+
+def git_commit():
+    """Commit of the working tree, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def environment():
+    """Description of the machine and software the benchmark ran on"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "numba_available": NUMBA_AVAILABLE,
+        "geometry_backend": resolve_geometry_backend(1),
+        "git_commit": git_commit()
+    }
+
+def run_benchmarks(config):
+    """Benchmark every configured exercise and return the full results document"""
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "benchmark": "process_landmarks",
+        "created": datetime.now().isoformat(),
+        "environment": environment(),
+        "config": config,
+        "exercises": {exercise: benchmark_exercise(exercise, config) for exercise in config["exercises"]}
+    }
+
+def format_summary(results):
+    """Human-readable table of the results"""
+    lines = [f"{'exercise':<12} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9} {'max us':>9} "
+             f"{'fps':>9} {'peak KiB':>9} {'reps':>7}"]
+    for exercise, result in results["exercises"].items():
+        latency = result["latency_us"]
+        peak = result.get("allocations", {}).get("peak_bytes_per_frame", {}).get("p50")
+        lines.append(
+            f"{exercise:<12} {latency['p50']:>9.1f} {latency['p90']:>9.1f} {latency['p99']:>9.1f} "
+            f"{latency['max']:>9.1f} {result['frames_per_second']:>9.0f} "
+            f"{peak / 1024 if peak is not None else float('nan'):>9.1f} "
+            f"{result['reps_detected'] or 0:>3}/{result['reps_generated']:<3}"
+        )
+    return "\n".join(lines)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the exercise modules on synthetic landmark sequences"
+    )
+    parser.add_argument("--exercises", nargs="+", choices=EXERCISES, default=list(EXERCISES))
+    parser.add_argument("--frames", type=int, default=600, help="frames per sequence")
+    parser.add_argument("--frames-per-rep", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the sequence")
+    parser.add_argument("--warmup", type=int, default=120, help="untimed frames before the passes")
+    parser.add_argument("--noise", type=float, default=0.003, help="x/y jitter standard deviation")
+    parser.add_argument("--dropout", type=float, default=0.0, help="probability of a missing landmark")
+    parser.add_argument("--visibility-loss", type=float, default=0.0,
+                        help="probability of a frame with a poorly tracked limb")
+    parser.add_argument("--range-of-motion", type=float, default=None,
+                        help="stretch of the reference curves (default: per exercise)")
+    parser.add_argument("--tolerance", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-allocations", dest="allocations", action="store_false",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write the JSON results to this file (default: stdout)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = args.output
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+
+    results = run_benchmarks(config)
+    print(format_summary(results), file=sys.stderr)
+    document = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
@@ -0,0 +1,273 @@
+"""
+Synthetic Landmark Sequences
+----------------------------
+Realistic 33-landmark frame sequences for every exercise, for benchmarks.
+
+Each rep sweeps the exercise's progress from 0 to 1 and back (a raised
+cosine over frames_per_rep frames), and the joint angles of every frame are
+the REFERENCE_ANGLES curves at that progress (reference_poses.
+calculate_reference_angles). The skeleton is posed from those angles by
+forward kinematics with the segment lengths of T_POSE_REFERENCE, in a side
+view for the leg and floor exercises and a front view for bicep curls, so
+the angles the exercise modules measure follow the reference curves.
+
+Some reference curves stop short of the angle at which their exercise
+module counts a rep (e.g. squats reach 90 degrees at the knee, the squat
+counter needs 85), so by default every curve is stretched away from its
+start angle by the exercise's RANGE_OF_MOTION, deep enough for the reps to
+be counted like real ones.
+
+Measurement noise, landmark dropout and visibility loss are added on top:
+
+- noise: standard deviation of the Gaussian jitter of x and y
+- dropout: probability that a landmark is missing from a frame
+- visibility_loss: probability that a frame has one poorly tracked limb,
+  with low visibility and five times the jitter
+"""
+import numpy as np
+
+from reference_poses import (
+    REFERENCE_ANGLES, T_POSE_REFERENCE, LANDMARK_INDICES, calculate_reference_angles
+)
+
+EXERCISES = ("squats", "deadlifts", "lunges", "pushups", "situps", "bicep_curls")
+
+NUM_LANDMARKS = 33
+
+# Default stretch of the reference curves, so reps reach the counting thresholds
+RANGE_OF_MOTION = {
+    "squats": 1.15,
+    "deadlifts": 1.0,
+    "lunges": 1.2,
+    "pushups": 1.7,
+    "situps": 1.0,
+    "bicep_curls": 1.0,
+}
+
+# Segment lengths of the reference skeleton
+def _distance(a, b):
+    return float(np.hypot(*np.subtract(T_POSE_REFERENCE[a], T_POSE_REFERENCE[b])))
+
+SHIN = _distance("left_knee", "left_ankle")
+THIGH = _distance("left_hip", "left_knee")
+TORSO = _distance("left_shoulder", "left_hip")
+UPPER_ARM = _distance("left_shoulder", "left_elbow")
+FOREARM = _distance("left_elbow", "left_wrist")
+HEAD = _distance("nose", "left_shoulder") * 0.6
+
+# Floor level in side views
+FLOOR_Y = 0.9
+
+# Horizontal offset between the left and right side in side views
+SIDE_OFFSET = 0.02
+
+# Landmarks that follow a posed point: face points the nose, hand points
+# the wrists, foot points the ankles (with a small offset)
+DERIVED_LANDMARKS = {
+    **{index: ("nose", (0.01 * (1 if index > 4 else -1), -0.02)) for index in range(1, 11)},
+    17: ("left_wrist", (-0.01, 0.02)), 19: ("left_wrist", (0.0, 0.03)), 21: ("left_wrist", (0.01, 0.02)),
+    18: ("right_wrist", (0.01, 0.02)), 20: ("right_wrist", (0.0, 0.03)), 22: ("right_wrist", (-0.01, 0.02)),
+    29: ("left_ankle", (-0.02, 0.02)), 31: ("left_ankle", (0.04, 0.02)),
+    30: ("right_ankle", (-0.02, 0.02)), 32: ("right_ankle", (0.04, 0.02)),
+}
+
+# Landmark groups that can lose visibility together
+LIMBS = (
+    (11, 13, 15, 17, 19, 21),
+    (12, 14, 16, 18, 20, 22),
+    (23, 25, 27, 29, 31),
+    (24, 26, 28, 30, 32),
+)
+
+def _step(point, direction, length):
+    """Point at length from point in the given image direction (degrees, y down)"""
+    radians = np.radians(direction)
+    return np.stack([point[..., 0] + length * np.cos(radians),
+                     point[..., 1] + length * np.sin(radians)], axis=-1)
+
+def _fixed(point, count):
+    return np.tile(np.asarray(point, dtype=np.float64), (count, 1))
+
+def _leg_from_ankle(ankle, knee_angle, hip_angle):
+    """
+    Knee, hip and shoulder of a side-view leg standing on its ankle, facing
+    +x, with the given interior knee and hip angles.
+
+    Returns:
+        knee, hip, shoulder, and the hip to shoulder direction
+    """
+    # The shin tilts forward as the knee bends
+    shin_tilt = (180 - knee_angle) * 0.4
+    knee_to_ankle = 90 + shin_tilt
+    knee = _step(ankle, knee_to_ankle - 180, SHIN)
+    knee_to_hip = knee_to_ankle + knee_angle
+    hip = _step(knee, knee_to_hip, THIGH)
+    hip_to_shoulder = knee_to_hip - 180 - hip_angle
+    shoulder = _step(hip, hip_to_shoulder, TORSO)
+    return knee, hip, shoulder, hip_to_shoulder
+
+def _hanging_arm(shoulder, elbow_angle, side):
+    """Elbow and wrist of an arm hanging from the shoulder"""
+    elbow = _step(shoulder, 90, UPPER_ARM)
+    wrist = _step(elbow, -90 + side * elbow_angle, FOREARM)
+    return elbow, wrist
+
+def _pose_side_view(points, left, right=None):
+    """Store one (or two) side-view body chains as left and right landmarks"""
+    right = left if right is None else right
+    for name, values in left.items():
+        points[f"left_{name}"] = values - [SIDE_OFFSET, 0]
+    for name, values in right.items():
+        points[f"right_{name}"] = values + [SIDE_OFFSET, 0]
+
+def _pose(exercise, angles, count):
+    """
+    Skeleton points of every frame.
+
+    Args:
+        exercise: Exercise name
+        angles: Dict of joint -> array of reference angles per frame
+        count: Number of frames
+
+    Returns:
+        Dict of landmark name -> (count, 2) array
+    """
+    points = {}
+    if exercise in ("squats", "deadlifts"):
+        ankle = _fixed([0.5, FLOOR_Y], count)
+        knee, hip, shoulder, torso_direction = _leg_from_ankle(ankle, angles["knee"], angles["hip"])
+        # Arms hang straight down (holding the bar in deadlifts)
+        elbow = _step(shoulder, 90, UPPER_ARM)
+        wrist = _step(elbow, 90, FOREARM)
+        _pose_side_view(points, {"ankle": ankle, "knee": knee, "hip": hip, "shoulder": shoulder,
+                                 "elbow": elbow, "wrist": wrist})
+        points["nose"] = _step(shoulder, torso_direction, HEAD)
+
+    elif exercise == "lunges":
+        # Front leg (left) carries the body; the torso stays upright
+        front_ankle = _fixed([0.62, FLOOR_Y], count)
+        front_knee, hip, _, _ = _leg_from_ankle(front_ankle, angles["front_knee"], 180)
+        shoulder = _step(hip, -90, TORSO)
+        # Rear leg (right) reaches back from the hip
+        rear_thigh = 90 + (180 - angles["rear_knee"]) * 0.5 + 10
+        rear_knee = _step(hip, rear_thigh, THIGH)
+        rear_ankle = _step(rear_knee, rear_thigh - 180 + angles["rear_knee"], SHIN)
+        elbow = _step(shoulder, 90, UPPER_ARM)
+        wrist = _step(elbow, 90, FOREARM)
+        upper = {"hip": hip, "shoulder": shoulder, "elbow": elbow, "wrist": wrist}
+        _pose_side_view(points, {**upper, "knee": front_knee, "ankle": front_ankle},
+                        {**upper, "knee": rear_knee, "ankle": rear_ankle})
+        points["nose"] = _step(shoulder, -90, HEAD)
+
+    elif exercise == "pushups":
+        # Hands on the floor under the shoulders, body straight to the feet
+        wrist = _fixed([0.6, FLOOR_Y], count)
+        elbow = _step(wrist, -90, FOREARM)
+        shoulder = _step(elbow, -90 + (180 - angles["elbow"]), UPPER_ARM)
+        tilt = np.degrees(np.arcsin(np.clip((FLOOR_Y - shoulder[:, 1]) / (TORSO + THIGH + SHIN), -1, 1)))
+        body_direction = 180 - tilt
+        hip = _step(shoulder, body_direction, TORSO)
+        knee = _step(hip, body_direction, THIGH)
+        ankle = _step(knee, body_direction, SHIN)
+        _pose_side_view(points, {"wrist": wrist, "elbow": elbow, "shoulder": shoulder,
+                                 "hip": hip, "knee": knee, "ankle": ankle})
+        points["nose"] = _step(shoulder, body_direction - 180, HEAD)
+
+    elif exercise == "situps":
+        # Lying on the back with the hips on the floor, curling the torso up
+        hip = _fixed([0.45, FLOOR_Y - 0.05], count)
+        hip_to_knee = -10
+        knee = _step(hip, np.full(count, hip_to_knee), THIGH)
+        ankle = _step(knee, np.full(count, hip_to_knee + 180 - 100), SHIN)
+        torso_direction = hip_to_knee - angles["hip"]
+        shoulder = _step(hip, torso_direction, TORSO)
+        # Hands on the chest
+        elbow = _step(shoulder, torso_direction + 150, UPPER_ARM * 0.8)
+        wrist = _step(elbow, torso_direction, FOREARM * 0.8)
+        _pose_side_view(points, {"hip": hip, "knee": knee, "ankle": ankle, "shoulder": shoulder,
+                                 "elbow": elbow, "wrist": wrist})
+        points["nose"] = _step(shoulder, torso_direction, HEAD)
+
+    elif exercise == "bicep_curls":
+        # Front view, standing in the reference pose with the arms curling
+        for name in ("nose", "left_shoulder", "right_shoulder", "left_hip", "right_hip",
+                     "left_knee", "right_knee", "left_ankle", "right_ankle"):
+            points[name] = _fixed(T_POSE_REFERENCE[name], count)
+        for side, sign in (("left", 1), ("right", -1)):
+            elbow, wrist = _hanging_arm(points[f"{side}_shoulder"], angles["elbow"], sign)
+            points[f"{side}_elbow"] = elbow
+            points[f"{side}_wrist"] = wrist
+
+    else:
+        raise ValueError(f"Unknown exercise: {exercise}")
+    return points
+
+def rep_progress(frame_count, frames_per_rep=60):
+    """Exercise progress of each frame: 0 -> 1 -> 0 once per rep"""
+    phase = np.arange(frame_count) / frames_per_rep
+    return (1 - np.cos(2 * np.pi * phase)) / 2
+
+def generate_sequence(exercise, frame_count=600, frames_per_rep=60, noise=0.0, dropout=0.0,
+                      visibility_loss=0.0, range_of_motion=None, seed=0):
+    """
+    Generate a landmark sequence for an exercise.
+
+    Args:
+        exercise: Exercise name (one of EXERCISES)
+        frame_count: Number of frames
+        frames_per_rep: Frames per rep (60 is a 2 second rep at 30 fps)
+        noise: Standard deviation of the x/y jitter
+        dropout: Probability that a landmark is missing
+        visibility_loss: Probability that a frame has a poorly tracked limb
+        range_of_motion: Stretch of the reference curves (1.0 follows them
+            exactly), RANGE_OF_MOTION[exercise] by default
+        seed: Random seed
+
+    Returns:
+        Array of shape (frame_count, 33, 4) as from geometry.frames_to_array,
+        with missing landmarks as NaN rows
+    """
+    rng = np.random.default_rng(seed)
+    progress = rep_progress(frame_count, frames_per_rep)
+    if range_of_motion is None:
+        range_of_motion = RANGE_OF_MOTION[exercise]
+    angles = {
+        joint: start_angle + (angle - start_angle) * range_of_motion
+        for (joint, angle), (start_angle, _, _) in zip(
+            calculate_reference_angles(exercise, progress).items(), REFERENCE_ANGLES[exercise].values()
+        )
+    }
+    points = _pose(exercise, angles, frame_count)
+
+    frames = np.zeros((frame_count, NUM_LANDMARKS, 4))
+    for name, values in points.items():
+        frames[:, LANDMARK_INDICES[name], :2] = values
+    for index, (name, offset) in DERIVED_LANDMARKS.items():
+        frames[:, index, :2] = points[name] + offset
+    frames[..., 3] = rng.uniform(0.9, 1.0, (frame_count, NUM_LANDMARKS))
+
+    jitter = np.full((frame_count, NUM_LANDMARKS), float(noise))
+    if visibility_loss:
+        lost_frames = np.flatnonzero(rng.random(frame_count) < visibility_loss)
+        for frame, limb in zip(lost_frames, rng.integers(len(LIMBS), size=len(lost_frames))):
+            indices = list(LIMBS[limb])
+            frames[frame, indices, 3] = rng.uniform(0.05, 0.4, len(indices))
+            jitter[frame, indices] = 5 * max(noise, 0.002)
+    if jitter.any():
+        frames[..., :2] += rng.normal(size=(frame_count, NUM_LANDMARKS, 2)) * jitter[..., None]
+    if dropout:
+        frames[rng.random((frame_count, NUM_LANDMARKS)) < dropout] = np.nan
+    return frames
+
+def to_landmark_lists(frames):
+    """
+    Convert a frame array into the landmark dict lists the API receives
+    (missing landmarks become None).
+    """
+    return [
+        [
+            None if row[0] != row[0] else {"x": row[0], "y": row[1], "z": row[2], "visibility": row[3]}
+            for row in frame
+        ]
+        for frame in frames.tolist()
+    ]
@@ -1,17 +1,8 @@
 import numpy as np
 from state import exercise_state
 from feedback_config import BICEP_CURL_CONFIG, FEEDBACK_TO_JOINTS, JOINT_INDEX_MAP
-
-def calculate_angle(a, b, c):
-    """
-    Calculate the angle (in degrees) at point b given three points a, b, and c.
-    """
-    a, b, c = np.array(a), np.array(b), np.array(c)
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
+from geometry import landmarks_to_array, extract_features
+from metrics import NULL_STAGE_TIMER
 
 def detect_shoulder_movement(current_shoulder, previous_shoulder):
     """
@@ -38,41 +29,57 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
     Returns:
         Dictionary with processing results and feedback
     """
-    elbow_angles = []
-    shoulder_positions = []
-    
-    # Calculate left arm angle and get shoulder position
-    try:
-        left_shoulder = [landmarks[11]['x'], landmarks[11]['y']]
-        left_elbow = [landmarks[13]['x'], landmarks[13]['y']]
-        left_wrist = [landmarks[15]['x'], landmarks[15]['y']]
-        
-        left_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-        elbow_angles.append(left_angle)
-        shoulder_positions.append(left_shoulder)
-    except KeyError:
-        pass
+    return process_landmarks_batch(landmarks_to_array(landmarks)[None], tolerance, session_id)[0]
 
-    # Calculate right arm angle and get shoulder position
-    try:
-        right_shoulder = [landmarks[12]['x'], landmarks[12]['y']]
-        right_elbow = [landmarks[14]['x'], landmarks[14]['y']]
-        right_wrist = [landmarks[16]['x'], landmarks[16]['y']]
+def process_landmarks_batch(frames, tolerance=0.0, session_id=None, frame_times=None, timer=None):
+    """
+    Process an ordered batch of frames for bicep curl form analysis.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4) from geometry.frames_to_array
+        tolerance: Tolerance threshold
+        session_id: Optional session ID for logging
+        frame_times: Optional per-frame timestamps (unused for bicep curls)
+        timer: Optional metrics.StageTimer the processing stages are charged to
         
-        right_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-        elbow_angles.append(right_angle)
-        shoulder_positions.append(right_shoulder)
-    except KeyError:
-        pass
-
-    if not elbow_angles:
-        return {"error": "Insufficient landmarks data."}
+    Returns:
+        List with the processing result of every frame, in order
+    """
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    
+    features = extract_features(frames)
+    
+    # Elbow angle and shoulder x, y of each arm
+    measurements = np.concatenate([features.elbow_angles[..., None], features.shoulders], axis=-1)
+    valid_sides = np.isfinite(measurements).all(axis=-1)
+    
+    timer.mark("geometry")
+    
+    results = []
+    # Frames of one session are evaluated in order, one request at a time
+    with exercise_state.lock(session_id):
+        for frame_sides, valid in zip(measurements.tolist(), valid_sides):
+            sides = [side for side, is_valid in zip(frame_sides, valid) if is_valid]
+            if not sides:
+                results.append({"error": "Insufficient landmarks data."})
+                continue
+            
+            elbow_angles = [side[0] for side in sides]
+            shoulder_positions = [side[1:] for side in sides]
+            results.append(_evaluate_frame(elbow_angles, shoulder_positions, session_id, timer))
+    
+    return results
 
+def _evaluate_frame(elbow_angles, shoulder_positions, session_id, timer):
+    """
+    Run rep counting, feedback and scoring for one frame of bicep curl measurements
+    """
     # Average the elbow angles
     avg_elbow_angle = sum(elbow_angles) / len(elbow_angles)
     
     # Retrieve the current state for bicep_curls
-    state = exercise_state.get("bicep_curls", {
+    state = exercise_state.get((session_id, "bicep_curls"), {
         "repCount": 0,
         "stage": "down",
         "feedback": "N/A",
@@ -98,6 +105,8 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
         stage = "up"
         counter += 1
 
+    timer.mark("state_machine")
+    
     # Generate detailed feedback
     feedback_flags = []
     
@@ -131,6 +140,7 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
 
     # Log the rep if it's a new rep and session_id exists
     if counter > prev_counter and session_id:
+        timer.mark("feedback")
         try:
             from session_state import record_rep
             metrics = {
@@ -141,6 +151,7 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
         except ImportError:
             # Session state module not available, continue without logging
             pass
+        timer.mark("record_rep")
 
     # For now, simple scoring without advanced computation
     rep_score = 100 if "GOOD_CURL" in feedback_flags else 70
@@ -191,5 +202,6 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
         "affected_segments": affected_segments
     }
     
-    exercise_state["bicep_curls"] = new_state
+    timer.mark("feedback")
+    exercise_state[(session_id, "bicep_curls")] = new_state
     return new_state
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Calibration Store
+-----------------
+Reference skeleton calibrations by calibration_id.
+
+Calibrations are kept in a bounded in-memory cache (at most
+CALIBRATION_CACHE_SIZE entries, dropped after CALIBRATION_TTL idle
+seconds) and, unless REGENIX_CALIBRATION_DIR is set to an empty string,
+written to one JSON file each in that directory. A lookup that misses the
+cache falls back to the file, so calibrations survive restarts and are
+shared by every worker using the same directory. A file's mtime marks the
+last use of its calibration (refreshed at most every TOUCH_INTERVAL
+seconds, also on cache hits), and files unused for CALIBRATION_RETENTION
+seconds are deleted.
+"""
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from ttl_cache import TTLCache
+
+CALIBRATION_CACHE_SIZE = int(os.environ.get("REGENIX_CALIBRATION_CACHE_SIZE", 1024))
+CALIBRATION_TTL = float(os.environ.get("REGENIX_CALIBRATION_TTL", 60 * 60))
+CALIBRATION_RETENTION = float(os.environ.get("REGENIX_CALIBRATION_RETENTION", 30 * 24 * 60 * 60))
+
+# Directory for persisted calibrations (None when persistence is off)
+CALIBRATION_DIR = os.environ.get("REGENIX_CALIBRATION_DIR", "calibrations")
+calibration_dir = Path(CALIBRATION_DIR) if CALIBRATION_DIR else None
+if calibration_dir is not None:
+    calibration_dir.mkdir(exist_ok=True)
+
+# Expired files are found by scanning the directory, at most this often
+PRUNE_INTERVAL = 60 * 60
+
+# A calibration in use has its file's mtime refreshed at most this often
+TOUCH_INTERVAL = min(60 * 60, CALIBRATION_RETENTION / 10)
+
+# calibration_id -> [calibration, time its file's mtime was last refreshed]
+calibrations = TTLCache(max_entries=CALIBRATION_CACHE_SIZE, ttl=CALIBRATION_TTL)
+last_prune = 0.0
+disk_loads = 0
+pruned_files = 0
+
+def calibration_path(calibration_id):
+    """
+    Path of a calibration's file, or None if calibration_id is not a UUID
+    (so that request input never becomes an arbitrary path).
+    """
+    try:
+        canonical = str(uuid.UUID(calibration_id))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if canonical != calibration_id:
+        return None
+    return calibration_dir / f"{calibration_id}.json"
+
+def save_calibration(calibration):
+    """
+    Store a new calibration.
+
+    Returns:
+        The calibration_id it is stored under
+    """
+    calibration_id = str(uuid.uuid4())
+    calibrations[calibration_id] = [calibration, time.time()]
+
+    if calibration_dir is not None:
+        path = calibration_path(calibration_id)
+        # Written under a temporary name and renamed, so other workers
+        # never read a partial file
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(calibration, f)
+        os.replace(temp_path, path)
+        prune_calibrations()
+    return calibration_id
+
+def get_calibration(calibration_id):
+    """
+    Look up a calibration, loading it from its file on a cache miss.
+
+    Every lookup counts as a use of the file (see touch_calibration).
+
+    Returns:
+        Calibration dict, or None if it is unknown or expired
+    """
+    global disk_loads
+    entry = calibrations.get(calibration_id)
+    if entry is not None:
+        touch_calibration(calibration_id, entry)
+        return entry[0]
+    if calibration_dir is None:
+        return None
+
+    path = calibration_path(calibration_id)
+    if path is None:
+        return None
+    try:
+        now = time.time()
+        if now - os.stat(path).st_mtime > CALIBRATION_RETENTION:
+            return None
+        with open(path, "r") as f:
+            calibration = json.load(f)
+        # The file's mtime marks its last use for retention
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+
+    disk_loads += 1
+    calibrations[calibration_id] = [calibration, now]
+    return calibration
+
+def touch_calibration(calibration_id, entry):
+    """
+    Refresh the mtime of a cached calibration's file if it was last
+    refreshed more than TOUCH_INTERVAL ago, so that prune_calibrations
+    never deletes a calibration that is still in use.
+    """
+    now = time.time()
+    if calibration_dir is None or now - entry[1] < TOUCH_INTERVAL:
+        return
+    entry[1] = now
+    try:
+        os.utime(calibration_path(calibration_id))
+    except OSError:
+        pass
+
+def prune_calibrations(force=False):
+    """
+    Delete calibration files not used within CALIBRATION_RETENTION
+    (at most once per PRUNE_INTERVAL unless forced).
+
+    Returns:
+        Number of files deleted
+    """
+    global last_prune, pruned_files
+    now = time.time()
+    if calibration_dir is None or (not force and now - last_prune < PRUNE_INTERVAL):
+        return 0
+    last_prune = now
+
+    deleted = 0
+    with os.scandir(calibration_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > CALIBRATION_RETENTION:
+                    os.remove(entry.path)
+                    deleted += 1
+            except OSError:
+                continue
+    pruned_files += deleted
+    return deleted
+
+def get_calibration_stats():
+    """Cache counters and persistence activity"""
+    return {
+        "cache": calibrations.stats(),
+        "persistent": calibration_dir is not None,
+        "retention_seconds": CALIBRATION_RETENTION,
+        "disk_loads": disk_loads,
+        "pruned_files": pruned_files
+    }
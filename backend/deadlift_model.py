@@ -0,0 +1,214 @@
+"""
+Deadlift Form Model
+-------------------
+Optional ML stage for deadlift frames backed by deadlift.pkl, a
+scikit-learn Pipeline (StandardScaler + RandomForestClassifier) trained on
+the 132 raw landmark values in landmarks.py column order (x1, y1, z1, v1,
+x2, ...) and predicting the movement stage ("down" / "up").
+
+The model is loaded once at import, preferably from deadlift_forest.npz:
+the forest compiled to NumPy arrays by forest_compiler, whose predictions
+are bit-for-bit those of the pickle without importing scikit-learn. The
+pickle is only unpickled when the compiled file is missing or was compiled
+from a different deadlift.pkl; after retraining, recompile with
+
+    python deadlift_model.py
+
+Feature rows are taken straight from the (frames, 33, 4) landmark array,
+and predictions for concurrent requests are coalesced into shared
+predict_proba calls: request handlers await classify_frames_async
+(AsyncMicroBatcher, which waits up to REGENIX_MODEL_MAX_WAIT_MS for a
+batch to fill).
+
+If neither the compiled forest nor the pickle can be loaded, or the stage
+is disabled with REGENIX_DEADLIFT_MODEL=0, classify_frames_async returns
+None and deadlift analysis stays purely rule-based.
+"""
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from geometry import NUM_LANDMARKS, LANDMARK_FIELDS
+from landmarks import landmarks as LANDMARK_COLUMNS
+from micro_batch import AsyncMicroBatcher
+from forest_compiler import compile_pipeline, CompiledForest, save_forest, load_forest, file_sha256, probe_rows
+
+MODEL_PATH = Path(__file__).with_name("deadlift.pkl")
+COMPILED_MODEL_PATH = Path(__file__).with_name("deadlift_forest.npz")
+MODEL_ENABLED = os.environ.get("REGENIX_DEADLIFT_MODEL", "1") != "0"
+
+# Batching limits: frames per predict_proba call, longest wait for a batch
+# to fill, and frames allowed to queue before new requests skip the model
+MAX_BATCH_FRAMES = int(os.environ.get("REGENIX_MODEL_MAX_BATCH", 256))
+MAX_WAIT_MS = float(os.environ.get("REGENIX_MODEL_MAX_WAIT_MS", 2.0))
+MAX_QUEUE_FRAMES = int(os.environ.get("REGENIX_MODEL_MAX_QUEUE", 1024))
+
+def landmark_column_order(columns):
+    """
+    Positions in a flattened (33, 4) frame of the given feature columns.
+
+    Column names are a landmark field initial followed by the 1-based
+    landmark number, as in landmarks.py.
+    """
+    field_initials = [field[0] for field in LANDMARK_FIELDS]
+    order = []
+    for column in columns:
+        landmark = int(column[1:]) - 1
+        if not 0 <= landmark < NUM_LANDMARKS:
+            raise ValueError(f"Unknown landmark column {column!r}")
+        order.append(landmark * len(LANDMARK_FIELDS) + field_initials.index(column[0]))
+    return np.array(order)
+
+def load_model(path=MODEL_PATH):
+    """
+    Load the deadlift pipeline and prepare it for row-array input.
+
+    Returns:
+        model: The fitted Pipeline
+        column_order: Flat frame positions of the model's features, or None
+            if they are already in frame order
+    """
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+
+    columns = list(getattr(model, "feature_names_in_", LANDMARK_COLUMNS))
+    column_order = landmark_column_order(columns)
+    if np.array_equal(column_order, np.arange(NUM_LANDMARKS * len(LANDMARK_FIELDS))):
+        column_order = None
+
+    # Rows are passed as arrays in the checked order; dropping the fitted
+    # names avoids a feature-name warning on every call
+    for _, step in model.steps:
+        if hasattr(step, "feature_names_in_"):
+            del step.feature_names_in_
+        if hasattr(step, "n_jobs"):
+            # Batches are small; a worker pool costs more than it saves
+            step.n_jobs = 1
+    return model, column_order
+
+def load_compiled_model(path=COMPILED_MODEL_PATH, source_path=MODEL_PATH):
+    """
+    Load the compiled forest, refusing one compiled from another pickle.
+
+    The check is skipped when the pickle is not deployed.
+
+    Returns:
+        model: CompiledForest reading rows in frame order
+        column_order: Always None
+    """
+    forest, metadata = load_forest(path)
+    if source_path.exists() and metadata.get("source_sha256") != file_sha256(source_path):
+        raise ValueError(f"{path.name} was not compiled from the current {source_path.name}")
+    return forest, None
+
+def compile_model(path=MODEL_PATH, output_path=COMPILED_MODEL_PATH):
+    """
+    Compile the pickled pipeline to output_path, after checking that the
+    compiled forest reproduces its probabilities exactly.
+
+    Rows in frame order are checked on both sides of every split threshold.
+    """
+    model, column_order = load_model(path)
+    arrays = compile_pipeline(model, column_order)
+    compiled = CompiledForest(arrays)
+
+    base = getattr(model.steps[0][1], "mean_", None)
+    if base is None:
+        base = np.zeros(compiled.n_features_in_)
+    rows = probe_rows(arrays, base[np.argsort(column_order)] if column_order is not None else base)
+    expected = model.predict_proba(rows if column_order is None else rows[:, column_order])
+    if not np.array_equal(compiled.predict_proba(rows), expected):
+        raise ValueError("Compiled forest does not reproduce the pipeline's probabilities")
+
+    save_forest(arrays, output_path, source_sha256=file_sha256(path))
+    return compiled
+
+def frames_to_features(frames, column_order=None):
+    """
+    Feature rows of shape (frames, 132) in the model's column order.
+
+    For frame-ordered columns this is a reshape, with no copy for
+    contiguous float64 input.
+    """
+    rows = np.asarray(frames, dtype=np.float64).reshape(len(frames), -1)
+    if column_order is not None:
+        rows = rows[:, column_order]
+    return rows
+
+try:
+    if MODEL_ENABLED:
+        try:
+            deadlift_model, feature_column_order = load_compiled_model()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Compiled deadlift model not available ({e}). Loading {MODEL_PATH.name}.")
+            deadlift_model, feature_column_order = load_model()
+        classes = [str(label) for label in deadlift_model.classes_]
+        scheduler = AsyncMicroBatcher(
+            deadlift_model.predict_proba, MAX_BATCH_FRAMES, MAX_WAIT_MS, MAX_QUEUE_FRAMES,
+            name="deadlift-model"
+        )
+    else:
+        deadlift_model = None
+except Exception as e:
+    print(f"Deadlift model not available ({e}). Rule-based analysis only.")
+    deadlift_model = None
+
+async def classify_frames_async(frames):
+    """
+    Classify the stage of each frame with the deadlift model; the rows join
+    the scheduler's next batch.
+
+    Args:
+        frames: Array of shape (frames, 33, 4)
+
+    Returns:
+        List with, per frame, {"stage", "confidence", "probabilities"} or
+        None for frames with missing landmarks; None if the model is not
+        available
+
+    Raises:
+        micro_batch.BatchQueueFull: The scheduler's queue is full
+    """
+    if deadlift_model is None:
+        return None
+    rows, valid = _feature_rows(frames)
+    if not valid.any():
+        return [None] * len(valid)
+    return _predictions(await scheduler.submit(rows[valid] if not valid.all() else rows), valid)
+
+def _feature_rows(frames):
+    """Feature rows and the mask of rows without missing values"""
+    rows = frames_to_features(frames, feature_column_order)
+    return rows, np.isfinite(rows).all(axis=1)
+
+def _predictions(probabilities, valid):
+    """Per-frame prediction dicts from the probabilities of the valid rows"""
+    predictions = [None] * len(valid)
+    best = probabilities.argmax(axis=1)
+    for index, frame_probabilities, label in zip(np.flatnonzero(valid), probabilities.tolist(), best):
+        predictions[index] = {
+            "stage": classes[label],
+            "confidence": frame_probabilities[label],
+            "probabilities": dict(zip(classes, frame_probabilities))
+        }
+    return predictions
+
+def attach_predictions(results, predictions):
+    """Add each frame's prediction to its analysis result (frames that were analyzed only)"""
+    if predictions is None:
+        return
+    for result, prediction in zip(results, predictions):
+        if prediction is not None and "error" not in result:
+            result["model_classification"] = prediction
+
+def get_model_stats():
+    """Batching counters of the deadlift model, or None if it is not loaded"""
+    if deadlift_model is None:
+        return None
+    return scheduler.stats()
+
+if __name__ == "__main__":
+    compile_model()
+    print(f"Wrote {COMPILED_MODEL_PATH}")
@@ -3,105 +3,71 @@ import time
 from state import exercise_state
 from feedback_config import DEADLIFT_CONFIG, DEADLIFT_METRICS, ADVANCED_FEEDBACK, FEEDBACK_TO_JOINTS
 from score_config import calculate_rep_score
-
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-         angle = 360 - angle
-    return angle
-
-def calculate_bar_path_deviation(shoulder, hip, knee, ankle):
-    """Calculate how far the bar (approximated at hip) deviates from mid-foot line"""
-    hip = np.array(hip)
-    ankle = np.array(ankle)
-    
-    # Ideal bar path should be straight down over mid-foot
-    midfoot_x = ankle[0]  # Assume midfoot is at same x as ankle
-    
-    # Calculate deviation as horizontal distance from hip to midfoot line
-    deviation = abs(hip[0] - midfoot_x)
-    
-    # Normalize by height (hip to ankle distance)
-    height = abs(hip[1] - ankle[1]) 
-    if height == 0:  # Avoid division by zero
-        return 0
-        
-    normalized_deviation = deviation / height
-    return normalized_deviation
+from geometry import landmarks_to_array, extract_features
+from metrics import NULL_STAGE_TIMER
 
 def process_landmarks(landmarks, tolerance=0.0, session_id=None):
     """
     Process landmarks for deadlift form analysis with enhanced feedback and advanced metrics
     """
-    back_angles = []
-    hip_angles = []
-    bar_path_deviations = []
-    lumbar_curvatures = []  # New metric
-    
-    # Record timestamp for tempo analysis
-    current_time = time.time()
-    
-    # Calculate back angle (neck to hips to knees)
-    try:
-        # Neck (upper back): use nose as a proxy if neck isn't reliable
-        neck = [landmarks[0]['x'], landmarks[0]['y']]  # Use nose as a reference point
-        
-        # Mid hip point for better center of mass representation
-        mid_hip = [(landmarks[23]['x'] + landmarks[24]['x'])/2, 
-                   (landmarks[23]['y'] + landmarks[24]['y'])/2]
-        
-        # Mid knee point
-        mid_knee = [(landmarks[25]['x'] + landmarks[26]['x'])/2, 
-                    (landmarks[25]['y'] + landmarks[26]['y'])/2]
-                    
-        # Mid ankle point
-        mid_ankle = [(landmarks[27]['x'] + landmarks[28]['x'])/2, 
-                    (landmarks[27]['y'] + landmarks[28]['y'])/2]
-        
-        # Mid shoulder
-        mid_shoulder = [(landmarks[11]['x'] + landmarks[12]['x'])/2,
-                        (landmarks[11]['y'] + landmarks[12]['y'])/2]
-        
-        # Back angle is the angle from neck through hips to knees
-        back_angle = calculate_angle(neck, mid_hip, mid_knee)
-        back_angles.append(back_angle)
-        
-        # Hip angle (shoulder-hip-knee) for hip hinge depth
-        hip_angle = calculate_angle(mid_shoulder, mid_hip, mid_knee)
-        hip_angles.append(hip_angle)
-        
-        # Calculate bar path deviation (new metric)
-        bar_deviation = calculate_bar_path_deviation(mid_shoulder, mid_hip, mid_knee, mid_ankle)
-        bar_path_deviations.append(bar_deviation)
-        
-        # Approximate lumbar curve by finding mid-point deviation (simplified)
-        # In a real implementation, you would use more spine points if available
-        mid_back_y = (neck[1] + mid_hip[1]) / 2
-        expected_mid_back_x = (neck[0] + mid_hip[0]) / 2
+    return process_landmarks_batch(landmarks_to_array(landmarks)[None], tolerance, session_id)[0]
+
+def process_landmarks_batch(frames, tolerance=0.0, session_id=None, frame_times=None, timer=None):
+    """
+    Process an ordered batch of frames for deadlift form analysis.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4) from geometry.frames_to_array
+        tolerance: Tolerance threshold
+        session_id: Optional session ID for logging
+        frame_times: Optional per-frame timestamps (seconds) for tempo analysis
+        timer: Optional metrics.StageTimer the processing stages are charged to
         
-        # Use a mid-back landmark if available, or approximate
-        if 7 in landmarks:  # If mid-back point is available
-            actual_mid_back = [landmarks[7]['x'], landmarks[7]['y']]
-        else:
-            # Approximate mid-back position
-            actual_mid_back = [expected_mid_back_x, mid_back_y]
+    Returns:
+        List with the processing result of every frame, in order
+    """
+    if frame_times is None:
+        frame_times = [time.time()] * len(frames)
+    
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    
+    features = extract_features(frames)
+    
+    # There is no mid-back landmark, so the mid-back is approximated on the
+    # neck-hip line, which leaves no measurable lumbar curvature
+    lumbar_curvatures = np.where(np.isfinite(features.back_angles), 0.0, np.nan)
+    
+    # Back angle (neck-hips-knees), hip angle (shoulders-hips-knees),
+    # bar path deviation and lumbar curvature
+    measurements = np.stack([
+        features.back_angles,
+        features.hip_hinge_angles,
+        features.bar_path_deviations,
+        lumbar_curvatures
+    ], axis=-1)
+    valid_frames = np.isfinite(measurements).all(axis=-1)
+    
+    timer.mark("geometry")
+    
+    results = []
+    # Frames of one session are evaluated in order, one request at a time
+    with exercise_state.lock(session_id):
+        for values, valid, current_time in zip(measurements.tolist(), valid_frames, frame_times):
+            if not valid:
+                results.append({"error": "Insufficient landmarks data."})
+                continue
             
-        # Measure curve as horizontal deviation from straight line
-        lumbar_deviation = abs(actual_mid_back[0] - expected_mid_back_x)
-        height = abs(neck[1] - mid_hip[1])
-        lumbar_curvature = (lumbar_deviation / height) * 100 if height > 0 else 0
-        lumbar_curvatures.append(lumbar_curvature)
-        
-    except Exception as e:
-        pass
-
-    if not back_angles:
-        return {"error": "Insufficient landmarks data."}
+            measurement_lists = [[value] for value in values]
+            results.append(_evaluate_frame(*measurement_lists, session_id, current_time, timer))
+    
+    return results
 
+def _evaluate_frame(back_angles, hip_angles, bar_path_deviations, lumbar_curvatures,
+                    session_id, current_time, timer):
+    """
+    Run rep counting, feedback and scoring for one frame of deadlift measurements
+    """
     # Average the angles and metrics
     avg_back_angle = sum(back_angles) / len(back_angles)
     avg_hip_angle = sum(hip_angles) / len(hip_angles) if hip_angles else 180
@@ -109,7 +75,7 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
     avg_lumbar_curvature = sum(lumbar_curvatures) / len(lumbar_curvatures) if lumbar_curvatures else 0
 
     # Retrieve the current state
-    state = exercise_state.get("deadlifts", {
+    state = exercise_state.get((session_id, "deadlifts"), {
         "repCount": 0, 
         "stage": "up", 
         "feedback": "N/A",
@@ -139,6 +105,8 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
             state["eccentric_time"] = phase_duration
             last_stage_time = current_time
 
+    timer.mark("state_machine")
+    
     # Generate detailed feedback
     feedback_flags = []
     
@@ -208,12 +176,14 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
     
     # Log the rep if this is a new rep and we have a session ID
     if counter > prev_counter and session_id:
+        timer.mark("feedback")
         try:
             from session_state import record_rep
             record_rep(session_id, "deadlifts", feedback_flags, advanced_metrics)
         except ImportError:
             # Session state module not available
             pass
+        timer.mark("record_rep")
 
     # Create affected joints and segments arrays for visualization
     affected_joints = []
@@ -267,5 +237,6 @@ def process_landmarks(landmarks, tolerance=0.0, session_id=None):
         "affected_segments": affected_segments
     }
     
-    exercise_state["deadlifts"] = new_state
+    timer.mark("feedback")
+    exercise_state[(session_id, "deadlifts")] = new_state
     return new_state
\ No newline at end of file
@@ -0,0 +1,397 @@
+"""
+Analysis Executor
+-----------------
+Runs the CPU-bound frame analysis and the blocking disk work of the
+session endpoints off the event loop, so that one slow frame or journal
+read does not stall every other connection of the server.
+
+REGENIX_EXECUTOR selects where frames are analyzed:
+
+- inline: on the event loop. Lowest latency for a lone client, but every
+  other connection waits while a frame is analyzed.
+- thread (default): on a pool of REGENIX_EXECUTOR_WORKERS threads. The
+  analysis holds the GIL for most of a frame, so this adds little
+  throughput, but the event loop keeps accepting and answering requests
+  in between.
+- process: on REGENIX_EXECUTOR_WORKERS worker processes with session
+  affinity: all frames of a session go to the same worker (chosen by a hash
+  of the session ID), which holds the session's exercise state and rep
+  matchers. Frames without a session ID all go to the first worker. The
+  sampling profiler does not see into the workers.
+
+In every mode the reps completed by an analysis are collected rather than
+recorded under the session's exercise state lock (see
+session_state.collect_reps), with the time each rep was completed, and
+recorded by this process, which owns the session store, on the I/O threads.
+A session's reps are queued (see RepQueue) in the order they happened and
+recorded one batch at a time, so they reach the session in that order.
+
+Blocking disk work (session journals and the session index) runs on a
+separate pool of REGENIX_IO_WORKERS threads, see run_io; 0 runs it inline.
+
+Every pool counts its pending tasks and how long they waited for a worker
+(executor_stats, reported by GET /status); the wait of each analysis
+request is also its queue_wait stage in the request metrics.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from frame_analysis import analyze_frames_locked, live_session_count
+from metrics import StageTimer, NULL_STAGE_TIMER
+from session_state import record_rep
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+EXECUTOR_MODE = os.environ.get("REGENIX_EXECUTOR", "thread").strip().lower()
+EXECUTOR_WORKERS = int(os.environ.get("REGENIX_EXECUTOR_WORKERS", os.cpu_count() or 1))
+IO_WORKERS = int(os.environ.get("REGENIX_IO_WORKERS", 4))
+
+class PoolStats:
+    """
+    Pending tasks and queue wait of a pool.
+
+    Args:
+        workers: Tasks the pool runs at once; pending tasks beyond these are queued
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.pending = 0
+        self.completed = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def submitted(self):
+        with self._lock:
+            self.pending += 1
+
+    def started(self, waited):
+        """Count the time a task waited for a worker"""
+        with self._lock:
+            self.waits += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+
+    def finished(self):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    @property
+    def queue_depth(self):
+        """Tasks waiting for a worker"""
+        return max(self.pending - self.workers, 0)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "average_wait_ms": 1000.0 * self.wait_total / self.waits if self.waits else 0.0,
+            "max_wait_ms": 1000.0 * self.wait_max
+        }
+
+class ThreadPool:
+    """Thread pool whose tasks are awaited from the event loop"""
+    def __init__(self, workers, name):
+        self.pool_stats = PoolStats(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on a pool thread and return its result"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def submit(self, fn, *args):
+        """Start fn(*args) on a pool thread (from any thread); returns its concurrent Future"""
+        self.pool_stats.submitted()
+        future = self._executor.submit(self._call, time.perf_counter(), fn, args)
+        future.add_done_callback(lambda _: self.pool_stats.finished())
+        return future
+
+    def _call(self, submitted, fn, args):
+        self.pool_stats.started(time.perf_counter() - submitted)
+        return fn(*args)
+
+    def stats(self):
+        return self.pool_stats.stats()
+
+class ProcessWorkers:
+    """
+    Worker processes with session affinity: one single-process pool per
+    worker, so a session's tasks run one at a time in submission order.
+    A worker starts with its first task, or with start().
+    """
+    def __init__(self, workers):
+        self._context = multiprocessing.get_context("spawn")
+        self._pools = [None] * workers
+        self.pool_stats = [PoolStats(1) for _ in range(workers)]
+        # Live sessions per worker, as reported with its last result
+        self.live_sessions = [0] * workers
+
+    def worker_index(self, session_id):
+        if session_id is None:
+            return 0
+        return zlib.crc32(str(session_id).encode()) % len(self._pools)
+
+    def _pool(self, index):
+        pool = self._pools[index]
+        if pool is None:
+            pool = self._pools[index] = ProcessPoolExecutor(
+                max_workers=1, mp_context=self._context
+            )
+        return pool
+
+    async def start(self):
+        """Start every worker now rather than with its first task"""
+        await asyncio.gather(*(
+            self.run_on(index, live_session_count) for index in range(len(self._pools))
+        ))
+        # Starting up is not waiting in the queue
+        self.pool_stats = [PoolStats(1) for _ in self._pools]
+
+    def shutdown(self):
+        for pool in self._pools:
+            if pool is not None:
+                pool.shutdown()
+
+    async def run(self, session_id, fn, *args):
+        """Run fn(*args) in the session's worker and return its result"""
+        return await self.run_on(self.worker_index(session_id), fn, *args)
+
+    async def run_on(self, index, fn, *args):
+        pool_stats = self.pool_stats[index]
+        pool = self._pool(index)
+        pool_stats.submitted()
+        submitted = time.perf_counter()
+        try:
+            busy, live_sessions, result = await asyncio.wrap_future(
+                pool.submit(_call_in_worker, fn, args)
+            )
+        except BrokenProcessPool:
+            # The worker died and its sessions' state with it; replace it
+            if self._pools[index] is pool:
+                self._pools[index] = None
+                pool.shutdown(wait=False)
+            raise
+        finally:
+            pool_stats.finished()
+        # Includes the transfer of arguments and results
+        pool_stats.started(max(time.perf_counter() - submitted - busy, 0.0))
+        self.live_sessions[index] = live_sessions
+        return result
+
+    def stats(self):
+        return [pool_stats.stats() for pool_stats in self.pool_stats]
+
+def _call_in_worker(fn, args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, live_session_count(), result
+
+def _analyze(exercise_name, frames, tolerance, session_id, frame_times, timer):
+    """
+    analyze_frames_locked, queueing the reps it completes for recording
+    while the session's state lock is held.
+
+    Returns:
+        Results and a Future done once the reps are recorded (None without reps)
+    """
+    queued = []
+    def queue_reps(reps):
+        queued.append(rep_queue.submit(session_id, reps))
+    results = analyze_frames_locked(
+        exercise_name, frames, tolerance, session_id, frame_times, timer, queue_reps
+    )
+    return results, queued[0] if queued else None
+
+def _analyze_in_worker(exercise_name, frames, tolerance, session_id, frame_times):
+    """
+    Analysis in a worker process.
+
+    Returns:
+        Results, the (record_rep arguments of) reps to record and stage durations
+    """
+    timer = StageTimer()
+    reps = []
+    results = analyze_frames_locked(
+        exercise_name, frames, tolerance, session_id, frame_times, timer, reps.extend
+    )
+    return results, reps, timer.durations
+
+def _analyze_in_thread(exercise_name, frames, tolerance, session_id, frame_times, timer, profiled):
+    timer.mark("queue_wait")
+    if profiled is not None:
+        profiled.enter_thread()
+    try:
+        return _analyze(exercise_name, frames, tolerance, session_id, frame_times, timer)
+    finally:
+        if profiled is not None:
+            profiled.exit_thread()
+
+class RepQueue:
+    """
+    Records reps on the I/O threads in the order they were submitted, per
+    session: each session has a queue of rep batches, drained by one I/O
+    task at a time, so batches of one session are never recorded
+    concurrently or out of order.
+    """
+    def __init__(self):
+        self._queues = {}   # session_id -> deque of (reps, Future)
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, reps):
+        """
+        Queue a session's reps (record_rep arguments) from any thread.
+
+        Returns:
+            concurrent.futures.Future done once the reps are recorded
+        """
+        done = Future()
+        with self._lock:
+            queue = self._queues.get(session_id)
+            start = queue is None
+            if start:
+                queue = self._queues[session_id] = deque()
+            queue.append((reps, done))
+        if start:
+            if io_pool is None:
+                self._drain(session_id)
+            else:
+                io_pool.submit(self._drain, session_id)
+        return done
+
+    def _drain(self, session_id):
+        while True:
+            with self._lock:
+                queue = self._queues[session_id]
+                if not queue:
+                    del self._queues[session_id]
+                    return
+                reps, done = queue.popleft()
+            try:
+                for rep in reps:
+                    record_rep(*rep)
+            except Exception as e:
+                done.set_exception(e)
+            else:
+                done.set_result(None)
+
+class AnalysisExecutor:
+    """
+    Runs frame analysis in one of EXECUTOR_MODES.
+
+    Args:
+        mode: "inline", "thread" or "process"
+        workers: Threads or worker processes
+    """
+    def __init__(self, mode=EXECUTOR_MODE, workers=EXECUTOR_WORKERS):
+        if mode not in EXECUTOR_MODES:
+            print(f"Unknown executor mode {mode!r}, analyzing frames in threads.")
+            mode = "thread"
+        self.mode = mode
+        self.workers = max(workers, 1)
+        self._threads = ThreadPool(self.workers, "regenix-analysis") if mode == "thread" else None
+        self._processes = ProcessWorkers(self.workers) if mode == "process" else None
+
+    async def start(self):
+        """Start the worker processes (process mode), e.g. when the app starts"""
+        if self._processes is not None:
+            await self._processes.start()
+
+    def shutdown(self):
+        if self._processes is not None:
+            self._processes.shutdown()
+
+    async def analyze(self, exercise_name, frames, tolerance, session_id=None, frame_times=None,
+                      timer=NULL_STAGE_TIMER, profiled=None):
+        """
+        analyze_frames_locked (see frame_analysis) in the configured mode.
+
+        Args:
+            timer: StageTimer of the request; the time spent waiting for a
+                worker is charged to its queue_wait stage
+            profiled: Profiler capture of the request, if it is profiled
+        """
+        if self._threads is not None:
+            results, recorded = await self._threads.run(
+                _analyze_in_thread, exercise_name, frames, tolerance, session_id, frame_times,
+                timer, profiled
+            )
+        elif self._processes is not None:
+            results, reps, durations = await self._processes.run(
+                session_id, _analyze_in_worker, exercise_name, frames, tolerance, session_id,
+                frame_times
+            )
+            timer.absorb(durations, "queue_wait")
+            # A session's frames run one at a time in its worker and their
+            # results come back in that order, so its reps are queued in order
+            recorded = rep_queue.submit(session_id, reps) if reps else None
+        else:
+            results, recorded = _analyze(exercise_name, frames, tolerance, session_id, frame_times, timer)
+        # Recorded on the I/O threads, so journal writes never hold up analysis;
+        # the response waits for them, so a following summary includes the reps
+        if recorded is not None:
+            await asyncio.wrap_future(recorded)
+            timer.mark("record_rep")
+        return results
+
+    async def run_for_session(self, session_id, fn, *args):
+        """
+        Run fn(*args) where the session's exercise state lives: in its
+        worker process in process mode, otherwise right away (fn must be
+        quick, e.g. a state reset).
+        """
+        if self._processes is not None:
+            return await self._processes.run(session_id, fn, *args)
+        return fn(*args)
+
+    def live_sessions(self):
+        """Sessions holding exercise state (as last reported by the workers in process mode)"""
+        if self._processes is not None:
+            return sum(self._processes.live_sessions)
+        return live_session_count()
+
+    def queue_depth(self):
+        """Analysis tasks waiting for a worker"""
+        if self._threads is not None:
+            return self._threads.pool_stats.queue_depth
+        if self._processes is not None:
+            return sum(pool_stats.queue_depth for pool_stats in self._processes.pool_stats)
+        return 0
+
+    def stats(self):
+        stats = {"mode": self.mode, "workers": self.workers, "queue_depth": self.queue_depth()}
+        if self._threads is not None:
+            stats["pool"] = self._threads.stats()
+        elif self._processes is not None:
+            stats["pools"] = self._processes.stats()
+        return stats
+
+analysis_executor = AnalysisExecutor()
+io_pool = ThreadPool(IO_WORKERS, "regenix-io") if IO_WORKERS > 0 else None
+rep_queue = RepQueue()
+
+async def run_io(fn, *args):
+    """Run blocking disk work fn(*args) on the I/O threads (inline without them)"""
+    if io_pool is None:
+        return fn(*args)
+    return await io_pool.run(fn, *args)
+
+def io_queue_depth():
+    return io_pool.pool_stats.queue_depth if io_pool is not None else 0
+
+def executor_stats():
+    """Queue counters of the analysis executor and the I/O threads"""
+    return {
+        "analysis": analysis_executor.stats(),
+        "io": io_pool.stats() if io_pool is not None else None
+    }
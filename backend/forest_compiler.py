@@ -0,0 +1,246 @@
+"""
+Forest Compiler
+---------------
+Flattens a fitted scikit-learn Pipeline(StandardScaler, RandomForestClassifier)
+into contiguous NumPy arrays, and evaluates them without scikit-learn.
+
+Every tree's nodes are concatenated into one set of arrays (feature,
+threshold, left, right, value) with per-tree root offsets. Leaves point to
+themselves, so all trees are walked together for a fixed number of steps
+(the deepest tree's depth). Leaf values are stored already normalized to
+class probabilities.
+
+The scaler is folded into the thresholds. scikit-learn compares
+float32((x - mean) / scale) <= threshold, which is monotone in x, so each
+node has a largest raw float64 value that still goes left; it is found by
+binary search over the ordered float64 bit patterns. Comparing raw values
+against these thresholds routes every input exactly as the pipeline does,
+and the per-tree probabilities are summed in tree order and divided by the
+tree count like RandomForestClassifier.predict_proba, so the compiled
+forest's probabilities are bit-for-bit equal to the pipeline's.
+"""
+import hashlib
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+SIGN_BIT = np.int64(-0x8000000000000000)
+MAGNITUDE_BITS = np.int64(0x7FFFFFFFFFFFFFFF)
+
+def _float_keys(values):
+    """Integer keys with the same order as the (non-NaN) float64 values"""
+    bits = np.asarray(values, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, -(bits & MAGNITUDE_BITS), bits)
+
+def _key_floats(keys):
+    """Inverse of _float_keys (-0.0 comes back as 0.0)"""
+    bits = np.where(keys < 0, (-keys) | SIGN_BIT, keys)
+    return bits.view(np.float64)
+
+def fold_scaler_thresholds(thresholds, mean, scale):
+    """
+    Raw-input thresholds equivalent to scaled-input tree thresholds.
+
+    Args:
+        thresholds: Node thresholds on the scaled, float32 features
+        mean: Scaler mean of each node's feature (or None)
+        scale: Scaler scale of each node's feature (or None)
+
+    Returns:
+        Array t such that, for every float64 x,
+        x <= t  <=>  float32((x - mean) / scale) <= thresholds
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    def goes_left(x):
+        # Extreme probes overflow to +-inf, which compares like the float32 cast would
+        with np.errstate(over="ignore"):
+            if mean is not None:
+                x = x - mean
+            if scale is not None:
+                x = x / scale
+            return x.astype(np.float32).astype(np.float64) <= thresholds
+
+    largest = np.finfo(np.float64).max
+    low = _float_keys(np.full(len(thresholds), -largest))
+    high = _float_keys(np.full(len(thresholds), largest))
+    always_left = goes_left(_key_floats(high))
+    never_left = ~goes_left(_key_floats(low))
+
+    # Invariant: low goes left, high does not
+    searching = ~(always_left | never_left)
+    while True:
+        gap = searching & (low + 1 < high)
+        if not gap.any():
+            break
+        # Overflow-free floor((low + high) / 2)
+        middle = (low >> 1) + (high >> 1) + (low & high & 1)
+        left = goes_left(_key_floats(middle))
+        low = np.where(gap & left, middle, low)
+        high = np.where(gap & ~left, middle, high)
+
+    folded = _key_floats(low)
+    folded[always_left] = np.inf
+    folded[never_left] = -np.inf
+    return folded
+
+def compile_pipeline(pipeline, column_order=None):
+    """
+    Compile a fitted Pipeline(StandardScaler, RandomForestClassifier).
+
+    Args:
+        pipeline: The fitted pipeline (a bare forest is accepted too)
+        column_order: Optional input position of each model feature, so the
+            compiled forest reads rows in a different column order
+
+    Returns:
+        Dict of arrays, as stored by save_forest
+    """
+    steps = [step for _, step in getattr(pipeline, "steps", [(None, pipeline)])]
+    forest = steps[-1]
+    scaler = steps[0] if len(steps) == 2 else None
+    if len(steps) > 2 or getattr(forest, "n_outputs_", 1) != 1:
+        raise ValueError("Only a single-output forest behind an optional scaler can be compiled")
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left == -1
+        nodes = np.arange(tree.node_count) + offset
+
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        lefts.append(np.where(leaf, nodes, tree.children_left + offset))
+        rights.append(np.where(leaf, nodes, tree.children_right + offset))
+
+        # Same normalization as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :estimator.n_classes_].copy()
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+        values.append(value)
+
+        roots.append(offset)
+        offset += tree.node_count
+
+    feature = np.concatenate(features).astype(np.int64)
+    threshold = np.concatenate(thresholds)
+    internal = np.isfinite(threshold)
+    if scaler is not None:
+        mean = scaler.mean_[feature[internal]] if scaler.with_mean else None
+        scale = scaler.scale_[feature[internal]] if scaler.with_std else None
+    else:
+        mean = scale = None
+    threshold[internal] = fold_scaler_thresholds(threshold[internal], mean, scale)
+    if column_order is not None:
+        feature = np.asarray(column_order, dtype=np.int64)[feature]
+
+    return {
+        "format_version": np.array(FORMAT_VERSION),
+        "feature": feature,
+        "threshold": threshold,
+        "left": np.concatenate(lefts).astype(np.int64),
+        "right": np.concatenate(rights).astype(np.int64),
+        "value": np.concatenate(values),
+        "roots": np.array(roots, dtype=np.int64),
+        "depth": np.array(max(estimator.tree_.max_depth for estimator in forest.estimators_)),
+        "classes": np.array([str(label) for label in forest.classes_]),
+        "n_features": np.array(forest.n_features_in_)
+    }
+
+def probe_rows(arrays, base):
+    """
+    Rows that put every split of a compiled forest at, just above and just
+    below its threshold (the cases where a folded threshold could be off).
+
+    Args:
+        arrays: Dict of arrays from compile_pipeline
+        base: Row of ordinary feature values the probes start from
+
+    Returns:
+        Array of shape (3 * splits, n_features)
+    """
+    splits = np.flatnonzero(np.isfinite(arrays["threshold"]))
+    thresholds = arrays["threshold"][splits]
+    rows = np.repeat(np.asarray(base, dtype=np.float64)[np.newaxis], 3 * len(splits), axis=0)
+    probes = np.concatenate([
+        thresholds, np.nextafter(thresholds, np.inf), np.nextafter(thresholds, -np.inf)
+    ])
+    rows[np.arange(len(rows)), np.tile(arrays["feature"][splits], 3)] = probes
+    return rows
+
+class CompiledForest:
+    """
+    Pure NumPy evaluator of a compiled forest.
+
+    Args:
+        arrays: Dict of arrays from compile_pipeline or load_forest
+    """
+    def __init__(self, arrays):
+        if int(arrays["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled forest format {int(arrays['format_version'])}")
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.depth = int(arrays["depth"])
+        self.classes_ = arrays["classes"]
+        self.n_features_in_ = int(arrays["n_features"])
+
+    def apply(self, rows):
+        """Leaf node of every tree for every row, shape (trees, rows)"""
+        rows = np.asarray(rows, dtype=np.float64)
+        nodes = np.repeat(self.roots[:, np.newaxis], len(rows), axis=1)
+        row_index = np.arange(len(rows))
+        for _ in range(self.depth):
+            goes_left = rows[row_index, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(goes_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, rows):
+        """
+        Class probabilities, as RandomForestClassifier.predict_proba.
+
+        Args:
+            rows: Array of shape (n, n_features)
+
+        Returns:
+            Array of shape (n, classes)
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim != 2 or rows.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected rows of {self.n_features_in_} features, got shape {rows.shape}")
+        # cumsum adds the trees one at a time in order, like the forest does
+        probabilities = np.cumsum(self.value[self.apply(rows)], axis=0)[-1]
+        return probabilities / len(self.roots)
+
+def save_forest(arrays, path, **metadata):
+    """Write compiled arrays (and string metadata such as the source hash) to an .npz file"""
+    extra = {f"meta_{key}": np.array(value) for key, value in metadata.items()}
+    with open(path, "wb") as f:
+        np.savez(f, **arrays, **extra)
+
+def load_forest(path):
+    """
+    Read a compiled forest.
+
+    Returns:
+        forest: CompiledForest
+        metadata: Dict of the metadata it was saved with
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files}
+    metadata = {
+        key[len("meta_"):]: str(arrays.pop(key))
+        for key in list(arrays) if key.startswith("meta_")
+    }
+    return CompiledForest(arrays), metadata
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, to tie a compiled forest to its source model"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,99 @@
+"""
+Frame Analysis
+--------------
+The rule-based analysis of landmark frames and the operations on the
+real-time exercise state it keeps per session.
+
+Kept apart from main so that executor worker processes (see executor) can
+import it without the FastAPI app: everything here runs wherever the
+session's exercise state lives, on the event loop, an executor thread or
+the session's worker process.
+"""
+from bicep_curls import process_landmarks_batch as process_bicep_curls_batch
+from deadlifts import process_landmarks_batch as process_deadlifts_batch
+from lunges import process_landmarks_batch as process_lunges_batch
+from pushups import process_landmarks_batch as process_pushups_batch
+from situps import process_landmarks_batch as process_situps_batch
+from squats import process_landmarks_batch as process_squats_batch
+
+from metrics import NULL_STAGE_TIMER
+from motion_matching import match_reps, attach_progress, reset_reps
+from session_state import collect_reps
+from state import exercise_state
+
+# Map exercise names to their processing functions
+EXERCISE_BATCH_PROCESSORS = {
+    "bicep_curls": process_bicep_curls_batch,
+    "deadlifts": process_deadlifts_batch,
+    "lunges": process_lunges_batch,
+    "pushups": process_pushups_batch,
+    "situps": process_situps_batch,
+    "squats": process_squats_batch,
+}
+
+# State of an exercise at the start of a new set (see reset_exercise_state)
+RESET_STATES = {
+    "bicep_curls": {"repCount": 0, "stage": "down", "prev_shoulders": None},
+    "deadlifts": {"repCount": 0, "stage": "up"},
+    "lunges": {"counter": 0, "stage": "up"},
+    "pushups": {"counter": 0, "stage": "up"},
+    "situps": {"counter": 0, "stage": "up"},
+    "squats": {
+        "counter": 0,
+        "stage": "up",
+        "repCounted": False,
+        "currentMinKnee": None,
+        "currentMinTrunk": None
+    },
+}
+
+def analyze_frames_locked(exercise_name, frames, tolerance, session_id=None, frame_times=None,
+                          timer=NULL_STAGE_TIMER, record_reps=None):
+    """
+    Analyze frames with an exercise's processor under the session's state lock.
+
+    Completed reps are compared with the exercise's reference motion as the
+    frames are analyzed, and every frame gets its reference progress (see
+    motion_matching).
+
+    Args:
+        record_reps: Optional function taking the reps the frames completed
+            (record_rep arguments, see session_state.collect_reps) instead
+            of recording them on the spot. It is called under the lock, so
+            the reps of a session are handed over in the order they happened.
+
+    Returns:
+        List with one result dict per frame
+    """
+    process_batch = EXERCISE_BATCH_PROCESSORS[exercise_name]
+    with exercise_state.lock(session_id):
+        timer.mark("lock_wait")
+        if record_reps is None:
+            results = process_batch(frames, tolerance, session_id, frame_times, timer)
+        else:
+            with collect_reps() as reps:
+                results = process_batch(frames, tolerance, session_id, frame_times, timer)
+            if reps:
+                record_reps(reps)
+        match_reps(exercise_name, session_id, results)
+    attach_progress(exercise_name, results)
+    timer.mark("motion_match")
+    return results
+
+def reset_exercise_state(session_id, exercise_name):
+    """Reset the counter and state of an exercise for a new set"""
+    reset_reps(session_id, exercise_name)
+    initial_state = RESET_STATES.get(exercise_name)
+    if initial_state is not None:
+        exercise_state[(session_id, exercise_name)] = {
+            **initial_state, "feedback": "Ready to start new set"
+        }
+
+def discard_session_state(session_id):
+    """Free all real-time state of a session (e.g. when it ends)"""
+    exercise_state.discard_session(session_id)
+    reset_reps(session_id)
+
+def live_session_count():
+    """Number of sessions holding real-time exercise state"""
+    return len(exercise_state)
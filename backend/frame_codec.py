@@ -0,0 +1,115 @@
+"""
+Binary Landmark Frames
+----------------------
+Compact encoding for landmark payloads: each frame is 33 x 4 little-endian
+float32 values (x, y, z, visibility per landmark), optionally preceded by a
+32-byte header carrying the client timestamp and session ID.
+
+Header layout (little-endian):
+    magic      4 bytes   b"RGXF"
+    version    uint8     1
+    flags      uint8     bit 0 set when the session field is filled
+    reserved   uint16
+    timestamp  float64   client capture time in milliseconds
+    session    16 bytes  session UUID
+
+Frames are decoded with np.frombuffer, so the returned landmark array is a
+view on the request body and can be passed straight to the exercise modules'
+process_landmarks_batch functions.
+"""
+import uuid
+import numpy as np
+
+from geometry import NUM_LANDMARKS
+
+# Content types that select the binary encoding
+BINARY_CONTENT_TYPES = ("application/octet-stream", "application/x-regenix-frames")
+
+FRAME_MAGIC = b"RGXF"
+FRAME_VERSION = 1
+FLAG_HAS_SESSION = 0x01
+
+LANDMARKS_DTYPE = np.dtype(("<f4", (NUM_LANDMARKS, 4)))
+
+HEADERED_FRAME_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "u1"),
+    ("flags", "u1"),
+    ("reserved", "<u2"),
+    ("timestamp", "<f8"),
+    ("session", "V16"),
+    ("landmarks", "<f4", (NUM_LANDMARKS, 4)),
+])
+
+FRAME_SIZE = LANDMARKS_DTYPE.itemsize
+HEADERED_FRAME_SIZE = HEADERED_FRAME_DTYPE.itemsize
+
+class FrameDecodeError(ValueError):
+    """Raised when a binary payload is not a valid sequence of frames"""
+
+def is_binary_content_type(content_type):
+    """Check whether a Content-Type header selects the binary frame encoding"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type in BINARY_CONTENT_TYPES
+
+def decode_frames(body):
+    """
+    Decode a binary payload into landmark frames.
+
+    The payload is either raw frames (528 bytes each) or headered frames
+    (560 bytes each); the two forms cannot be mixed in one payload.
+
+    Args:
+        body: Request body bytes
+
+    Returns:
+        frames: Array of shape (frames, 33, 4) viewing the body
+        timestamps: List of client timestamps in milliseconds, or None
+        session_id: Session ID from the first header, or None
+    """
+    if not body:
+        raise FrameDecodeError("Empty frame payload")
+
+    if body[:4] == FRAME_MAGIC:
+        if len(body) % HEADERED_FRAME_SIZE:
+            raise FrameDecodeError(
+                f"Headered payload size must be a multiple of {HEADERED_FRAME_SIZE} bytes"
+            )
+        records = np.frombuffer(body, dtype=HEADERED_FRAME_DTYPE)
+        if (records["magic"] != FRAME_MAGIC).any() or (records["version"] != FRAME_VERSION).any():
+            raise FrameDecodeError("Invalid frame header")
+
+        session_id = None
+        if records[0]["flags"] & FLAG_HAS_SESSION:
+            session_id = str(uuid.UUID(bytes=records[0]["session"].tobytes()))
+        return records["landmarks"], records["timestamp"].tolist(), session_id
+
+    if len(body) % FRAME_SIZE:
+        raise FrameDecodeError(f"Frame payload size must be a multiple of {FRAME_SIZE} bytes")
+    return np.frombuffer(body, dtype=LANDMARKS_DTYPE), None, None
+
+def encode_frames(frames, timestamps=None, session_id=None):
+    """
+    Encode landmark frames into the binary format (used by clients and tools).
+
+    Args:
+        frames: Array-like of shape (frames, 33, 4)
+        timestamps: Optional list of timestamps in milliseconds; adds headers
+        session_id: Optional session ID to put in the headers
+
+    Returns:
+        Encoded payload bytes
+    """
+    frames = np.asarray(frames, dtype="<f4").reshape(-1, NUM_LANDMARKS, 4)
+    if timestamps is None and session_id is None:
+        return frames.tobytes()
+
+    records = np.zeros(len(frames), dtype=HEADERED_FRAME_DTYPE)
+    records["magic"] = FRAME_MAGIC
+    records["version"] = FRAME_VERSION
+    records["timestamp"] = timestamps if timestamps is not None else 0.0
+    if session_id is not None:
+        records["flags"] = FLAG_HAS_SESSION
+        records["session"] = np.void(uuid.UUID(session_id).bytes)
+    records["landmarks"] = frames
+    return records.tobytes()
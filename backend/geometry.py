@@ -0,0 +1,316 @@
+"""
+Landmark Geometry
+-----------------
+Shared per-frame feature extraction for all exercise modules.
+
+A frame is converted to a (33, 4) array once, and extract_features computes
+every joint angle, midpoint and projection any exercise needs in one pass
+over a whole batch of frames. The exercise modules only read from the
+resulting FrameFeatures.
+
+The pass runs on a pluggable backend: the scalar kernels in geometry_kernels
+(compiled with Numba when available, plain Python otherwise) or the
+vectorized NumPy functions below.
+
+Points are arrays whose last axis holds the (x, y) coordinates, so the
+helpers work on a single frame or on a (frames, ...) batch.
+"""
+import os
+import numpy as np
+
+from geometry_kernels import (
+    NUM_FEATURES, NUMBA_AVAILABLE, python_batch_features, numba_batch_features
+)
+
+GEOMETRY_BACKENDS = ("auto", "numba", "python", "numpy")
+
+# "auto" compiles the scalar kernels with Numba when it is installed, and
+# otherwise runs them as plain Python for small batches and uses NumPy for
+# larger ones
+GEOMETRY_BACKEND = os.environ.get("REGENIX_GEOMETRY_BACKEND", "auto")
+
+# Without Numba, batches of at least this many frames use the NumPy path
+VECTORIZE_MIN_FRAMES = 16
+
+# MediaPipe Pose returns 33 landmarks per frame
+NUM_LANDMARKS = 33
+
+# Column order of the per-landmark values in a frame array
+LANDMARK_FIELDS = ("x", "y", "z", "visibility")
+
+NAN = float("nan")
+MISSING_LANDMARK = (NAN, NAN, NAN, NAN)
+
+# Virtual points appended after the MediaPipe landmarks by extend_points
+MID_SHOULDER = 33
+MID_HIP = 34
+MID_KNEE = 35
+MID_ANKLE = 36
+NECK = 37  # Estimated slightly above the mid shoulder
+
+# Left and right landmark pairs averaged into the midpoints above
+MIDPOINT_PAIRS = ((11, 12), (23, 24), (25, 26), (27, 28))
+
+# Joint angles measured on both sides: (first point, vertex, last point) for [left, right]
+SIDED_ANGLE_JOINTS = {
+    "knee": ((23, 25, 27), (24, 26, 28)),      # Hip-knee-ankle
+    "hip": ((11, 23, 25), (12, 24, 26)),       # Shoulder-hip-knee
+    "elbow": ((11, 13, 15), (12, 14, 16)),     # Shoulder-elbow-wrist
+}
+
+# Joint angles measured on the body midline
+CENTER_ANGLE_JOINTS = {
+    "back": (0, MID_HIP, MID_KNEE),            # Nose (neck proxy)-hips-knees
+    "hip_hinge": (MID_SHOULDER, MID_HIP, MID_KNEE),
+    "neck": (0, NECK, MID_SHOULDER),
+}
+
+# Shoulder, hip, knee and ankle of the [left, right] leg chains
+LEG_CHAINS = np.array([(11, 23, 25, 27), (12, 24, 26, 28)])
+
+ANGLE_TRIPLETS = np.array(
+    [triplet for sides in SIDED_ANGLE_JOINTS.values() for triplet in sides] +
+    list(CENTER_ANGLE_JOINTS.values())
+)
+
+# Columns of the feature matrix behind each FrameFeatures attribute
+FEATURE_SLICES = {
+    "knee_angles": slice(0, 2),
+    "hip_angles": slice(2, 4),
+    "elbow_angles": slice(4, 6),
+    "back_angles": 6,
+    "hip_hinge_angles": 7,
+    "neck_angles": 8,
+    "knee_projections": slice(9, 11),
+    "torso_angles": slice(11, 13),
+    "knee_valgus": slice(13, 15),
+    "shoulders": slice(15, 19),
+    "mid_shoulder": slice(19, 21),
+    "mid_hip": slice(21, 23),
+    "mid_ankle": slice(23, 25),
+    "bar_path_deviations": 25,
+    "body_alignment": 26,
+}
+
+class FrameFeatures:
+    """
+    Joint measurements for a batch of frames, computed by extract_features.
+    
+    The measurements live in one (frames, features) matrix laid out as
+    geometry_kernels.FEATURE_COLUMNS; the attributes are views on it. Every
+    attribute has the frames axis first. Per-side attributes have a second
+    axis ordered [left, right]. Values that depend on missing landmarks are NaN.
+    
+    Attributes:
+        knee_angles, hip_angles, elbow_angles: (frames, 2) joint angles
+        back_angles: (frames,) nose-hips-knees angle
+        hip_hinge_angles: (frames,) shoulders-hips-knees angle
+        neck_angles: (frames,) nose-neck-shoulders angle
+        knee_projections: (frames, 2) knee position relative to the ankle
+        torso_angles: (frames, 2) torso angle from vertical
+        knee_valgus: (frames, 2) frontal-plane knee angle
+        shoulders: (frames, 2, 2) shoulder positions
+        mid_shoulder, mid_hip, mid_ankle: (frames, 2) midline points
+        bar_path_deviations: (frames,) hip-to-midfoot deviation
+        body_alignment: (frames,) shoulder-hip-ankle line fit error
+    """
+    def __init__(self, matrix):
+        self.matrix = matrix
+    
+    def __getattr__(self, name):
+        # Views are created on access, since most exercises read only a few
+        try:
+            columns = FEATURE_SLICES[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        if name == "shoulders":
+            return self.matrix[:, columns].reshape(-1, 2, 2)
+        return self.matrix[:, columns]
+    
+    def __len__(self):
+        return len(self.matrix)
+
+def set_geometry_backend(name):
+    """
+    Select the geometry backend used by extract_features.
+    
+    Args:
+        name: "auto", "numba", "python" or "numpy"
+    """
+    global GEOMETRY_BACKEND
+    if name not in GEOMETRY_BACKENDS:
+        raise ValueError(f"Unknown geometry backend '{name}'")
+    if name == "numba" and not NUMBA_AVAILABLE:
+        raise ValueError("The numba geometry backend requires Numba to be installed")
+    GEOMETRY_BACKEND = name
+
+def resolve_geometry_backend(frame_count=1):
+    """Get the concrete backend that handles a batch of the given size"""
+    if GEOMETRY_BACKEND != "auto":
+        return GEOMETRY_BACKEND
+    if NUMBA_AVAILABLE:
+        return "numba"
+    return "python" if frame_count < VECTORIZE_MIN_FRAMES else "numpy"
+
+def landmarks_to_array(landmarks):
+    """
+    Convert one frame of landmark dicts into a (33, 4) float array.
+    
+    Missing landmarks (or missing x/y values) become NaN so that the
+    measurements depending on them can be detected and skipped.
+    """
+    rows = [
+        (landmark.get('x', NAN), landmark.get('y', NAN),
+         landmark.get('z', 0.0), landmark.get('visibility', 0.0))
+        if landmark else MISSING_LANDMARK
+        for landmark in landmarks[:NUM_LANDMARKS]
+    ]
+    if len(rows) < NUM_LANDMARKS:
+        rows.extend([MISSING_LANDMARK] * (NUM_LANDMARKS - len(rows)))
+    return np.array(rows, dtype=np.float64)
+
+def frames_to_array(frames):
+    """Convert a list of landmark frames into a (frames, 33, 4) float array"""
+    if not frames:
+        return np.empty((0, NUM_LANDMARKS, 4))
+    return np.stack([landmarks_to_array(landmarks) for landmarks in frames])
+
+def extend_points(frames):
+    """
+    Get the (x, y) coordinates of all landmarks plus the virtual midline
+    points, as a (frames, 38, 2) array
+    """
+    xy = frames[..., :2]
+    left, right = zip(*MIDPOINT_PAIRS)
+    mids = midpoints(xy[..., list(left), :], xy[..., list(right), :])
+    neck = mids[..., :1, :] - [0, 0.05]
+    return np.concatenate([xy, mids, neck], axis=-2)
+
+def extract_features(frames):
+    """
+    Compute every measurement the exercise modules use for a batch of frames.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4), e.g. from frames_to_array
+        
+    Returns:
+        FrameFeatures for the batch
+    """
+    backend = resolve_geometry_backend(len(frames))
+    
+    if backend == "numba":
+        xy = np.ascontiguousarray(frames[..., :2], dtype=np.float64)
+        matrix = np.empty((len(frames), NUM_FEATURES))
+        numba_batch_features(xy, matrix)
+    elif backend == "python":
+        rows = [[0.0] * NUM_FEATURES for _ in range(len(frames))]
+        python_batch_features(frames[..., :2].tolist(), rows)
+        matrix = np.array(rows).reshape(len(frames), NUM_FEATURES)
+    else:
+        matrix = vectorized_feature_matrix(frames)
+    
+    return FrameFeatures(matrix)
+
+def vectorized_feature_matrix(frames):
+    """
+    Compute the feature matrix with NumPy in one vectorized pass over the batch
+    (the "numpy" backend).
+    """
+    pts = extend_points(frames)
+    
+    # All joint angles at once, in feature column order
+    triplets = pts[..., ANGLE_TRIPLETS, :]
+    angles = calculate_angles(triplets[..., 0, :], triplets[..., 1, :], triplets[..., 2, :])
+    
+    # Leg chain measurements for both sides at once
+    legs = pts[..., LEG_CHAINS, :]
+    shoulder, hip, knee, ankle = (legs[..., i, :] for i in range(4))
+    mid_shoulder = pts[..., MID_SHOULDER, :]
+    mid_hip = pts[..., MID_HIP, :]
+    mid_ankle = pts[..., MID_ANKLE, :]
+    
+    return np.concatenate([
+        angles,
+        calculate_knee_projections(knee, ankle),
+        calculate_torso_angles(shoulder, hip),
+        calculate_knee_valgus_angles(hip, knee, ankle),
+        pts[..., [11, 12], :].reshape(-1, 4),
+        mid_shoulder,
+        mid_hip,
+        mid_ankle,
+        calculate_bar_path_deviations(mid_hip, mid_ankle)[..., None],
+        calculate_body_alignment_errors(mid_shoulder, mid_hip, mid_ankle)[..., None],
+    ], axis=-1)
+
+def midpoints(p1, p2):
+    """Calculate midpoints between two arrays of points"""
+    return (p1 + p2) / 2
+
+def calculate_angles(a, b, c):
+    """Calculate the angles (in degrees) at points b given points a, b, and c"""
+    radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0]) -
+               np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    angle = np.abs(radians * 180.0 / np.pi)
+    return np.where(angle > 180.0, 360 - angle, angle)
+
+def calculate_knee_projections(knee, ankle):
+    """Normalized horizontal knee position relative to the ankle (positive means forward)"""
+    vector = knee - ankle
+    length = np.linalg.norm(vector, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(length == 0, 0.0, vector[..., 0] / length)
+
+def calculate_torso_angles(shoulder, hip):
+    """Torso angles from vertical (0 degrees is perfectly upright)"""
+    vector = shoulder - hip
+    length = np.linalg.norm(vector, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Dot product with the upward vertical vector [0, -1]
+        dot_product = -vector[..., 1] / length
+    angle = np.arccos(np.clip(dot_product, -1.0, 1.0)) * 180.0 / np.pi
+    return np.where(length == 0, 0.0, angle)
+
+def calculate_knee_valgus_angles(hip, knee, ankle):
+    """Knee valgus angles, measured between the frontal-plane thigh and shin vectors"""
+    # With 2D points only the horizontal components lie in the frontal plane
+    knee_to_hip = hip[..., 0] - knee[..., 0]
+    knee_to_ankle = ankle[..., 0] - knee[..., 0]
+    magnitude = np.abs(knee_to_hip) * np.abs(knee_to_ankle)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = (knee_to_hip * knee_to_ankle) / magnitude
+    angle = np.arccos(np.clip(cosine, -1.0, 1.0)) * 180.0 / np.pi
+    return np.where(magnitude == 0, 0.0, angle)
+
+def calculate_bar_path_deviations(hip, ankle):
+    """Horizontal hip-to-midfoot distance, normalized by hip-to-ankle height"""
+    deviation = np.abs(hip[..., 0] - ankle[..., 0])
+    height = np.abs(hip[..., 1] - ankle[..., 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(height == 0, 0.0, deviation / height)
+
+def calculate_body_alignment_errors(shoulder, hip, ankle):
+    """
+    Mean squared error of the best-fit line through shoulder, hip and ankle.
+
+    Closed-form equivalent of a degree-1 np.polyfit per frame; lower is
+    closer to a straight line.
+    """
+    x = np.stack([shoulder[..., 0], hip[..., 0], ankle[..., 0]], axis=-1)
+    y = np.stack([shoulder[..., 1], hip[..., 1], ankle[..., 1]], axis=-1)
+    x_mean = x.mean(axis=-1, keepdims=True)
+    y_mean = y.mean(axis=-1, keepdims=True)
+    sxx = ((x - x_mean) ** 2).sum(axis=-1, keepdims=True)
+    sxy = ((x - x_mean) * (y - y_mean)).sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = sxy / sxx
+    residuals = (y - y_mean) - slope * (x - x_mean)
+    mse = np.mean(residuals ** 2, axis=-1)
+    # Vertical points have no best-fit line; treat them as perfectly aligned
+    return np.where(sxx[..., 0] == 0, 0.0, mse)
+
+# Validate the configured backend
+set_geometry_backend(GEOMETRY_BACKEND)
+
+if resolve_geometry_backend() == "numba":
+    # Compile the kernels at import time rather than on the first request
+    extract_features(np.zeros((1, NUM_LANDMARKS, 4)))
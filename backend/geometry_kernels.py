@@ -0,0 +1,195 @@
+"""
+Geometry Kernels
+----------------
+Scalar per-frame feature kernels behind geometry.extract_features.
+
+The kernels are written once against the math module. When Numba is
+importable they are compiled with @njit(cache=True), so that only the first
+process after a change to this file compiles them and every later one
+(including executor worker processes) loads them from Numba's cache in
+__pycache__. The same source also runs as plain Python: this file is
+executed a second time as PYTHON_VARIANT with a no-op decorator, which for
+one or a few frames is still cheaper than the per-call overhead of the
+vectorized NumPy path on tiny arrays. Both variants perform the same
+floating point operations in the same order, so they return identical values.
+
+Every kernel writes one row per frame using the column layout in
+FEATURE_COLUMNS.
+"""
+import importlib.util
+import math
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Module name of this file executed again without Numba (see python_kernels)
+PYTHON_VARIANT = "geometry_kernels_python"
+
+if NUMBA_AVAILABLE and __name__ != PYTHON_VARIANT:
+    jit = njit(cache=True)
+else:
+    def jit(fn):
+        return fn
+
+# Column layout of a feature row
+FEATURE_COLUMNS = (
+    "left_knee_angle", "right_knee_angle",
+    "left_hip_angle", "right_hip_angle",
+    "left_elbow_angle", "right_elbow_angle",
+    "back_angle", "hip_hinge_angle", "neck_angle",
+    "left_knee_projection", "right_knee_projection",
+    "left_torso_angle", "right_torso_angle",
+    "left_knee_valgus", "right_knee_valgus",
+    "left_shoulder_x", "left_shoulder_y", "right_shoulder_x", "right_shoulder_y",
+    "mid_shoulder_x", "mid_shoulder_y",
+    "mid_hip_x", "mid_hip_y",
+    "mid_ankle_x", "mid_ankle_y",
+    "bar_path_deviation",
+    "body_alignment",
+)
+
+NUM_FEATURES = len(FEATURE_COLUMNS)
+
+@jit
+def joint_angle(ax, ay, bx, by, cx, cy):
+    """Angle (in degrees) at point b given points a, b, and c"""
+    radians = math.atan2(cy - by, cx - bx) - math.atan2(ay - by, ax - bx)
+    angle = abs(radians * 180.0 / math.pi)
+    if angle > 180.0:
+        angle = 360 - angle
+    return angle
+
+@jit
+def clipped_acos_degrees(cosine):
+    """arccos in degrees, with the cosine clipped to [-1, 1] (NaN passes through)"""
+    if cosine > 1.0:
+        cosine = 1.0
+    elif cosine < -1.0:
+        cosine = -1.0
+    return math.acos(cosine) * 180.0 / math.pi
+
+@jit
+def knee_projection(kx, ky, ax, ay):
+    """Normalized horizontal knee position relative to the ankle"""
+    dx = kx - ax
+    dy = ky - ay
+    length = math.sqrt(dx * dx + dy * dy)
+    if length == 0:
+        return 0.0
+    return dx / length
+
+@jit
+def torso_angle(sx, sy, hx, hy):
+    """Torso angle from vertical (0 degrees is perfectly upright)"""
+    dx = sx - hx
+    dy = sy - hy
+    length = math.sqrt(dx * dx + dy * dy)
+    if length == 0:
+        return 0.0
+    # Dot product with the upward vertical vector [0, -1]
+    return clipped_acos_degrees(-dy / length)
+
+@jit
+def knee_valgus(hx, kx, ax):
+    """Frontal-plane angle between the thigh and shin vectors"""
+    knee_to_hip = hx - kx
+    knee_to_ankle = ax - kx
+    magnitude = abs(knee_to_hip) * abs(knee_to_ankle)
+    if magnitude == 0:
+        return 0.0
+    return clipped_acos_degrees((knee_to_hip * knee_to_ankle) / magnitude)
+
+@jit
+def bar_path_deviation(hx, hy, ax, ay):
+    """Horizontal hip-to-midfoot distance, normalized by hip-to-ankle height"""
+    height = abs(hy - ay)
+    if height == 0:
+        return 0.0
+    return abs(hx - ax) / height
+
+@jit
+def body_alignment(sx, sy, hx, hy, ax, ay):
+    """Mean squared error of the best-fit line through three points"""
+    x_mean = (sx + hx + ax) / 3
+    y_mean = (sy + hy + ay) / 3
+    dx0 = sx - x_mean
+    dx1 = hx - x_mean
+    dx2 = ax - x_mean
+    dy0 = sy - y_mean
+    dy1 = hy - y_mean
+    dy2 = ay - y_mean
+    sxx = dx0 * dx0 + dx1 * dx1 + dx2 * dx2
+    if sxx == 0:
+        return 0.0
+    slope = (dx0 * dy0 + dx1 * dy1 + dx2 * dy2) / sxx
+    r0 = dy0 - slope * dx0
+    r1 = dy1 - slope * dx1
+    r2 = dy2 - slope * dx2
+    return (r0 * r0 + r1 * r1 + r2 * r2) / 3
+
+@jit
+def frame_features(xy, row):
+    """Fill one feature row from the (x, y) coordinates of a frame's 33 landmarks"""
+    # Midline points
+    msx = (xy[11][0] + xy[12][0]) / 2
+    msy = (xy[11][1] + xy[12][1]) / 2
+    mhx = (xy[23][0] + xy[24][0]) / 2
+    mhy = (xy[23][1] + xy[24][1]) / 2
+    mkx = (xy[25][0] + xy[26][0]) / 2
+    mky = (xy[25][1] + xy[26][1]) / 2
+    max_ = (xy[27][0] + xy[28][0]) / 2
+    may = (xy[27][1] + xy[28][1]) / 2
+    neck_y = msy - 0.05
+
+    for side in range(2):
+        shoulder = xy[11 + side]
+        elbow = xy[13 + side]
+        wrist = xy[15 + side]
+        hip = xy[23 + side]
+        knee = xy[25 + side]
+        ankle = xy[27 + side]
+
+        row[0 + side] = joint_angle(hip[0], hip[1], knee[0], knee[1], ankle[0], ankle[1])
+        row[2 + side] = joint_angle(shoulder[0], shoulder[1], hip[0], hip[1], knee[0], knee[1])
+        row[4 + side] = joint_angle(shoulder[0], shoulder[1], elbow[0], elbow[1], wrist[0], wrist[1])
+        row[9 + side] = knee_projection(knee[0], knee[1], ankle[0], ankle[1])
+        row[11 + side] = torso_angle(shoulder[0], shoulder[1], hip[0], hip[1])
+        row[13 + side] = knee_valgus(hip[0], knee[0], ankle[0])
+        row[15 + 2 * side] = shoulder[0]
+        row[16 + 2 * side] = shoulder[1]
+
+    nose = xy[0]
+    row[6] = joint_angle(nose[0], nose[1], mhx, mhy, mkx, mky)
+    row[7] = joint_angle(msx, msy, mhx, mhy, mkx, mky)
+    row[8] = joint_angle(nose[0], nose[1], msx, neck_y, msx, msy)
+    row[19] = msx
+    row[20] = msy
+    row[21] = mhx
+    row[22] = mhy
+    row[23] = max_
+    row[24] = may
+    row[25] = bar_path_deviation(mhx, mhy, max_, may)
+    row[26] = body_alignment(msx, msy, mhx, mhy, max_, may)
+
+@jit
+def batch_features(xy, out):
+    """Fill one feature row per frame"""
+    for i in range(len(xy)):
+        frame_features(xy[i], out[i])
+
+def python_kernels():
+    """batch_features as plain Python: this file executed again as PYTHON_VARIANT"""
+    spec = importlib.util.spec_from_file_location(PYTHON_VARIANT, __file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.batch_features
+
+if __name__ != PYTHON_VARIANT:
+    # Plain Python kernels over nested lists
+    python_batch_features = python_kernels() if NUMBA_AVAILABLE else batch_features
+
+    # Compiled kernels over float64 arrays, when Numba is available
+    numba_batch_features = batch_features if NUMBA_AVAILABLE else None
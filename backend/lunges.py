@@ -2,53 +2,8 @@ import numpy as np
 from state import exercise_state
 from feedback_config import LUNGE_CONFIG, FEEDBACK_TO_JOINTS
 from score_config import calculate_rep_score
-
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
-
-def calculate_knee_projection(hip, knee, ankle):
-    """Calculate how far knee extends beyond toes (normalized by limb length)"""
-    # Convert to numpy arrays for vector math
-    hip = np.array(hip)
-    knee = np.array(knee)
-    ankle = np.array(ankle)
-    
-    # Get the ankle-to-knee vector direction
-    ankle_knee_vector = knee - ankle
-    ankle_knee_length = np.linalg.norm(ankle_knee_vector)
-    if ankle_knee_length == 0:  # Avoid division by zero
-        return 0
-    
-    # Project the knee point onto the vertical line from ankle
-    projection = ankle_knee_vector[0] / ankle_knee_length  # Normalized horizontal component
-    
-    return projection  # Positive means knee is forward of ankle
-
-def calculate_torso_angle(shoulder, hip):
-    """Calculate torso angle from vertical (0° is perfectly upright, 180° is inverted)"""
-    # Calculate the angle between the torso and the vertical axis
-    vertical_vector = np.array([0, -1])  # Upward vertical vector
-    torso_vector = np.array([shoulder[0] - hip[0], shoulder[1] - hip[1]])
-    
-    # Normalize the torso vector
-    torso_length = np.linalg.norm(torso_vector)
-    if torso_length == 0:  # Avoid division by zero
-        return 180
-    torso_vector = torso_vector / torso_length
-    
-    # Calculate angle using dot product
-    dot_product = np.dot(vertical_vector, torso_vector)
-    angle = np.arccos(np.clip(dot_product, -1.0, 1.0)) * 180.0 / np.pi
-    
-    # Convert to the 0-180 range where 180 is perfectly upright
-    return 180 - angle
+from geometry import landmarks_to_array, extract_features
+from metrics import NULL_STAGE_TIMER
 
 def process_landmarks(landmarks, tolerance, session_id=None):
     """
@@ -62,54 +17,64 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     Returns:
         Dictionary with processing results and feedback
     """
-    knee_angles = []
-    knee_projections = []
-    torso_angles = []
-    
-    # Extract left side landmarks
-    try:
-        left_shoulder = [landmarks[11]['x'], landmarks[11]['y']]
-        left_hip = [landmarks[23]['x'], landmarks[23]['y']]
-        left_knee = [landmarks[25]['x'], landmarks[25]['y']]
-        left_ankle = [landmarks[27]['x'], landmarks[27]['y']]
-        
-        left_angle = calculate_angle(left_hip, left_knee, left_ankle)
-        left_projection = calculate_knee_projection(left_hip, left_knee, left_ankle)
-        left_torso_angle = calculate_torso_angle(left_shoulder, left_hip)
-        
-        knee_angles.append(left_angle)
-        knee_projections.append(left_projection)
-        torso_angles.append(left_torso_angle)
-    except Exception:
-        pass
-    
-    # Extract right side landmarks
-    try:
-        right_shoulder = [landmarks[12]['x'], landmarks[12]['y']]
-        right_hip = [landmarks[24]['x'], landmarks[24]['y']]
-        right_knee = [landmarks[26]['x'], landmarks[26]['y']]
-        right_ankle = [landmarks[28]['x'], landmarks[28]['y']]
-        
-        right_angle = calculate_angle(right_hip, right_knee, right_ankle)
-        right_projection = calculate_knee_projection(right_hip, right_knee, right_ankle)
-        right_torso_angle = calculate_torso_angle(right_shoulder, right_hip)
-        
-        knee_angles.append(right_angle)
-        knee_projections.append(right_projection)
-        torso_angles.append(right_torso_angle)
-    except Exception:
-        pass
+    return process_landmarks_batch(landmarks_to_array(landmarks)[None], tolerance, session_id)[0]
 
-    if not knee_angles:
-        return {"error": "Insufficient landmarks data."}
+def process_landmarks_batch(frames, tolerance, session_id=None, frame_times=None, timer=None):
+    """
+    Process an ordered batch of frames for lunge form analysis.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4) from geometry.frames_to_array
+        tolerance: Tolerance threshold
+        session_id: Optional session ID for logging
+        frame_times: Optional per-frame timestamps (unused for lunges)
+        timer: Optional metrics.StageTimer the processing stages are charged to
+        
+    Returns:
+        List with the processing result of every frame, in order
+    """
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    
+    features = extract_features(frames)
+    
+    # Knee angle, knee projection and torso angle of each side, with the
+    # torso angle converted to the 0-180 range where 180 is perfectly upright
+    measurements = np.stack([
+        features.knee_angles,
+        features.knee_projections,
+        180 - features.torso_angles
+    ], axis=-1)
+    valid_sides = np.isfinite(measurements).all(axis=-1)
+    
+    timer.mark("geometry")
+    
+    results = []
+    # Frames of one session are evaluated in order, one request at a time
+    with exercise_state.lock(session_id):
+        for frame_sides, valid in zip(measurements.tolist(), valid_sides):
+            sides = [side for side, is_valid in zip(frame_sides, valid) if is_valid]
+            if not sides:
+                results.append({"error": "Insufficient landmarks data."})
+                continue
+            
+            # Regroup per-side values into per-measurement lists
+            measurement_lists = [list(values) for values in zip(*sides)]
+            results.append(_evaluate_frame(*measurement_lists, session_id, timer))
+    
+    return results
 
+def _evaluate_frame(knee_angles, knee_projections, torso_angles, session_id, timer):
+    """
+    Run rep counting, feedback and scoring for one frame of lunge measurements
+    """
     # Calculate averages
     avg_knee_angle = min(knee_angles)  # Use minimum (the most bent knee)
     avg_knee_projection = max(knee_projections)  # Use maximum (worst case)
     avg_torso_angle = sum(torso_angles) / len(torso_angles)
     
     # Retrieve the current state for lunges
-    state = exercise_state.get("lunges", {"counter": 0, "stage": "up", "feedback": "N/A"})
+    state = exercise_state.get((session_id, "lunges"), {"counter": 0, "stage": "up", "feedback": "N/A"})
     stage = state.get("stage", "up")
     counter = state.get("counter", 0)
     prev_counter = state.get("counter", 0)  # Store previous counter to detect rep completion
@@ -121,6 +86,8 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         stage = "down"
         counter += 1
 
+    timer.mark("state_machine")
+    
     # Generate detailed feedback
     feedback_flags = []
     
@@ -157,6 +124,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     
     # Log the rep if this is a new rep and we have a session ID
     if counter > prev_counter and session_id:
+        timer.mark("feedback")
         from session_state import record_rep
         metrics = {
             "knee_angle": avg_knee_angle,
@@ -164,6 +132,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
             "torso_angle": avg_torso_angle
         }
         record_rep(session_id, "lunges", feedback_flags, metrics)
+        timer.mark("record_rep")
     
     # Create affected joints and segments arrays for visualization
     affected_joints = []
@@ -211,5 +180,6 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         "affected_segments": affected_segments
     }
     
-    exercise_state["lunges"] = new_state
+    timer.mark("feedback")
+    exercise_state[(session_id, "lunges")] = new_state
     return new_state
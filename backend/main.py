@@ -1,19 +1,78 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+import json
 import time
 from typing import Optional
 
-# Import the process_landmarks functions
-from bicep_curls import process_landmarks as process_bicep_curls
-from deadlifts import process_landmarks as process_deadlifts
-from lunges import process_landmarks as process_lunges
-from pushups import process_landmarks as process_pushups
-from situps import process_landmarks as process_situps
-from squats import process_landmarks as process_squats
+from geometry import landmarks_to_array, frames_to_array
+from frame_codec import is_binary_content_type, decode_frames, FrameDecodeError
+from micro_batch import BatchQueueFull
+from deadlift_model import classify_frames_async, attach_predictions, get_model_stats
+from frame_analysis import EXERCISE_BATCH_PROCESSORS, reset_exercise_state as reset_state
+from executor import analysis_executor, executor_stats, io_queue_depth
+from session_journal import start_flusher, stop_flusher
+from metrics import (
+    StageTimer, NULL_STAGE_TIMER, observe_request, count_error, start_request, finish_request,
+    render_metrics
+)
+from profiler import profile_request
+
+# Optional model stages run after the rule-based analysis of an exercise
+EXERCISE_MODEL_STAGES = {
+    "deadlifts": classify_frames_async,
+}
+
+async def analyze_frames(exercise_name, frames, tolerance, session_id=None, frame_times=None,
+                         timer=None, profiled=None):
+    """
+    Analyze frames with an exercise's processor, then its model stage (if any).
+    
+    The rule-based analysis (see frame_analysis) runs on the configured
+    executor, off the event loop unless it is inline (see executor). Model
+    predictions from concurrent requests are batched by the model's
+    scheduler; when its queue is full the frames keep their rule-based
+    results only.
+    
+    The time of each step is charged to its stage of timer, if given (see
+    metrics).
+    """
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    results = await analysis_executor.analyze(
+        exercise_name, frames, tolerance, session_id, frame_times, timer, profiled
+    )
+    
+    model_stage = EXERCISE_MODEL_STAGES.get(exercise_name)
+    if model_stage is not None:
+        try:
+            attach_predictions(results, await model_stage(frames))
+        except BatchQueueFull:
+            count_error("model", "queue_full")
+        timer.mark("model")
+    return results
+
+def exercise_label(exercise_name):
+    """Exercise name as a metric label (unknown names all count as "unknown")"""
+    return exercise_name if exercise_name in EXERCISE_BATCH_PROCESSORS else "unknown"
+
+def error_response(endpoint, error_type, message, status_code):
+    """Count an error in the metrics and build its JSON response"""
+    count_error(endpoint, error_type)
+    return JSONResponse({"error": message}, status_code=status_code)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Executor worker processes start with the app rather than with its first frames
+    await analysis_executor.start()
+    start_flusher()
+    yield
+    analysis_executor.shutdown()
+    stop_flusher()
 
 # Create the FastAPI app
-app = FastAPI(title="ReGenix: Innovative Exercise Analysis API")
+app = FastAPI(title="ReGenix: Innovative Exercise Analysis API", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -27,10 +86,12 @@ app.add_middleware(
 # Uncomment the router imports to enable session reporting
 try:
     from routers.session_router import router as session_router
-    # from routers.reference_router import router as reference_router
+    from routers.admin_router import router as admin_router
+    from routers.reference_router import router as reference_router
     # Add routers
     app.include_router(session_router)
-    # app.include_router(reference_router)
+    app.include_router(admin_router)
+    app.include_router(reference_router)
 except ImportError:
     print("Router modules not available. Basic functionality only.")
 
@@ -47,86 +108,219 @@ async def process_exercise_landmarks(
 ):
     """Process landmarks for exercise analysis"""
     start_time = time.time()
+    timer = StageTimer()
+    start_request("landmarks", exercise_label(exercise_name))
+    profiled = profile_request(exercise_name)
     
     try:
-        data = await request.json()
-        landmarks = data.get("landmarks")
-        if not landmarks:
-            return JSONResponse({"error": "No landmarks provided"}, status_code=400)
+        if is_binary_content_type(request.headers.get("content-type")):
+            # Packed float32 frame, decoded straight into a landmark array
+            frames, _, header_session_id = decode_frames(await request.body())
+            timer.mark("decode")
+            if len(frames) != 1:
+                return error_response(
+                    "landmarks", "bad_frame_count",
+                    "Expected exactly one frame, use the batch endpoint for more", 400
+                )
+            session_id = header_session_id or session_id
+        else:
+            data = await request.json()
+            timer.mark("decode")
+            landmarks = data.get("landmarks")
+            if not landmarks:
+                return error_response("landmarks", "no_landmarks", "No landmarks provided", 400)
+            frames = landmarks_to_array(landmarks)[None]
+            timer.mark("extract")
         
         # Route the processing to the corresponding module
-        if exercise_name == "bicep_curls":
-            result = process_bicep_curls(landmarks, tolerance, session_id)
-        elif exercise_name == "deadlifts":
-            result = process_deadlifts(landmarks, tolerance, session_id)
-        elif exercise_name == "lunges":
-            result = process_lunges(landmarks, tolerance, session_id)
-        elif exercise_name == "pushups":
-            result = process_pushups(landmarks, tolerance, session_id)
-        elif exercise_name == "situps":
-            result = process_situps(landmarks, tolerance, session_id)
-        elif exercise_name == "squats":
-            result = process_squats(landmarks, tolerance, session_id)
-        else:
-            return JSONResponse({"error": "Exercise not found"}, status_code=404)
+        if exercise_name not in EXERCISE_BATCH_PROCESSORS:
+            return error_response("landmarks", "exercise_not_found", "Exercise not found", 404)
+        result = (await analyze_frames(
+            exercise_name, frames, tolerance, session_id, timer=timer, profiled=profiled
+        ))[0]
         
         # Add processing time
         processing_time = time.time() - start_time
         result["processing_time_ms"] = round(processing_time * 1000, 2)
         
-        return JSONResponse(result)
+        response = JSONResponse(result)
+        timer.mark("encode")
+        observe_request("landmarks", exercise_name, timer)
+        return response
+    except FrameDecodeError as e:
+        return error_response("landmarks", "decode_error", str(e), 400)
     except Exception as e:
-        return JSONResponse(
-            {"error": f"Processing error: {str(e)}"}, 
-            status_code=500
+        return error_response("landmarks", "processing_error", f"Processing error: {str(e)}", 500)
+    finally:
+        finish_request()
+        if profiled is not None:
+            profiled.end_request()
+
+@app.post("/landmarks/{exercise_name}/batch")
+async def process_exercise_landmarks_batch(
+    exercise_name: str,
+    request: Request,
+    tolerance: int = 10,
+    session_id: Optional[str] = None
+):
+    """Process an ordered batch of landmark frames for exercise analysis"""
+    start_time = time.time()
+    timer = StageTimer()
+    start_request("landmarks_batch", exercise_label(exercise_name))
+    profiled = profile_request(exercise_name)
+    
+    try:
+        if is_binary_content_type(request.headers.get("content-type")):
+            frame_array, timestamps, header_session_id = decode_frames(await request.body())
+            timer.mark("decode")
+            session_id = header_session_id or session_id
+        else:
+            data = await request.json()
+            timer.mark("decode")
+            frames = data.get("frames")
+            if not frames:
+                return error_response("landmarks_batch", "no_frames", "No frames provided", 400)
+            frame_array = frames_to_array([frame.get("landmarks") or [] for frame in frames])
+            timestamps = [frame.get("timestamp") for frame in frames]
+            timer.mark("extract")
+        
+        if exercise_name not in EXERCISE_BATCH_PROCESSORS:
+            return error_response("landmarks_batch", "exercise_not_found", "Exercise not found", 404)
+        
+        frame_times = get_frame_times(timestamps or [None] * len(frame_array), start_time)
+        results = await analyze_frames(
+            exercise_name, frame_array, tolerance, session_id, frame_times, timer, profiled
         )
+        
+        # Echo the client timestamps so results can be matched to frames
+        if timestamps:
+            for timestamp, result in zip(timestamps, results):
+                if timestamp is not None:
+                    result["timestamp"] = timestamp
+        
+        # Add processing time for the whole batch
+        processing_time = time.time() - start_time
+        response = JSONResponse({
+            "frame_count": len(results),
+            "results": results,
+            "processing_time_ms": round(processing_time * 1000, 2)
+        })
+        timer.mark("encode")
+        observe_request("landmarks_batch", exercise_name, timer)
+        return response
+    except FrameDecodeError as e:
+        return error_response("landmarks_batch", "decode_error", str(e), 400)
+    except Exception as e:
+        return error_response("landmarks_batch", "processing_error", f"Processing error: {str(e)}", 500)
+    finally:
+        finish_request()
+        if profiled is not None:
+            profiled.end_request()
 
-@app.post("/reset/{exercise_name}")
-async def reset_exercise_state(exercise_name: str):
-    """Reset the counter and state for an exercise"""
-    from state import exercise_state
+def get_frame_times(timestamps, received_time):
+    """
+    Map client frame timestamps (milliseconds) onto the server clock.
     
-    if exercise_name == "bicep_curls":
-        exercise_state["bicep_curls"] = {
-            "repCount": 0,
-            "stage": "down",
-            "feedback": "Ready to start new set",
-            "prev_shoulders": None
-        }
-    elif exercise_name == "deadlifts":
-        exercise_state["deadlifts"] = {
-            "repCount": 0, 
-            "stage": "up", 
-            "feedback": "Ready to start new set"
-        }
-    elif exercise_name == "lunges":
-        exercise_state["lunges"] = {
-            "counter": 0, 
-            "stage": "up", 
-            "feedback": "Ready to start new set"
-        }
-    elif exercise_name == "pushups":
-        exercise_state["pushups"] = {
-            "counter": 0, 
-            "stage": "up", 
-            "feedback": "Ready to start new set"
-        }
-    elif exercise_name == "situps":
-        exercise_state["situps"] = {
-            "counter": 0, 
-            "stage": "up", 
-            "feedback": "Ready to start new set"
-        }
-    elif exercise_name == "squats":
-        exercise_state["squats"] = {
-            "counter": 0,
-            "stage": "up",
-            "repCounted": False,
-            "currentMinKnee": None,
-            "currentMinTrunk": None,
-            "feedback": "Ready to start new set"
-        }
+    The last frame is anchored at the time the batch was received and the
+    client-side spacing between frames is preserved, so tempo analysis keeps
+    working when several frames arrive at once.
+    """
+    if not timestamps or any(ts is None for ts in timestamps):
+        return [received_time] * len(timestamps)
     
+    last_timestamp = timestamps[-1]
+    return [received_time - (last_timestamp - ts) / 1000.0 for ts in timestamps]
+
+@app.websocket("/ws/landmarks/{exercise_name}")
+async def stream_exercise_landmarks(
+    websocket: WebSocket,
+    exercise_name: str,
+    tolerance: int = 10,
+    session_id: Optional[str] = None
+):
+    """
+    Process a continuous stream of landmark frames over one connection.
+    
+    Each text message carries the same body as POST /landmarks/{exercise_name}
+    (optionally with its own "session_id" and a "frame_id" that is echoed back),
+    and each binary message carries one packed frame (see frame_codec).
+    Each reply is the result dict of the exercise module.
+    """
+    await websocket.accept()
+    
+    if exercise_name not in EXERCISE_BATCH_PROCESSORS:
+        count_error("websocket", "exercise_not_found")
+        await websocket.send_text(json.dumps({"error": "Exercise not found"}))
+        await websocket.close(code=1008)
+        return
+    
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            break
+        start_time = time.time()
+        timer = StageTimer()
+        start_request("websocket", exercise_name)
+        profiled = profile_request(exercise_name)
+        
+        try:
+            if message.get("bytes") is not None:
+                frames, timestamps, header_session_id = decode_frames(message["bytes"])
+                timer.mark("decode")
+                if len(frames) != 1:
+                    raise FrameDecodeError("Expected exactly one frame per message")
+                result = (await analyze_frames(
+                    exercise_name, frames, tolerance, header_session_id or session_id,
+                    timer=timer, profiled=profiled
+                ))[0]
+                if timestamps:
+                    result["timestamp"] = timestamps[0]
+            else:
+                data = json.loads(message["text"])
+                timer.mark("decode")
+                landmarks = data.get("landmarks")
+                if not landmarks:
+                    count_error("websocket", "no_landmarks")
+                    result = {"error": "No landmarks provided"}
+                else:
+                    frames = landmarks_to_array(landmarks)[None]
+                    timer.mark("extract")
+                    result = (await analyze_frames(
+                        exercise_name, frames, tolerance, data.get("session_id", session_id),
+                        timer=timer, profiled=profiled
+                    ))[0]
+                if "frame_id" in data:
+                    result["frame_id"] = data["frame_id"]
+            
+            # Add processing time
+            if "error" not in result:
+                processing_time = time.time() - start_time
+                result["processing_time_ms"] = round(processing_time * 1000, 2)
+        except FrameDecodeError as e:
+            count_error("websocket", "decode_error")
+            result = {"error": str(e)}
+        except Exception as e:
+            # Report the bad frame but keep the stream open
+            count_error("websocket", "processing_error")
+            result = {"error": f"Processing error: {str(e)}"}
+        
+        try:
+            reply = json.dumps(result)
+            timer.mark("encode")
+            if "error" not in result:
+                observe_request("websocket", exercise_name, timer)
+            await websocket.send_text(reply)
+        except WebSocketDisconnect:
+            break
+        finally:
+            finish_request()
+            if profiled is not None:
+                profiled.end_request()
+
+@app.post("/reset/{exercise_name}")
+async def reset_exercise_state(exercise_name: str, session_id: Optional[str] = None):
+    """Reset the counter and state for an exercise (of one session, if given)"""
+    await analysis_executor.run_for_session(session_id, reset_state, session_id, exercise_name)
     return {"message": f"Reset {exercise_name} state successfully"}
 
 @app.get("/status")
@@ -135,5 +329,26 @@ def status():
     return {
         "status": "operational",
         "version": "1.0.0",
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "model_batching": get_model_stats(),
+        "executor": executor_stats()
     }
+
+@app.get("/metrics")
+def metrics():
+    """Latency histograms, request and error counts in the Prometheus text format"""
+    gauges = {
+        "regenix_live_sessions": (
+            "Sessions holding real-time exercise state", analysis_executor.live_sessions()
+        ),
+        "regenix_executor_queue_depth": (
+            "Analysis tasks waiting for an executor worker", analysis_executor.queue_depth()
+        ),
+        "regenix_io_queue_depth": ("Disk tasks waiting for an I/O thread", io_queue_depth())
+    }
+    try:
+        from session_state import active_sessions
+        gauges["regenix_active_sessions"] = ("Recorded sessions held in memory", len(active_sessions))
+    except ImportError:
+        pass
+    return PlainTextResponse(render_metrics(gauges), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,273 @@
+"""
+Request Metrics
+---------------
+Per-stage latency histograms, request and error counters, rendered in the
+Prometheus text format for GET /metrics.
+
+Each analysis request carries a StageTimer that splits its wall time into
+consecutive stages (STAGES): every mark() charges the time since the
+previous mark to one stage. At the end of the request the per-stage totals
+are recorded in a LatencyHistogram per (exercise, stage).
+
+LatencyHistogram is HDR-style: values are counted in microsecond buckets
+that are exact below SUB_BUCKETS and then log-linear, SUB_BUCKETS / 2
+buckets per power of two, so recording is one integer bucket increment and
+any quantile is within 1 / SUB_BUCKETS (relative) of the true value.
+"""
+import threading
+import time
+
+# Stages of an analysis request, in order
+STAGES = (
+    "decode",          # Reading and parsing the request body
+    "extract",         # Landmark dicts to frame arrays (JSON bodies only)
+    "queue_wait",      # Waiting for an executor worker (see executor)
+    "lock_wait",       # Waiting for the session's state lock
+    "geometry",        # Vectorized joint angles and measurements
+    "state_machine",   # Rep counting and stage transitions
+    "feedback",        # Feedback flags, scoring and result assembly
+    "record_rep",      # Recording completed reps in the session
+    "motion_match",    # Reference motion matching and progress
+    "model",           # Model stage (deadlifts), including batching delay
+    "encode",          # Serializing the response
+)
+
+# Quantiles reported for every histogram
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Exact buckets below this many microseconds; relative bucket width above
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Longest recordable value (microseconds); longer values are clamped
+MAX_VALUE_US = (1 << 32) - 1
+
+def bucket_index(value):
+    """Bucket of a non-negative integer value"""
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+def bucket_bounds(index):
+    """Smallest and largest value counted in a bucket"""
+    if index < SUB_BUCKETS:
+        return index, index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    mantissa = index - (shift << (SUB_BUCKET_BITS - 1))
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+class LatencyHistogram:
+    """
+    Thread-safe log-linear histogram of durations.
+
+    Durations are recorded in seconds and stored in microsecond buckets.
+    """
+    def __init__(self):
+        self._counts = [0] * (bucket_index(MAX_VALUE_US) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Count one duration"""
+        value = int(seconds * 1e6)
+        if value >= SUB_BUCKETS:
+            if value > MAX_VALUE_US:
+                value = MAX_VALUE_US
+            shift = value.bit_length() - SUB_BUCKET_BITS
+            index = (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+        else:
+            index = value if value > 0 else 0
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantiles(self, quantiles=QUANTILES):
+        """
+        Estimated quantiles, in seconds.
+
+        Returns:
+            List with the value of each quantile (the midpoint of the bucket
+            it falls in, at most the largest recorded value); None if nothing
+            was recorded
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count, largest = self.count, self.max
+        if not count:
+            return None
+
+        values = {}
+        pending = sorted(quantiles)
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            while pending and seen >= pending[0] * count:
+                low, high = bucket_bounds(index)
+                values[pending.pop(0)] = min((low + high) / 2 / 1e6, largest)
+            if not pending:
+                break
+        return [values[quantile] for quantile in quantiles]
+
+class StageTimer:
+    """
+    Splits the time of one request into consecutive stages.
+
+    Not thread-safe: a timer belongs to a single request.
+    """
+    __slots__ = ("started", "last", "durations")
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.durations = {}
+
+    def mark(self, stage):
+        """Charge the time since the previous mark to a stage"""
+        now = time.perf_counter()
+        self.durations[stage] = self.durations.get(stage, 0.0) + (now - self.last)
+        self.last = now
+
+    def absorb(self, durations, rest_stage):
+        """
+        Charge stage durations measured by another timer (e.g. in a worker
+        process) since the previous mark, and the rest of that time to
+        rest_stage.
+        """
+        now = time.perf_counter()
+        rest = now - self.last
+        for stage, seconds in durations.items():
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+            rest -= seconds
+        self.durations[rest_stage] = self.durations.get(rest_stage, 0.0) + max(rest, 0.0)
+        self.last = now
+
+    def elapsed(self):
+        """Seconds from the start to the last mark"""
+        return self.last - self.started
+
+class NullStageTimer(StageTimer):
+    """Timer that records nothing, for callers outside a timed request"""
+    __slots__ = ()
+
+    def mark(self, stage):
+        pass
+
+    def absorb(self, durations, rest_stage):
+        pass
+
+NULL_STAGE_TIMER = NullStageTimer()
+
+# (exercise, stage) -> LatencyHistogram, and (endpoint, exercise) -> LatencyHistogram
+stage_histograms = {}
+request_histograms = {}
+
+# (endpoint, exercise) -> requests, and (endpoint, error type) -> errors
+request_counts = {}
+error_counts = {}
+in_flight_requests = 0
+
+_lock = threading.Lock()
+
+def _histogram(histograms, key):
+    histogram = histograms.get(key)
+    if histogram is None:
+        with _lock:
+            histogram = histograms.setdefault(key, LatencyHistogram())
+    return histogram
+
+def observe_request(endpoint, exercise, timer):
+    """Record the stage durations and total time of a finished request"""
+    for stage, seconds in timer.durations.items():
+        _histogram(stage_histograms, (exercise, stage)).record(seconds)
+    _histogram(request_histograms, (endpoint, exercise)).record(timer.elapsed())
+
+def count_error(endpoint, error_type):
+    """Count a failed request (or WebSocket message) by error type"""
+    with _lock:
+        error_counts[(endpoint, error_type)] = error_counts.get((endpoint, error_type), 0) + 1
+
+def start_request(endpoint, exercise):
+    """Count a request (or WebSocket message) and add it to the in-flight gauge"""
+    global in_flight_requests
+    with _lock:
+        request_counts[(endpoint, exercise)] = request_counts.get((endpoint, exercise), 0) + 1
+        in_flight_requests += 1
+
+def finish_request():
+    """Remove a request started with start_request from the in-flight gauge"""
+    global in_flight_requests
+    with _lock:
+        in_flight_requests -= 1
+
+def _labels(**labels):
+    """Prometheus label set, e.g. {exercise="squats",stage="decode"}"""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+def _render_summary(lines, name, help_text, histograms, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} summary")
+    for key, histogram in sorted(histograms.items()):
+        labels = dict(zip(label_names, key))
+        values = histogram.quantiles()
+        if values is None:
+            continue
+        for quantile, value in zip(QUANTILES, values):
+            lines.append(f"{name}{_labels(**labels, quantile=quantile)} {value:.9g}")
+        lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.9g}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+def _render_counter(lines, name, help_text, counts, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for key, count in sorted(counts.items()):
+        lines.append(f"{name}{_labels(**dict(zip(label_names, key)))} {count}")
+
+def render_metrics(gauges=None):
+    """
+    All metrics in the Prometheus text exposition format.
+
+    Args:
+        gauges: Optional dict of extra gauges, name -> (help text, value)
+
+    Returns:
+        The exposition text
+    """
+    with _lock:
+        stages = dict(stage_histograms)
+        totals = dict(request_histograms)
+        requests = dict(request_counts)
+        errors = dict(error_counts)
+        in_flight = in_flight_requests
+
+    lines = []
+    _render_summary(lines, "regenix_stage_latency_seconds",
+                    "Time spent in each analysis stage per request",
+                    stages, ("exercise", "stage"))
+    _render_summary(lines, "regenix_request_latency_seconds",
+                    "Time to analyze and encode a request",
+                    totals, ("endpoint", "exercise"))
+    _render_counter(lines, "regenix_requests_total",
+                    "Analysis requests and WebSocket messages received",
+                    requests, ("endpoint", "exercise"))
+    _render_counter(lines, "regenix_errors_total",
+                    "Failed analysis requests and WebSocket messages by error type",
+                    errors, ("endpoint", "type"))
+
+    all_gauges = {"regenix_in_flight_requests": ("Analysis requests being processed", in_flight)}
+    all_gauges.update(gauges or {})
+    for name, (help_text, value) in all_gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,160 @@
+"""
+Micro-Batching
+--------------
+Coalesces row-wise work (model inference) submitted by concurrent callers
+into one call per batch.
+
+AsyncMicroBatcher serves request handlers: it waits up to a few
+milliseconds for rows from concurrent requests, runs the batch function
+once on the concatenated rows on a worker thread, and resolves each
+request's future with its slice of the results.
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class BatchQueueFull(RuntimeError):
+    """Raised when a submission would push the queue past its depth limit"""
+
+class AsyncMicroBatcher:
+    """
+    asyncio scheduler that batches rows from concurrent requests.
+
+    Submissions are queued until max_batch_rows rows are waiting or the
+    oldest has waited max_wait_ms, then run as one batch_fn call on a worker
+    thread (one batch at a time) without blocking the event loop. Each
+    submission's future gets its own slice of the results.
+
+    Args:
+        batch_fn: Function mapping an (n, features) array to n result rows
+        max_batch_rows: Rows that trigger a batch without waiting
+        max_wait_ms: Longest time a submission waits for a batch to fill
+        max_queue_rows: Limit on the rows queued or in batches not yet finished;
+            beyond it submit raises BatchQueueFull
+        name: Worker thread name prefix
+    """
+    def __init__(self, batch_fn, max_batch_rows=256, max_wait_ms=2.0, max_queue_rows=1024,
+                 name="async-micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_rows = max_queue_rows
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._queue = deque()   # (rows, future, submit time)
+        self._queued_rows = 0      # Rows not yet in a batch
+        self._in_flight_rows = 0   # Rows of batches started but not finished
+        self._timer = None
+        self._started = time.perf_counter()
+        self.batches = 0
+        self.rows = 0
+        self.max_rows_seen = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.submissions = 0
+        self.inference_total = 0.0
+        self.inference_max = 0.0
+
+    async def submit(self, rows):
+        """
+        Queue rows for batched evaluation and wait for their results.
+
+        Args:
+            rows: Array of shape (n, features)
+
+        Returns:
+            The n result rows for these rows
+        """
+        loop = asyncio.get_running_loop()
+        # Batches wait for the worker thread in the executor's queue, so rows
+        # count against the limit until their batch has finished. A single
+        # oversized submission is still accepted when nothing is pending.
+        pending_rows = self._queued_rows + self._in_flight_rows
+        if pending_rows and pending_rows + len(rows) > self.max_queue_rows:
+            self.rejected += 1
+            raise BatchQueueFull(f"{pending_rows} rows already pending")
+
+        future = loop.create_future()
+        self._queue.append((rows, future, time.perf_counter()))
+        self._queued_rows += len(rows)
+        self._dispatch(loop, flush=False)
+        return await future
+
+    def _dispatch(self, loop, flush=True):
+        """Start full batches (every queued row if flush), re-arming the wait timer for the rest"""
+        if flush and self._timer is not None:
+            self._timer.cancel()
+        if flush:
+            self._timer = None
+
+        while self._queue and (flush or self._queued_rows >= self.max_batch_rows):
+            batch = [self._queue.popleft()]
+            size = len(batch[0][0])
+            while self._queue and size + len(self._queue[0][0]) <= self.max_batch_rows:
+                submission = self._queue.popleft()
+                batch.append(submission)
+                size += len(submission[0])
+            self._queued_rows -= size
+            self._in_flight_rows += size
+            loop.create_task(self._run_batch(loop, batch, size))
+
+        if self._queue and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch, loop)
+
+    async def _run_batch(self, loop, batch, size):
+        started = time.perf_counter()
+        for _, _, submitted in batch:
+            waited = started - submitted
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+        self.submissions += len(batch)
+
+        try:
+            rows = batch[0][0] if len(batch) == 1 else np.concatenate([rows for rows, _, _ in batch])
+            results = await loop.run_in_executor(self._executor, self.batch_fn, rows)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight_rows -= size
+
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.rows += size
+        self.max_rows_seen = max(self.max_rows_seen, size)
+        self.inference_total += elapsed
+        self.inference_max = max(self.inference_max, elapsed)
+
+        offset = 0
+        for rows, future, _ in batch:
+            if not future.done():
+                future.set_result(results[offset:offset + len(rows)])
+            offset += len(rows)
+
+    def stats(self):
+        """Batch size, latency and throughput counters"""
+        uptime = time.perf_counter() - self._started
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "average_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_rows": self.max_rows_seen,
+            "queued_rows": self._queued_rows,
+            "in_flight_rows": self._in_flight_rows,
+            "rejected": self.rejected,
+            "average_queue_wait_ms": round(self.queue_wait_total / self.submissions * 1000, 3) if self.submissions else 0.0,
+            "max_queue_wait_ms": round(self.queue_wait_max * 1000, 3),
+            "average_batch_ms": round(self.inference_total / self.batches * 1000, 3) if self.batches else 0.0,
+            "max_batch_ms": round(self.inference_max * 1000, 3),
+            "rows_per_second": round(self.rows / uptime, 1) if uptime > 0 else 0.0,
+            "config": {
+                "max_batch_rows": self.max_batch_rows,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_queue_rows": self.max_queue_rows
+            }
+        }
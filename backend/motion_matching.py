@@ -0,0 +1,290 @@
+"""
+Motion Matching
+---------------
+Compares each live rep with the ideal joint-angle curve of its exercise
+(reference_poses.REFERENCE_ANGLES) by streaming dynamic time warping.
+
+The reference rep is the joint's curve from start to end angle followed by
+its mirror back to the start, sampled REFERENCE_SAMPLES times per phase.
+Live angles are matched one frame at a time: StreamingDTW keeps only the
+previous frame's row of the DTW matrix, restricted to a window of
+2 * DTW_BAND + 1 reference positions around the best match so far, so each
+frame costs O(band) no matter how long the rep is. Each cell carries the
+cost and length of its best path split by phase, so the per-phase scores
+need no traceback.
+
+Until the rep leaves its resting stage the path may start at any frame,
+so standing (or lying) still before a rep is not part of the match. The
+rep is scored when the exercise's stage returns to rest.
+"""
+import numpy as np
+
+from reference_poses import REFERENCE_ANGLES, interpolate_angle, estimate_progress
+from ttl_cache import TTLCache
+from state import MAX_LIVE_SESSIONS
+
+# Reference samples per phase and half width of the DTW window
+REFERENCE_SAMPLES = 25
+DTW_BAND = 8
+
+# Mean angle error (degrees) at which the similarity reaches 0
+DTW_COST_SCALE = 30.0
+
+# Idle seconds after which a session's matcher starts over, as exercise_state does
+MATCHER_IDLE_TTL = 10
+
+# Per exercise: reference joint, result field holding the live angle,
+# resting stage, and the names of the two phases
+MOTION_REFERENCES = {
+    "squats": {"joint": "knee", "angle": "currentMinKnee", "rest_stage": "up",
+               "phases": ("descent", "ascent")},
+    "deadlifts": {"joint": "hip", "angle": "hipAngle", "rest_stage": "up",
+                  "phases": ("descent", "lift")},
+    "pushups": {"joint": "elbow", "angle": "elbowAngle", "rest_stage": "up",
+                "phases": ("descent", "press")},
+    "lunges": {"joint": "front_knee", "angle": "kneeAngle", "rest_stage": "up",
+               "phases": ("descent", "ascent")},
+    "situps": {"joint": "hip", "angle": "hipAngle", "rest_stage": "down",
+               "phases": ("curl_up", "lower")},
+    "bicep_curls": {"joint": "elbow", "angle": "avg_angle", "rest_stage": "down",
+                    "phases": ("curl", "lower")},
+}
+
+def reference_curve(exercise, samples=REFERENCE_SAMPLES):
+    """
+    Joint angles of a whole reference rep.
+
+    Returns:
+        List of 2 * samples - 1 angles: the way out, then the way back
+    """
+    start_angle, end_angle, mid_ratio = REFERENCE_ANGLES[exercise][MOTION_REFERENCES[exercise]["joint"]]
+    way_out = interpolate_angle(start_angle, end_angle, np.linspace(0.0, 1.0, samples), mid_ratio)
+    return way_out.tolist() + way_out[-2::-1].tolist()
+
+def similarity(cost, steps):
+    """0-100 score for a mean angle error of cost / steps"""
+    if not steps:
+        return None
+    return round(max(0.0, 1.0 - cost / steps / DTW_COST_SCALE) * 100, 1)
+
+# Cell a path starts from
+START_CELL = (0.0, 0, 0.0, 0)
+
+class StreamingDTW:
+    """
+    Banded, incremental DTW of a live sequence against a fixed reference
+    made of two phases.
+
+    The window of the next frame is centred on the best match (lowest mean
+    cost) of the current frame among the positions of the current phase:
+    the reference returns through the same values, so without the phase a
+    match on the way back could be mistaken for one on the way out.
+
+    Args:
+        reference: Reference values
+        band: Half width of the window of reference positions per frame
+        phase_split: Reference position where the second phase starts
+    """
+    def __init__(self, reference, band=DTW_BAND, phase_split=None):
+        self.reference = list(reference)
+        self.band = band
+        self.phase_split = len(self.reference) if phase_split is None else phase_split
+        self.reset()
+
+    def reset(self):
+        """Forget the current match"""
+        # Last row: cells for reference positions lo, lo + 1, ... as
+        # (cost, steps, first phase cost, first phase steps) of their best path
+        self._lo = 0
+        self._row = []
+        self._best = 0
+        self.frames = 0
+
+    def push(self, value, second_phase=False, free_start=False):
+        """
+        Add the next live value.
+
+        Args:
+            value: Live value
+            second_phase: Whether the live motion is past the turning point
+            free_start: Let the match (re)start at this value
+        """
+        reference = self.reference
+        last = len(reference) - 1
+        previous, previous_lo = self._row, self._lo
+        if previous:
+            centre = previous_lo + self._best
+            lo = max(previous_lo, centre - self.band)
+            hi = min(last, centre + self.band)
+            # While starts are free, a value nearest the reference start
+            # drops the match (e.g. after an aborted rep)
+            if free_start and lo > 0 and abs(value - reference[0]) <= min(
+                    abs(value - reference[j]) for j in range(lo, hi + 1)):
+                previous = []
+        if not previous:
+            lo, hi = 0, min(last, self.band)
+            free_start = True
+
+        row = []
+        origin = None
+        n_previous = len(previous)
+        for j in range(lo, hi + 1):
+            # Predecessors: this position one frame back, the previous
+            # position one frame back, and the previous position this frame
+            # (every position of the window has at least one of them)
+            k = j - previous_lo
+            left = origin
+            origin = previous[k] if 0 <= k < n_previous else None
+            if 0 < k <= n_previous:
+                candidate = previous[k - 1]
+                if origin is None or candidate[0] < origin[0]:
+                    origin = candidate
+            if left is not None and (origin is None or left[0] < origin[0]):
+                origin = left
+            if j == 0 and free_start:
+                origin = START_CELL
+
+            cost = abs(value - reference[j])
+            if j < self.phase_split:
+                origin = (origin[0] + cost, origin[1] + 1, origin[2] + cost, origin[3] + 1)
+            else:
+                origin = (origin[0] + cost, origin[1] + 1, origin[2], origin[3])
+            row.append(origin)
+
+        # Best match of this frame within its phase (the turning point
+        # belongs to both phases)
+        if second_phase:
+            first = max(lo, self.phase_split - 1)
+            candidates = range(first - lo, len(row)) if first <= hi else range(len(row))
+        else:
+            candidates = range(0, min(len(row), self.phase_split - lo))
+            if not candidates:
+                candidates = range(len(row))
+        self._best = min(candidates, key=lambda i: row[i][0] / row[i][1])
+        self._row, self._lo = row, lo
+        self.frames += 1
+
+    def result(self):
+        """
+        Match of the live sequence so far against the reference.
+
+        The path ends at the end of the reference if the window has reached
+        it, otherwise at the best match of the last frame.
+
+        Returns:
+            Dict with the cost and length of the path, the (cost, steps) of
+            each phase, and the reference position it ends at; None before
+            the first value
+        """
+        row = self._row
+        if not row:
+            return None
+        end = len(row) - 1 if self._lo + len(row) == len(self.reference) else self._best
+        cost, steps, first_cost, first_steps = row[end]
+        return {
+            "cost": cost,
+            "steps": steps,
+            "phase_costs": ((first_cost, first_steps), (cost - first_cost, steps - first_steps)),
+            "position": self._lo + end
+        }
+
+class RepMatcher:
+    """
+    Streaming DTW of one exercise's reps for one session.
+
+    Args:
+        exercise: Exercise name (a key of MOTION_REFERENCES)
+    """
+    def __init__(self, exercise):
+        self.config = MOTION_REFERENCES[exercise]
+        reference = reference_curve(exercise)
+        self.dtw = StreamingDTW(reference, phase_split=REFERENCE_SAMPLES)
+        self.started = False
+
+    def update(self, angle, stage):
+        """
+        Feed one frame's angle and stage.
+
+        Returns:
+            Rep match dict when this frame completes a rep, otherwise None
+        """
+        angle = float(angle)
+        at_rest = stage == self.config["rest_stage"]
+        completed = self.started and at_rest
+        if not at_rest:
+            self.started = True
+        self.dtw.push(angle, second_phase=self.started, free_start=not self.started)
+        if not completed:
+            return None
+
+        match = self.dtw.result()
+        self.dtw.reset()
+        self.started = False
+        # The closing frame may also start the next rep
+        self.dtw.push(angle, free_start=True)
+        # A rep that never reached the turning point of the reference is not scored
+        if match is None or match["position"] < REFERENCE_SAMPLES:
+            return None
+
+        coverage = (match["position"] + 1) / len(self.dtw.reference)
+        overall = similarity(match["cost"], match["steps"])
+        return {
+            "similarity": round(overall * coverage, 1),
+            "coverage": round(coverage, 3),
+            "phases": {
+                name: similarity(*phase_cost)
+                for name, phase_cost in zip(self.config["phases"], match["phase_costs"])
+            }
+        }
+
+# Live matchers: (session_id, exercise) -> RepMatcher
+rep_matchers = TTLCache(max_entries=MAX_LIVE_SESSIONS, ttl=MATCHER_IDLE_TTL)
+
+def match_reps(exercise, session_id, results):
+    """
+    Feed analyzed frames to the session's matcher, adding a "motion_match"
+    block to each result that completes a rep.
+
+    Call with the session's exercise_state lock held, so frames are fed in
+    the order they were analyzed.
+    """
+    config = MOTION_REFERENCES.get(exercise)
+    if config is None:
+        return
+    key = (session_id, exercise)
+    matcher = rep_matchers.get(key)
+    if matcher is None:
+        matcher = rep_matchers[key] = RepMatcher(exercise)
+
+    for result in results:
+        angle = result.get(config["angle"])
+        if "error" in result or angle is None:
+            continue
+        match = matcher.update(angle, result.get("stage"))
+        if match is not None:
+            result["motion_match"] = match
+
+def attach_progress(exercise, results):
+    """
+    Add "reference_progress" to each analyzed frame: the progress (0-1)
+    whose reference angle matches the live angle of the exercise's main
+    joint, i.e. the reference frame to overlay.
+    """
+    config = MOTION_REFERENCES.get(exercise)
+    if config is None:
+        return
+    analyzed = [
+        result for result in results
+        if "error" not in result and result.get(config["angle"]) is not None
+    ]
+    if not analyzed:
+        return
+    angles = [result[config["angle"]] for result in analyzed]
+    progress = estimate_progress(exercise, config["joint"], angles)
+    for result, value in zip(analyzed, progress.tolist()):
+        result["reference_progress"] = round(value, 3)
+
+def reset_reps(session_id, exercise=None):
+    """Drop a session's matchers (of one exercise, or all)"""
+    for name in [exercise] if exercise else MOTION_REFERENCES:
+        rep_matchers.pop((session_id, name))
@@ -0,0 +1,273 @@
+"""
+Sampling Profiler
+-----------------
+On-demand statistical profiler for the landmark analysis endpoints.
+
+A capture is started for a number of seconds and/or for the next N
+analysis requests (optionally of one exercise only). While it runs, a
+background thread wakes every interval, reads the Python stacks of the
+threads currently serving a profiled request (sys._current_frames) and
+counts each distinct stack. Requests on the event loop share its thread,
+so samples taken while a profiled request is waiting may show other work
+of that thread. Executor threads analyzing a profiled request's frames
+are sampled too (enter_thread); worker processes are not.
+
+When no capture is running there is no sampling thread, and the
+per-request hook (profile_request) is a single check of a module global,
+so the profiler can stay in production builds.
+
+The last capture can be exported as collapsed stacks (one
+"frame;frame;frame count" line per stack, for flamegraph.pl and similar
+tools) or as a speedscope file (https://www.speedscope.app).
+"""
+import os
+import sys
+import threading
+import time
+
+PROFILER_INTERVAL_MS = float(os.environ.get("REGENIX_PROFILER_INTERVAL_MS", 5))
+
+# Bounds of a capture
+MAX_CAPTURE_SECONDS = 300
+MAX_CAPTURE_REQUESTS = 100000
+MAX_STACK_DEPTH = 128
+
+# Running capture (None when the profiler is off) and the last one started
+active_capture = None
+last_capture = None
+
+_lock = threading.Lock()
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a capture is started while another one is running"""
+
+def _frame_key(code):
+    """(function, file, first line) identifying a stack frame"""
+    return (code.co_name, code.co_filename, code.co_firstlineno)
+
+def frame_label(key):
+    """Short readable name of a frame, e.g. push (backend/motion_matching.py:103)"""
+    name, filename, line = key
+    path = "/".join(filename.replace("\\", "/").split("/")[-2:])
+    return f"{name} ({path}:{line})"
+
+class ProfileCapture:
+    """
+    One profiling run.
+
+    Args:
+        seconds: Stop after this many seconds (at most MAX_CAPTURE_SECONDS)
+        requests: Stop after this many profiled requests (None for no limit)
+        exercise: Only profile requests for this exercise (None for all)
+        interval_ms: Sampling interval in milliseconds
+    """
+    def __init__(self, seconds=None, requests=None, exercise=None, interval_ms=PROFILER_INTERVAL_MS):
+        self.seconds = min(seconds or MAX_CAPTURE_SECONDS, MAX_CAPTURE_SECONDS)
+        self.max_requests = requests
+        self.exercise = exercise
+        self.interval = interval_ms / 1000.0
+        self.started_at = None
+        self.finished_at = None
+        self.requests_started = 0
+        self.requests_finished = 0
+        self.samples = 0
+        # Stack (tuple of frame keys, outermost first) -> samples
+        self.stacks = {}
+        # Thread ident -> number of profiled requests it is serving
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self.finished_at is None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="regenix-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """End the capture (returns once the sampling thread has exited)"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def begin_request(self, exercise):
+        """
+        Register a request on the calling thread.
+
+        Returns:
+            True if the request is profiled (end_request must follow)
+        """
+        if self.exercise is not None and exercise != self.exercise:
+            return False
+        with self._lock:
+            if self._stop.is_set() or (
+                    self.max_requests is not None and self.requests_started >= self.max_requests):
+                return False
+            self.requests_started += 1
+            self._add_thread()
+        return True
+
+    def end_request(self):
+        """Unregister a profiled request started on the calling thread"""
+        with self._lock:
+            self._remove_thread()
+            self.requests_finished += 1
+            done = self.max_requests is not None and self.requests_finished >= self.max_requests
+        if done:
+            self._stop.set()
+
+    def enter_thread(self):
+        """
+        Sample the calling thread as well, while it works for a profiled
+        request (e.g. an executor thread, see executor); exit_thread must follow.
+        """
+        with self._lock:
+            self._add_thread()
+
+    def exit_thread(self):
+        with self._lock:
+            self._remove_thread()
+
+    def _add_thread(self):
+        ident = threading.get_ident()
+        self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def _remove_thread(self):
+        ident = threading.get_ident()
+        remaining = self._threads.get(ident, 0) - 1
+        if remaining > 0:
+            self._threads[ident] = remaining
+        else:
+            self._threads.pop(ident, None)
+
+    def _run(self):
+        global active_capture
+        deadline = time.monotonic() + self.seconds
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            with self._lock:
+                idents = [ident for ident in self._threads if ident != own_ident]
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                stack = tuple(reversed(stack))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+            del frames
+
+        self.finished_at = time.time()
+        with _lock:
+            if active_capture is self:
+                active_capture = None
+
+    def status(self):
+        """Progress and settings of the capture"""
+        end = self.finished_at or time.time()
+        return {
+            "running": self.running,
+            "exercise": self.exercise,
+            "seconds": self.seconds,
+            "max_requests": self.max_requests,
+            "interval_ms": self.interval * 1000.0,
+            "started_at": self.started_at,
+            "elapsed_seconds": round(end - self.started_at, 3) if self.started_at else 0.0,
+            "requests_profiled": self.requests_started,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks)
+        }
+
+    def collapsed(self):
+        """Collapsed stacks text, heaviest stack first"""
+        # Copied first, as the sampling thread may still be adding stacks
+        stacks = dict(self.stacks)
+        lines = [
+            ";".join(frame_label(key) for key in stack) + f" {count}"
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1])
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def speedscope(self):
+        """Capture as a speedscope sampled profile (a JSON-serializable dict)"""
+        frame_index = {}
+        samples, weights = [], []
+        for stack, count in dict(self.stacks).items():
+            samples.append([frame_index.setdefault(key, len(frame_index)) for key in stack])
+            weights.append(count * self.interval)
+        name = f"ReGenix {self.exercise or 'all exercises'}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {
+                "frames": [
+                    {"name": key[0], "file": key[1], "line": key[2]}
+                    for key in frame_index
+                ]
+            },
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }],
+            "name": name,
+            "exporter": "regenix-profiler"
+        }
+
+def start_capture(seconds=None, requests=None, exercise=None, interval_ms=PROFILER_INTERVAL_MS):
+    """
+    Start a capture (see ProfileCapture).
+
+    Raises:
+        ProfilerBusy: If a capture is already running
+    """
+    global active_capture, last_capture
+    with _lock:
+        if active_capture is not None:
+            raise ProfilerBusy("A profiler capture is already running")
+        capture = ProfileCapture(seconds, requests, exercise, interval_ms)
+        capture.start()
+        active_capture = last_capture = capture
+    return capture
+
+def stop_capture():
+    """Stop the running capture, if any, and return the last capture (or None)"""
+    capture = active_capture
+    if capture is not None:
+        capture.stop()
+    return last_capture
+
+def get_last_capture():
+    """The running capture, or the last one that ran (None if none has)"""
+    return last_capture
+
+def last_capture_status():
+    """Status of the last capture, or {"running": False} if none has run"""
+    capture = last_capture
+    return capture.status() if capture is not None else {"running": False}
+
+def profile_request(exercise):
+    """
+    Per-request hook: register the request with the running capture.
+
+    Returns:
+        The capture profiling the request (call its end_request when the
+        request is done), or None
+    """
+    capture = active_capture
+    if capture is None or not capture.begin_request(exercise):
+        return None
+    return capture
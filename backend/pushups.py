@@ -1,86 +1,62 @@
 import numpy as np
-import mediapipe as mp
 from state import exercise_state
 from feedback_config import PUSHUP_CONFIG, FEEDBACK_TO_JOINTS
 from score_config import calculate_rep_score
-
-def calculate_angle(a, b, c):
-    a = np.array(a)  # First point (shoulder)
-    b = np.array(b)  # Mid point (elbow)
-    c = np.array(c)  # End point (wrist)
-    
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    
-    if angle > 180.0:
-        angle = 360 - angle
-    return angle
-
-def check_body_alignment(shoulder, hip, ankle):
-    """Check if body is in a straight line during pushup"""
-    points = np.array([shoulder, hip, ankle])
-    
-    # Calculate the best-fit line through the points
-    x = points[:, 0]
-    y = points[:, 1]
-    
-    if len(set(x)) <= 1:  # Avoid division by zero if points are vertical
-        return 0  # Perfect alignment
-    
-    # Calculate line of best fit
-    coeffs = np.polyfit(x, y, 1)
-    line_y = np.polyval(coeffs, x)
-    
-    # Calculate mean squared error as a measure of alignment
-    mse = np.mean((y - line_y) ** 2)
-    return mse  # Lower is better (closer to a straight line)
-
-# Setup MediaPipe Pose for landmark indexing
-mp_pose = mp.solutions.pose
+from geometry import landmarks_to_array, extract_features
+from metrics import NULL_STAGE_TIMER
 
 def process_landmarks(landmarks, tolerance, session_id=None):
     """
     Process landmarks for pushup form analysis with enhanced feedback
     """
-    try:
-        # Extract landmarks
-        left_shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                        landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        right_shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                         landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-        left_elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        right_elbow = [landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].x,
-                      landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].y]
-        left_wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        right_wrist = [landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].x,
-                      landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].y]
-        left_hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        right_hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x,
-                    landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-        left_ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        right_ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x,
-                      landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-    except Exception:
-        return {"error": "Insufficient landmarks data."}
-    
-    # Calculate elbow angles
-    left_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-    right_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-    avg_elbow_angle = (left_angle + right_angle) / 2
-    
-    # Calculate body alignment (shoulder-hip-ankle)
-    mid_shoulder = [(left_shoulder[0] + right_shoulder[0])/2, (left_shoulder[1] + right_shoulder[1])/2]
-    mid_hip = [(left_hip[0] + right_hip[0])/2, (left_hip[1] + right_hip[1])/2]
-    mid_ankle = [(left_ankle[0] + right_ankle[0])/2, (left_ankle[1] + right_ankle[1])/2]
-    
-    alignment_score = check_body_alignment(mid_shoulder, mid_hip, mid_ankle)
-    
+    return process_landmarks_batch(landmarks_to_array(landmarks)[None], tolerance, session_id)[0]
+
+def process_landmarks_batch(frames, tolerance, session_id=None, frame_times=None, timer=None):
+    """
+    Process an ordered batch of frames for pushup form analysis.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4) from geometry.frames_to_array
+        tolerance: Tolerance threshold
+        session_id: Optional session ID for logging
+        frame_times: Optional per-frame timestamps (unused for pushups)
+        timer: Optional metrics.StageTimer the processing stages are charged to
+        
+    Returns:
+        List with the processing result of every frame, in order
+    """
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    
+    features = extract_features(frames)
+    
+    avg_elbow_angles = features.elbow_angles.mean(axis=-1)
+    alignment_scores = features.body_alignment
+    # Y increases downward, so a smaller hip y means the hips are raised
+    hips_raised = features.mid_hip[..., 1] < (features.mid_shoulder[..., 1] + features.mid_ankle[..., 1])/2
+    valid_frames = np.isfinite(avg_elbow_angles) & np.isfinite(alignment_scores)
+    
+    timer.mark("geometry")
+    
+    results = []
+    # Frames of one session are evaluated in order, one request at a time
+    with exercise_state.lock(session_id):
+        for avg_elbow_angle, alignment_score, raised, valid in zip(
+            avg_elbow_angles.tolist(), alignment_scores.tolist(), hips_raised.tolist(), valid_frames
+        ):
+            if not valid:
+                results.append({"error": "Insufficient landmarks data."})
+                continue
+            results.append(_evaluate_frame(avg_elbow_angle, alignment_score, raised, session_id, timer))
+    
+    return results
+
+def _evaluate_frame(avg_elbow_angle, alignment_score, hips_raised, session_id, timer):
+    """
+    Run rep counting, feedback and scoring for one frame of pushup measurements
+    """
     # Retrieve or initialize pushup state
-    state = exercise_state.get("pushups", {"counter": 0, "stage": "up", "feedback": "N/A"})
+    state = exercise_state.get((session_id, "pushups"), {"counter": 0, "stage": "up", "feedback": "N/A"})
     stage = state.get("stage", "up")
     counter = state.get("counter", 0)
     
@@ -91,6 +67,8 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         stage = "down"
         counter += 1
     
+    timer.mark("state_machine")
+    
     # Generate detailed feedback
     feedback = []
     
@@ -106,7 +84,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     # Check body alignment
     if alignment_score > PUSHUP_CONFIG["ALIGNMENT_THRESHOLD"]:
         # Determine if hips are too high or too low
-        if mid_hip[1] < (mid_shoulder[1] + mid_ankle[1])/2:  # Y increases downward
+        if hips_raised:
             feedback.append(PUSHUP_CONFIG["FEEDBACK"]["HIPS_TOO_HIGH"])
         else:
             feedback.append(PUSHUP_CONFIG["FEEDBACK"]["HIPS_TOO_LOW"])
@@ -123,6 +101,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     
     # Log the rep if this is a new rep and we have a session ID
     if counter > state.get("counter", 0) and session_id:
+        timer.mark("feedback")
         try:
             from session_state import record_rep
             metrics = {
@@ -133,6 +112,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         except ImportError:
             # Session state module not available, continue without logging
             pass
+        timer.mark("record_rep")
     
     # Create affected joints and segments arrays for visualization
     affected_joints = []
@@ -184,5 +164,6 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         "affected_segments": affected_segments
     }
     
-    exercise_state["pushups"] = new_state
+    timer.mark("feedback")
+    exercise_state[(session_id, "pushups")] = new_state
     return new_state
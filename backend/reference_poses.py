@@ -87,23 +87,35 @@ def interpolate_angle(start_angle, end_angle, progress, mid_ratio=0.5):
     Args:
         start_angle: Starting angle in degrees
         end_angle: Ending angle in degrees
-        progress: Progress from 0.0 to 1.0
+        progress: Progress from 0.0 to 1.0, or an array of progress values
         mid_ratio: Controls the steepness of the easing curve
     
     Returns:
-        Interpolated angle
+        Interpolated angle (an array for array progress)
     """
-    # Use a sigmoid-like easing function for natural movement
+    if np.ndim(progress):
+        # Same curve, both halves evaluated for the whole array
+        first_half = progress < mid_ratio
+        t = np.where(first_half, progress / mid_ratio, (progress - mid_ratio) / (1.0 - mid_ratio))
+        factor = np.where(
+            first_half,
+            mid_ratio * t * t * (3.0 - 2.0 * t),
+            mid_ratio + (1.0 - mid_ratio) * (1.0 - (1.0 - t) * (1.0 - t))
+        )
+        return start_angle + (end_angle - start_angle) * factor
+    
+    # Use a sigmoid-like easing function for natural movement; the first
+    # half covers mid_ratio of the motion, the second half the rest
     if progress < mid_ratio:
         # Scale to [0, 1] within first half
         t = progress / mid_ratio
         # Ease-in function
-        factor = t * t * (3.0 - 2.0 * t)
+        factor = mid_ratio * t * t * (3.0 - 2.0 * t)
     else:
         # Scale to [0, 1] within second half
         t = (progress - mid_ratio) / (1.0 - mid_ratio)
         # Ease-out function
-        factor = 1.0 - (1.0 - t) * (1.0 - t)
+        factor = mid_ratio + (1.0 - mid_ratio) * (1.0 - (1.0 - t) * (1.0 - t))
     
     return start_angle + (end_angle - start_angle) * factor
 
@@ -113,10 +125,10 @@ def calculate_reference_angles(exercise, progress):
     
     Args:
         exercise: Exercise type string
-        progress: Progress from 0.0 (start) to 1.0 (end)
+        progress: Progress from 0.0 (start) to 1.0 (end), or an array of progress values
     
     Returns:
-        Dictionary of joint angles
+        Dictionary of joint angles (arrays for array progress)
     """
     if exercise not in REFERENCE_ANGLES:
         return {}
@@ -168,23 +180,33 @@ def calibrate_user_skeleton(landmarks):
         "keypoints": user_keypoints
     }
 
-def get_reference_skeleton(exercise, progress, calibration=None):
+def build_skeleton(exercise, progress, calibration=None):
     """
-    Get reference skeleton for overlay based on exercise, phase, and calibration.
+    Compute the reference skeleton points for an exercise at a progress point.
+    
+    The adjusters only use elementwise arithmetic, so for an array of
+    progress values every coordinate is an array and all the skeletons are
+    computed in one pass.
     
     Args:
         exercise: Exercise type
-        progress: Exercise progress (0.0 to 1.0)
+        progress: Exercise progress (0.0 to 1.0), or an array of progress values
         calibration: Optional calibration data from calibrate_user_skeleton
         
     Returns:
-        List of [x,y] coordinates for landmarks to use as overlay
+        Dictionary of landmark name -> [x, y]
     """
     # Get reference angles
     angles = calculate_reference_angles(exercise, progress)
     
-    # Start with T-pose and adjust
-    skeleton = dict(T_POSE_REFERENCE)
+    # Start with a copy of the T-pose (the adjusters modify points in place)
+    if np.ndim(progress):
+        skeleton = {
+            name: [np.full(np.shape(progress), x), np.full(np.shape(progress), y)]
+            for name, (x, y) in T_POSE_REFERENCE.items()
+        }
+    else:
+        skeleton = {name: list(point) for name, point in T_POSE_REFERENCE.items()}
     
     # Apply exercise-specific adjustments based on angles
     if exercise == "squats":
@@ -204,7 +226,10 @@ def get_reference_skeleton(exercise, progress, calibration=None):
     if calibration:
         skeleton = apply_calibration(skeleton, calibration)
     
-    # Convert to list format expected by frontend
+    return skeleton
+
+def skeleton_to_landmarks(skeleton):
+    """Convert skeleton points to the 33-landmark list expected by the frontend"""
     reference_landmarks = [None] * 33  # MediaPipe has 33 landmarks
     for name, idx in LANDMARK_INDICES.items():
         if name in skeleton:
@@ -216,6 +241,146 @@ def get_reference_skeleton(exercise, progress, calibration=None):
     
     return reference_landmarks
 
+def get_reference_skeleton(exercise, progress, calibration=None):
+    """
+    Get reference skeleton for overlay based on exercise, phase, and calibration.
+    
+    Args:
+        exercise: Exercise type
+        progress: Exercise progress (0.0 to 1.0)
+        calibration: Optional calibration data from calibrate_user_skeleton
+        
+    Returns:
+        List of [x,y] coordinates for landmarks to use as overlay
+    """
+    return skeleton_to_landmarks(build_skeleton(exercise, progress, calibration))
+
+def get_reference_trajectory(exercise, steps, calibration=None):
+    """
+    Get the whole reference motion of an exercise, computed in one pass.
+    
+    Args:
+        exercise: Exercise type
+        steps: Number of frames, evenly spaced from progress 0.0 to 1.0
+        calibration: Optional calibration data from calibrate_user_skeleton
+        
+    Returns:
+        landmark_indices: MediaPipe indices of the skeleton points
+        frames: Array of shape (steps, points, 2) with the [x, y] of each
+            point at each progress value
+    """
+    progress = np.linspace(0.0, 1.0, steps)
+    skeleton = build_skeleton(exercise, progress, calibration)
+    
+    names = [name for name in LANDMARK_INDICES if name in skeleton]
+    frames = np.empty((steps, len(names), 2))
+    for column, name in enumerate(names):
+        frames[:, column, 0] = skeleton[name][0]
+        frames[:, column, 1] = skeleton[name][1]
+    
+    return [LANDMARK_INDICES[name] for name in names], frames
+
+# Progress estimation
+
+# Samples of each reference angle curve used to invert it
+PROGRESS_LOOKUP_SAMPLES = 1001
+
+def build_progress_lookup(start_angle, end_angle, mid_ratio):
+    """
+    Inverse lookup table of an interpolate_angle curve.
+    
+    The curve is monotonic from start_angle to end_angle, so sorting its
+    samples by angle gives a table that maps angles back to progress.
+    
+    Returns:
+        angles: Sampled angles in ascending order
+        progress: Progress value of each sampled angle
+    """
+    progress = np.linspace(0.0, 1.0, PROGRESS_LOOKUP_SAMPLES)
+    angles = interpolate_angle(start_angle, end_angle, progress, mid_ratio)
+    if end_angle < start_angle:
+        angles, progress = angles[::-1], progress[::-1]
+    return np.ascontiguousarray(angles), np.ascontiguousarray(progress)
+
+def estimate_progress(exercise, joint, angles):
+    """
+    Estimate exercise progress from live joint angles by inverting the
+    joint's reference curve (binary search in its lookup table).
+    
+    Args:
+        exercise: Exercise type
+        joint: Joint name in REFERENCE_ANGLES[exercise]
+        angles: Joint angle in degrees, or an array of angles
+        
+    Returns:
+        Progress from 0.0 to 1.0 (clamped), as a float or an array; None if
+        the joint's reference angle does not change
+    """
+    lookup = PROGRESS_LOOKUPS.get((exercise, joint))
+    if lookup is None:
+        return None
+    return np.interp(angles, *lookup)
+
+# Precomputed reference tables
+
+# Number of progress steps in a reference table (steps of 0.01)
+PROGRESS_STEPS = 100
+
+def build_reference_table(exercise, calibration=None):
+    """
+    Compute the reference skeleton of an exercise at every progress step.
+    
+    Args:
+        exercise: Exercise type
+        calibration: Optional calibration data from calibrate_user_skeleton
+        
+    Returns:
+        List with, per step, a list of (landmark index, x, y, dx, dy) for
+        the points of the skeleton, where (dx, dy) spans the step
+    """
+    table = []
+    for step in range(PROGRESS_STEPS):
+        start = build_skeleton(exercise, step / PROGRESS_STEPS, calibration)
+        end = build_skeleton(exercise, (step + 1) / PROGRESS_STEPS, calibration)
+        table.append([
+            (idx, float(start[name][0]), float(start[name][1]),
+             float(end[name][0] - start[name][0]), float(end[name][1] - start[name][1]))
+            for name, idx in LANDMARK_INDICES.items() if name in start
+        ])
+    
+    return table
+
+def lookup_reference_skeleton(exercise, progress, calibration=None, table=None):
+    """
+    Get a reference skeleton from a precomputed table, interpolating linearly
+    within the progress step.
+    
+    Args:
+        exercise: Exercise type
+        progress: Exercise progress (0.0 to 1.0)
+        calibration: Calibration data the table was built with (if any)
+        table: Table from build_reference_table, by default the uncalibrated
+            table of the exercise
+        
+    Returns:
+        Same list as get_reference_skeleton, which is used directly for
+        exercises without a table and progress outside 0.0 to 1.0
+    """
+    if table is None and calibration is None:
+        table = REFERENCE_TABLES.get(exercise)
+    if table is None or not 0.0 <= progress <= 1.0:
+        return get_reference_skeleton(exercise, progress, calibration)
+    
+    position = progress * PROGRESS_STEPS
+    step = min(int(position), PROGRESS_STEPS - 1)
+    fraction = position - step
+    
+    reference_landmarks = [None] * 33  # MediaPipe has 33 landmarks
+    for idx, x, y, dx, dy in table[step]:
+        reference_landmarks[idx] = {"x": x + dx * fraction, "y": y + dy * fraction, "z": 0}
+    
+    return reference_landmarks
+
 # Helper functions
 
 def distance(p1, p2):
@@ -246,10 +411,26 @@ def rotate_point(point, pivot, angle_deg):
     return [x_new + pivot[0], y_new + pivot[1]]
 
 def apply_calibration(skeleton, calibration):
-    """Apply user calibration to reference skeleton"""
-    # This would be a more complex implementation with proper scaling
-    # For now, returning the original skeleton
-    return skeleton
+    """
+    Apply user calibration to reference skeleton: scale it by the user's
+    torso length relative to the T-pose's, about the T-pose hip center,
+    and move that center onto the user's.
+    
+    Calibrations without a torso length or hip center (landmarks missing
+    from the T-pose) leave the skeleton unchanged.
+    """
+    user_torso = calibration.get("limb_lengths", {}).get("torso")
+    mid_hip = calibration.get("mid_hip")
+    if not user_torso or not mid_hip or mid_hip == [0, 0]:
+        return skeleton
+    
+    scale = user_torso / distance(T_POSE_REFERENCE["left_shoulder"], T_POSE_REFERENCE["left_hip"])
+    pivot = midpoint(T_POSE_REFERENCE["left_hip"], T_POSE_REFERENCE["right_hip"])
+    # Elementwise, so array coordinates (see build_skeleton) work too
+    return {
+        name: [mid_hip[0] + (x - pivot[0]) * scale, mid_hip[1] + (y - pivot[1]) * scale]
+        for name, (x, y) in skeleton.items()
+    }
 
 # Exercise-specific skeleton adjusters (simplified implementations)
 
@@ -319,3 +500,14 @@ def adjust_bicep_curl_skeleton(skeleton, angles, progress):
                                           right_elbow, elbow_angle - 180)
     
     return skeleton
+
+# Uncalibrated reference tables, built once at import
+REFERENCE_TABLES = {exercise: build_reference_table(exercise) for exercise in REFERENCE_ANGLES}
+
+# Inverse reference curves: (exercise, joint) -> (angles, progress)
+PROGRESS_LOOKUPS = {
+    (exercise, joint): build_progress_lookup(*params)
+    for exercise, joints in REFERENCE_ANGLES.items()
+    for joint, params in joints.items()
+    if params[0] != params[1]
+}
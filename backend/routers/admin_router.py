@@ -0,0 +1,82 @@
+"""
+API Router for Administration
+-----------------------------
+Operational endpoints, currently the on-demand sampling profiler.
+
+The endpoints are disabled unless REGENIX_ADMIN_TOKEN is set, and every
+request must send that token in the X-Admin-Token header.
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Optional
+import hmac
+import os
+
+from profiler import (
+    MAX_CAPTURE_SECONDS, MAX_CAPTURE_REQUESTS, PROFILER_INTERVAL_MS,
+    ProfilerBusy, start_capture, stop_capture, last_capture_status, get_last_capture
+)
+
+ADMIN_TOKEN = os.environ.get("REGENIX_ADMIN_TOKEN")
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_token)])
+
+@router.post("/profiler/start")
+async def api_start_profiler(
+    seconds: Optional[float] = Query(None, gt=0, le=MAX_CAPTURE_SECONDS),
+    requests: Optional[int] = Query(None, ge=1, le=MAX_CAPTURE_REQUESTS),
+    exercise: Optional[str] = None,
+    interval_ms: float = Query(PROFILER_INTERVAL_MS, ge=1, le=1000)
+):
+    """
+    Profile the landmark endpoints for a number of seconds and/or the next
+    number of requests, optionally for one exercise only.
+    
+    Without seconds the capture stops after MAX_CAPTURE_SECONDS at the latest.
+    """
+    try:
+        capture = start_capture(seconds, requests, exercise, interval_ms)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return capture.status()
+
+@router.post("/profiler/stop")
+async def api_stop_profiler():
+    """Stop the running capture early"""
+    stop_capture()
+    return last_capture_status()
+
+@router.get("/profiler")
+async def api_get_profiler_status():
+    """Status of the running (or last) capture"""
+    return last_capture_status()
+
+@router.get("/profiler/result")
+async def api_get_profiler_result(format: str = Query("collapsed", pattern="^(collapsed|speedscope)$")):
+    """
+    Download the samples of the last capture (so far, if it is still running).
+    
+    Args:
+        format: "collapsed" for collapsed stacks text, "speedscope" for a
+            speedscope JSON file
+    """
+    capture = get_last_capture()
+    if capture is None:
+        raise HTTPException(status_code=404, detail="No profiler capture has been run")
+    
+    filename = f"regenix-profile-{int(capture.started_at)}"
+    if format == "speedscope":
+        return JSONResponse(
+            capture.speedscope(),
+            headers={"Content-Disposition": f'attachment; filename="{filename}.speedscope.json"'}
+        )
+    return PlainTextResponse(
+        capture.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="{filename}.collapsed.txt"'}
+    )
@@ -2,16 +2,27 @@
 API Router for Reference Poses
 ---------------------------
 Provides endpoints for reference skeleton generation
+
+Skeletons are looked up in tables precomputed per exercise (see
+reference_poses.build_reference_table); tables for calibrated skeletons
+are built on first use and cached per calibration. Calibrations are read
+from disk and tables built on the I/O threads (see executor.run_io), off
+the event loop.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional, Union
 import json
 
 from reference_poses import (
-    calibrate_user_skeleton, get_reference_skeleton, 
-    calculate_reference_angles
+    calibrate_user_skeleton, calculate_reference_angles,
+    build_reference_table, lookup_reference_skeleton, REFERENCE_TABLES,
+    REFERENCE_ANGLES, get_reference_trajectory
 )
+from ttl_cache import TTLCache
+from calibration_store import save_calibration, get_calibration, get_calibration_stats
+from executor import run_io
 
 router = APIRouter(prefix="/reference", tags=["reference"])
 
@@ -24,21 +35,50 @@ class ReferenceRequest(BaseModel):
     progress: float
     calibration_id: Optional[str] = None
 
-# Simple in-memory cache for calibrations
-calibration_cache = {}
+# Accept header value selecting raw float32 trajectory frames
+BINARY_MEDIA_TYPE = "application/octet-stream"
+MAX_TRAJECTORY_STEPS = 1000
+
+# Reference tables of calibrated skeletons: (calibration_id, exercise) -> table
+CALIBRATED_TABLE_CACHE_SIZE = 64
+calibrated_tables = TTLCache(max_entries=CALIBRATED_TABLE_CACHE_SIZE)
+
+def get_calibrated_table(calibration_id, exercise, calibration):
+    """Reference table of an exercise for a calibration, built on first use"""
+    key = (calibration_id, exercise)
+    table = calibrated_tables.get(key)
+    if table is None:
+        table = calibrated_tables[key] = build_reference_table(exercise, calibration)
+    return table
+
+def calibrated_skeleton(exercise, progress, calibration_id):
+    """Reference skeleton of an exercise, for a calibration if given"""
+    calibration = get_calibration(calibration_id) if calibration_id else None
+    table = None
+    if calibration and exercise in REFERENCE_TABLES:
+        table = get_calibrated_table(calibration_id, exercise, calibration)
+    return lookup_reference_skeleton(exercise, progress, calibration, table)
+
+def calibrated_trajectory(exercise, steps, calibration_id):
+    """get_reference_trajectory for a calibration, if given"""
+    calibration = get_calibration(calibration_id) if calibration_id else None
+    return get_reference_trajectory(exercise, steps, calibration)
 
 @router.post("/calibrate")
 async def api_calibrate(request: CalibrationRequest):
     """Calibrate the reference skeleton to the user's proportions"""
     calibration_data = calibrate_user_skeleton(request.landmarks)
     
-    # Generate ID and cache
-    import uuid
-    calibration_id = str(uuid.uuid4())
-    calibration_cache[calibration_id] = calibration_data
+    # Store under a new ID (see calibration_store)
+    calibration_id = await run_io(save_calibration, calibration_data)
     
     return {"calibration_id": calibration_id}
 
+@router.get("/stats/calibrations")
+async def api_get_calibration_stats():
+    """Calibration cache hit/miss/eviction counters and persistence activity"""
+    return get_calibration_stats()
+
 @router.get("/skeleton/{exercise}")
 async def api_get_reference_skeleton(
     exercise: str, 
@@ -46,14 +86,8 @@ async def api_get_reference_skeleton(
     calibration_id: Optional[str] = None
 ):
     """Get reference skeleton for the specified exercise and progress"""
-    # Get calibration if specified
-    calibration = None
-    if calibration_id and calibration_id in calibration_cache:
-        calibration = calibration_cache[calibration_id]
-    
-    # Generate reference skeleton
     try:
-        reference = get_reference_skeleton(exercise, progress, calibration)
+        reference = await run_io(calibrated_skeleton, exercise, progress, calibration_id)
         return {
             "exercise": exercise,
             "progress": progress,
@@ -62,6 +96,42 @@ async def api_get_reference_skeleton(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error generating reference: {str(e)}")
 
+@router.get("/trajectory/{exercise}")
+async def api_get_reference_trajectory(
+    request: Request,
+    exercise: str,
+    steps: int = Query(100, ge=2, le=MAX_TRAJECTORY_STEPS),
+    calibration_id: Optional[str] = None
+):
+    """
+    Get the whole reference motion for the specified exercise, with frames
+    at evenly spaced progress values from 0.0 to 1.0.
+    
+    With an Accept: application/octet-stream header the frames are returned
+    as little-endian float32 values of shape (steps, points, 2).
+    """
+    if exercise not in REFERENCE_ANGLES:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    
+    landmark_indices, frames = await run_io(calibrated_trajectory, exercise, steps, calibration_id)
+    
+    if BINARY_MEDIA_TYPE in request.headers.get("accept", ""):
+        return Response(
+            frames.astype("<f4").tobytes(),
+            media_type=BINARY_MEDIA_TYPE,
+            headers={
+                "X-Landmark-Indices": ",".join(map(str, landmark_indices)),
+                "X-Trajectory-Shape": ",".join(map(str, frames.shape))
+            }
+        )
+    
+    return {
+        "exercise": exercise,
+        "steps": steps,
+        "landmark_indices": landmark_indices,
+        "frames": frames.tolist()
+    }
+
 @router.get("/angles/{exercise}")
 async def api_get_reference_angles(exercise: str, progress: float = 0.0):
     """Get reference joint angles for the specified exercise and progress"""
@@ -3,18 +3,27 @@ API Router for Session Management
 ------------------------------
 Provides endpoints for managing exercise sessions
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+from itertools import islice
+import json
 import time
 from datetime import datetime
 
 from session_state import (
-    start_session, end_session, get_session, record_rep
+    start_session, end_session, get_session, record_rep, get_lock_stats,
+    iter_session_reps, get_session_overview
 )
+from frame_analysis import discard_session_state
+from executor import analysis_executor, run_io
 
 router = APIRouter(prefix="/session", tags=["session"])
 
+# Media type that selects line-by-line streaming of rep lists
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 # Data models
 class SessionRequest(BaseModel):
     user_id: Optional[str] = None
@@ -27,12 +36,13 @@ class RecordRepRequest(BaseModel):
 
 @router.post("/start")
 async def api_start_session(request: SessionRequest):
-    session_id = start_session(request.user_id, request.exercise_type)
+    session_id = await run_io(start_session, request.user_id, request.exercise_type)
     return {"session_id": session_id, "start_time": datetime.now().isoformat()}
 
 @router.post("/{session_id}/record")
 async def api_record_rep(session_id: str, request: RecordRepRequest):
-    rep_data = record_rep(
+    rep_data = await run_io(
+        record_rep,
         session_id, 
         request.exercise, 
         request.feedback_flags, 
@@ -42,9 +52,21 @@ async def api_record_rep(session_id: str, request: RecordRepRequest):
         raise HTTPException(status_code=404, detail=rep_data["error"])
     return rep_data
 
+# Declared before /{session_id} so "stats" is not taken for a session ID
+@router.get("/stats/locks")
+async def api_get_lock_stats():
+    """
+    Contention counters of the per-session locks.
+    
+    Returns:
+        - Number of lock stripes and acquisitions
+        - How many acquisitions had to wait, and for how long in total / at most
+    """
+    return get_lock_stats()
+
 @router.get("/{session_id}")
 async def api_get_session(session_id: str):
-    session = get_session(session_id)
+    session = await run_io(get_session, session_id)
     if "error" in session:
         raise HTTPException(status_code=404, detail=session["error"])
     return session
@@ -52,8 +74,10 @@ async def api_get_session(session_id: str):
 @router.post("/{session_id}/end")
 async def api_end_session(session_id: str, background_tasks: BackgroundTasks):
     # Use background tasks to avoid blocking while saving session data
-    def end_session_task(sid):
-        summary = end_session(sid)
+    async def end_session_task(sid):
+        summary = await run_io(end_session, sid)
+        # Free the live exercise state; the session log keeps the results
+        await analysis_executor.run_for_session(sid, discard_session_state, sid)
         return summary
         
     background_tasks.add_task(end_session_task, session_id)
@@ -61,7 +85,7 @@ async def api_end_session(session_id: str, background_tasks: BackgroundTasks):
 
 @router.get("/{session_id}/summary")
 async def api_get_session_summary(session_id: str):
-    session = get_session(session_id)
+    session = await run_io(get_session_overview, session_id)
     if "error" in session:
         raise HTTPException(status_code=404, detail=session["error"])
         
@@ -95,7 +119,7 @@ async def api_get_session_report(session_id: str):
         - Exercise-by-exercise breakdown
         - Common issues and improvements
     """
-    session = get_session(session_id)
+    session = await run_io(get_session_overview, session_id)
     if "error" in session:
         raise HTTPException(status_code=404, detail=session["error"])
     
@@ -104,16 +128,20 @@ async def api_get_session_report(session_id: str):
     return report
 
 @router.get("/{session_id}/exercise/{exercise_name}/report")
-async def api_get_exercise_report(session_id: str, exercise_name: str):
+async def api_get_exercise_report(session_id: str, exercise_name: str, include_reps: bool = True):
     """
     Get a detailed report for a specific exercise within a session.
     
+    Pass include_reps=false when polling: the report is then built from
+    running aggregates only, in time independent of the number of reps.
+    
     Returns:
         - Exercise-specific metrics
-        - Rep-by-rep breakdown
+        - Rep-by-rep breakdown (if include_reps)
         - Form analysis and improvement suggestions
     """
-    session = get_session(session_id)
+    # The rep log is only read when the breakdown is requested
+    session = await run_io(get_session if include_reps else get_session_overview, session_id)
     if "error" in session:
         raise HTTPException(status_code=404, detail=session["error"])
     
@@ -123,7 +151,7 @@ async def api_get_exercise_report(session_id: str, exercise_name: str):
         raise HTTPException(status_code=404, detail=f"Exercise '{exercise_name}' not found in this session")
     
     # Generate detailed exercise report
-    report = generate_exercise_report(session, exercise_name)
+    report = generate_exercise_report(session, exercise_name, include_reps)
     return report
 
 @router.get("/{session_id}/exercises")
@@ -131,7 +159,7 @@ async def api_get_session_exercises(session_id: str):
     """
     Get a list of all exercises performed in a session with basic metrics.
     """
-    session = get_session(session_id)
+    session = await run_io(get_session_overview, session_id)
     if "error" in session:
         raise HTTPException(status_code=404, detail=session["error"])
     
@@ -152,40 +180,69 @@ async def api_get_session_exercises(session_id: str):
     }
 
 @router.get("/{session_id}/reps")
-async def api_get_session_reps(session_id: str):
+async def api_get_session_reps(
+    session_id: str,
+    request: Request,
+    after: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
     """
     Get detailed data for all reps across all exercises in the session.
-    """
-    session = get_session(session_id)
-    if "error" in session:
-        raise HTTPException(status_code=404, detail=session["error"])
     
-    # Return the full rep log for this session
-    return {
-        "session_id": session_id,
-        "rep_count": len(session.get("rep_log", [])),
-        "reps": session.get("rep_log", [])
-    }
+    Reps carry their "rep_index" in the session. Pass after=<rep_index> to
+    get only later reps and limit=<n> for pages of at most n reps; the
+    response's next_cursor is the after value of the next page. With
+    "Accept: application/x-ndjson" the reps are streamed one JSON object
+    per line instead.
+    """
+    return await run_io(rep_list_response, session_id, None, request, after, limit)
 
 @router.get("/{session_id}/exercise/{exercise_name}/reps")
-async def api_get_exercise_reps(session_id: str, exercise_name: str):
+async def api_get_exercise_reps(
+    session_id: str,
+    exercise_name: str,
+    request: Request,
+    after: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
     """
     Get detailed data for all reps of a specific exercise.
-    """
-    session = get_session(session_id)
-    if "error" in session:
-        raise HTTPException(status_code=404, detail=session["error"])
-    
-    # Filter rep log for the specified exercise
-    rep_log = session.get("rep_log", [])
-    exercise_reps = [rep for rep in rep_log if rep.get("exercise") == exercise_name]
     
-    return {
-        "session_id": session_id,
-        "exercise": exercise_name,
-        "rep_count": len(exercise_reps),
-        "reps": exercise_reps
-    }
+    Supports the same after/limit cursor and NDJSON streaming as
+    /{session_id}/reps; cursors are session-wide rep indexes.
+    """
+    return await run_io(rep_list_response, session_id, exercise_name, request, after, limit)
+
+def rep_list_response(session_id, exercise_name, request, after, limit):
+    """Page or stream a session's reps, optionally of one exercise"""
+    reps = iter_session_reps(session_id, after, exercise_name)
+    if reps is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if limit is not None:
+        reps = islice(reps, limit + 1)
+    
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        lines = (
+            json.dumps({"rep_index": index, **rep}) + "\n"
+            for index, rep in islice(reps, limit)
+        )
+        return StreamingResponse(lines, media_type=NDJSON_MEDIA_TYPE)
+    
+    page = [{"rep_index": index, **rep} for index, rep in reps]
+    has_more = limit is not None and len(page) > limit
+    if has_more:
+        page = page[:limit]
+    
+    response = {"session_id": session_id}
+    if exercise_name is not None:
+        response["exercise"] = exercise_name
+    response.update({
+        "rep_count": len(page),
+        "reps": page,
+        "next_cursor": page[-1]["rep_index"] if page else after,
+        "has_more": has_more
+    })
+    return response
 
 # Helper functions for generating reports
 
@@ -240,52 +297,36 @@ def generate_session_report(session):
         "improvement_suggestions": improvements
     }
 
-def generate_exercise_report(session, exercise_name):
-    """Generate a detailed report for a specific exercise"""
+def generate_exercise_report(session, exercise_name, include_reps=True):
+    """
+    Generate a detailed report for a specific exercise.
+    
+    Everything except the rep-by-rep breakdown comes from the running
+    aggregates kept by record_rep, so without include_reps the cost does not
+    depend on the number of reps.
+    """
     exercises = session["metrics"].get("exercises", {})
     if exercise_name not in exercises:
         return {"error": f"Exercise '{exercise_name}' not found"}
     
     exercise_data = exercises[exercise_name]
     
-    # Get rep-by-rep data
-    rep_log = session.get("rep_log", [])
-    exercise_reps = [rep for rep in rep_log if rep.get("exercise") == exercise_name]
-    
     # Analyze progress over time
-    rep_scores = [rep.get("score", 0) for rep in exercise_reps]
-    trend = "improving" if is_improving(rep_scores) else "consistent"
-    if len(rep_scores) >= 3 and rep_scores[-1] < sum(rep_scores[:-1]) / len(rep_scores[:-1]):
-        trend = "declining"
+    trend = get_score_trend(exercise_data)
     
     # Generate form analysis
-    form_issues = {}
-    for rep in exercise_reps:
-        for flag in rep.get("feedback_flags", []):
-            if flag not in ["GOOD_FORM", "GOOD_CURL", "GOOD_DEPTH"]:
-                if flag not in form_issues:
-                    form_issues[flag] = 0
-                form_issues[flag] += 1
+    form_issues = {
+        flag: count for flag, count in exercise_data.get("feedback_counts", {}).items()
+        if flag not in ["GOOD_FORM", "GOOD_CURL", "GOOD_DEPTH"]
+    }
     
     # Analyze metrics
-    metrics_analysis = {}
-    if exercise_reps and exercise_reps[0].get("metrics"):
-        first_rep = exercise_reps[0]
-        metric_keys = first_rep.get("metrics", {}).keys()
-        
-        for key in metric_keys:
-            values = [rep.get("metrics", {}).get(key, 0) for rep in exercise_reps if key in rep.get("metrics", {})]
-            if values:
-                metrics_analysis[key] = {
-                    "average": sum(values) / len(values),
-                    "min": min(values),
-                    "max": max(values)
-                }
+    metrics_analysis = exercise_data.get("metric_summary", {})
     
     # Generate improvement suggestions specific to this exercise
     improvements = generate_exercise_improvement_suggestions(exercise_name, form_issues)
     
-    return {
+    report = {
         "session_id": session["session_id"],
         "exercise": exercise_name,
         "summary": {
@@ -294,19 +335,26 @@ def generate_exercise_report(session, exercise_name):
             "performance_rating": get_performance_rating(exercise_data.get("average_score", 0)),
             "trend": trend
         },
-        "reps_breakdown": [{
-            "rep_number": i+1,
-            "score": rep.get("score", 0),
-            "timestamp": rep.get("timestamp", ""),
-            "feedback": rep.get("feedback_flags", []),
-            "metrics": rep.get("metrics", {})
-        } for i, rep in enumerate(exercise_reps)],
         "form_analysis": {
             "common_issues": get_top_issues(form_issues, 3),
             "metrics_analysis": metrics_analysis
         },
         "improvement_suggestions": improvements
     }
+    
+    if include_reps:
+        # Get rep-by-rep data
+        rep_log = session.get("rep_log", [])
+        exercise_reps = [rep for rep in rep_log if rep.get("exercise") == exercise_name]
+        report["reps_breakdown"] = [{
+            "rep_number": i+1,
+            "score": rep.get("score", 0),
+            "timestamp": rep.get("timestamp", ""),
+            "feedback": rep.get("feedback_flags", []),
+            "metrics": rep.get("metrics", {})
+        } for i, rep in enumerate(exercise_reps)]
+    
+    return report
 
 def get_top_issues(issues_dict, limit=3):
     """Extract the top N issues from a dictionary of issue counts"""
@@ -331,14 +379,23 @@ def get_performance_rating(score):
     else:
         return "Poor"
 
-def is_improving(scores):
-    """Determine if scores show an improving trend"""
-    if len(scores) < 3:
-        return True
-    
-    # Simple approach: is the last score better than the average of previous scores?
-    prev_avg = sum(scores[:-1]) / len(scores[:-1])
-    return scores[-1] > prev_avg
+def get_score_trend(exercise_data):
+    """
+    Score trend from the running totals: "declining" if the last rep scored
+    below the average of the earlier ones, otherwise "improving" (with fewer
+    than three reps, or a last score above that average) or "consistent".
+    """
+    reps = exercise_data.get("reps", 0)
+    if reps < 3:
+        return "improving"
+    
+    last_score = exercise_data.get("last_score", 0)
+    prev_avg = (exercise_data.get("total_score", 0) - last_score) / (reps - 1)
+    if last_score > prev_avg:
+        return "improving"
+    if last_score < prev_avg:
+        return "declining"
+    return "consistent"
 
 def generate_improvement_suggestions(issues):
     """Generate specific improvement suggestions based on common issues"""
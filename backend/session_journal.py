@@ -0,0 +1,290 @@
+"""
+Session Journal
+---------------
+Append-only, line-delimited JSON log of a session: session_logs/{id}.jsonl.
+
+The first line is a "start" record with the session metadata, every rep
+appends a "rep" record, and end_session appends a small "end" footer.
+Records are buffered in memory and appended in batches: a session's buffer
+is written once it holds JOURNAL_FLUSH_RECORDS records or its oldest
+record is JOURNAL_FLUSH_INTERVAL seconds old. Buffers that come due between
+requests are written by the flusher thread (see start_flusher), so while it
+runs a crash loses at most that much. A session can be rebuilt at any time
+by replaying its records.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from striped_lock import StripedLock
+
+JOURNAL_FLUSH_RECORDS = int(os.environ.get("REGENIX_JOURNAL_FLUSH_RECORDS", 16))
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get("REGENIX_JOURNAL_FLUSH_INTERVAL", 2.0))
+
+# The index is rewritten once superseded entries take up more than this
+# many bytes and more than half of it
+INDEX_COMPACT_BYTES = int(os.environ.get("REGENIX_INDEX_COMPACT_BYTES", 1 << 20))
+
+# Directory for storing session logs
+LOGS_DIR = Path("session_logs")
+LOGS_DIR.mkdir(exist_ok=True)
+
+# Buffered lines per session (session_id -> [lines, time of the oldest line]),
+# oldest buffer first so that due buffers are found from the front
+journal_buffers = OrderedDict()
+buffers_lock = threading.Lock()
+
+# Appends to one session's file are serialized without blocking its updates
+write_locks = StripedLock(64)
+
+# Index of ended sessions: one JSON line of summary fields per session.
+# Only the byte offset and length of each session's latest line are kept in
+# memory; lines superseded by a later entry are dropped when the index is
+# compacted (see append_index_entry).
+INDEX_PATH = LOGS_DIR / "index.jsonl"
+index_offsets = None  # session_id -> (offset, length), loaded on first use
+index_stale_bytes = 0  # Bytes of superseded (or unreadable) lines
+index_lock = threading.Lock()
+
+def journal_path(session_id):
+    """Path of a session's journal file"""
+    return LOGS_DIR / f"{session_id}.jsonl"
+
+def append_record(session_id, record):
+    """
+    Buffer one record for a session's journal.
+
+    Returns:
+        True if the session's buffer is due to be written (see flush_journal)
+    """
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    now = time.monotonic()
+    with buffers_lock:
+        buffer = journal_buffers.get(session_id)
+        if buffer is None:
+            buffer = journal_buffers[session_id] = [[], now]
+        buffer[0].append(line)
+        return (len(buffer[0]) >= JOURNAL_FLUSH_RECORDS
+                or now - buffer[1] >= JOURNAL_FLUSH_INTERVAL)
+
+def flush_journal(session_id):
+    """Append a session's buffered records to its journal file"""
+    # The write lock is taken before the buffer is detached, so batches
+    # of one session reach the file in the order they were buffered
+    with write_locks.hold(session_id):
+        with buffers_lock:
+            buffer = journal_buffers.pop(session_id, None)
+        if buffer:
+            data = "".join(buffer[0]).encode()
+            with open(journal_path(session_id), "a+b") as f:
+                end = f.seek(0, os.SEEK_END)
+                if end:
+                    f.seek(end - 1)
+                    if f.read(1) != b"\n":
+                        # A crash mid-write left a torn last line; end it so
+                        # that the new records start on a line of their own
+                        data = b"\n" + data
+                f.write(data)
+
+def flush_due_journals():
+    """
+    Write every buffer whose oldest record is older than JOURNAL_FLUSH_INTERVAL.
+
+    Returns:
+        Seconds until the oldest remaining buffer is due, or None if none is left
+    """
+    deadline = time.monotonic() - JOURNAL_FLUSH_INTERVAL
+    while True:
+        with buffers_lock:
+            oldest = next(iter(journal_buffers.items()), None)
+        if oldest is None:
+            return None
+        if oldest[1][1] > deadline:
+            return oldest[1][1] - deadline
+        flush_journal(oldest[0])
+
+def flush_all_journals():
+    """Write all buffered records (e.g. at shutdown)"""
+    with buffers_lock:
+        session_ids = list(journal_buffers)
+    for session_id in session_ids:
+        flush_journal(session_id)
+
+atexit.register(flush_all_journals)
+
+flusher_thread = None
+flusher_stop = threading.Event()
+
+def start_flusher():
+    """
+    Start a daemon thread writing buffers as they come due, so that the
+    records of a session that stops sending frames still reach its journal
+    within JOURNAL_FLUSH_INTERVAL (e.g. when the app starts).
+    """
+    global flusher_thread
+    if flusher_thread is not None:
+        return
+    flusher_stop.clear()
+    flusher_thread = threading.Thread(
+        target=_flush_when_due, name="regenix-journal-flusher", daemon=True
+    )
+    flusher_thread.start()
+
+def stop_flusher():
+    """Stop the flusher thread and write all buffered records (e.g. when the app stops)"""
+    global flusher_thread
+    if flusher_thread is not None:
+        flusher_stop.set()
+        flusher_thread.join()
+        flusher_thread = None
+    flush_all_journals()
+
+def _flush_when_due():
+    while True:
+        try:
+            wait = flush_due_journals()
+        except OSError as e:
+            print(f"Could not write session journals ({e}). Retrying.")
+            wait = None
+        # A buffer started while waiting is due no sooner than a full interval
+        if flusher_stop.wait(JOURNAL_FLUSH_INTERVAL if wait is None else wait):
+            return
+
+def iter_journal(session_id):
+    """
+    Iterate over the records of a session, including ones still buffered,
+    reading the file lazily.
+
+    A torn last line (from a crash mid-write) is skipped.
+
+    Returns:
+        Iterator of records, or None if the session has no journal
+    """
+    flush_journal(session_id)
+    try:
+        f = open(journal_path(session_id), "r")
+    except OSError:
+        return None
+    return iter_records(f)
+
+def iter_records(f):
+    """Parse the records of an open journal file (closing it when done)"""
+    with f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def read_journal(session_id):
+    """
+    Read all records of a session (see iter_journal).
+
+    Returns:
+        List of records, or None if the session has no journal
+    """
+    records = iter_journal(session_id)
+    if records is None:
+        return None
+    return list(records) or None
+
+def journal_size(session_id):
+    """Current size of a session's journal in bytes, or None if it has none"""
+    try:
+        return os.stat(journal_path(session_id)).st_size
+    except OSError:
+        return None
+
+def _load_index_offsets():
+    """Scan the index file once; call with index_lock held"""
+    global index_offsets, index_stale_bytes
+    if index_offsets is not None:
+        return
+    index_offsets = {}
+    offset = 0
+    try:
+        with open(INDEX_PATH, "rb") as f:
+            for line in f:
+                try:
+                    session_id = json.loads(line)["session_id"]
+                except (ValueError, KeyError):
+                    pass
+                else:
+                    index_offsets[session_id] = (offset, len(line))
+                offset += len(line)
+    except OSError:
+        pass
+    index_stale_bytes = offset - sum(length for _, length in index_offsets.values())
+
+def append_index_entry(entry):
+    """Add (or supersede) the index entry of entry["session_id"]"""
+    global index_stale_bytes
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode()
+    with index_lock:
+        _load_index_offsets()
+        with open(INDEX_PATH, "a+b") as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    # End a torn last line, as in flush_journal
+                    f.write(b"\n")
+                    index_stale_bytes += 1
+                    offset += 1
+            f.write(line)
+        previous = index_offsets.get(entry["session_id"])
+        if previous is not None:
+            index_stale_bytes += previous[1]
+        index_offsets[entry["session_id"]] = (offset, len(line))
+        live_bytes = offset + len(line) - index_stale_bytes
+        if index_stale_bytes > max(INDEX_COMPACT_BYTES, live_bytes):
+            _compact_index()
+
+def _compact_index():
+    """
+    Rewrite the index with only the latest entry of each session; call with
+    index_lock held.
+
+    The new file replaces the old one atomically, so readers holding
+    offsets into the old file either still read the old file or find
+    another line than they expected (see read_index_entry).
+    """
+    global index_offsets, index_stale_bytes
+    compacted = {}
+    temporary = INDEX_PATH.with_suffix(".tmp")
+    with open(INDEX_PATH, "rb") as source, open(temporary, "wb") as f:
+        for session_id, (offset, length) in sorted(index_offsets.items(), key=lambda item: item[1]):
+            source.seek(offset)
+            compacted[session_id] = (f.tell(), length)
+            f.write(source.read(length))
+    os.replace(temporary, INDEX_PATH)
+    index_offsets = compacted
+    index_stale_bytes = 0
+
+def read_index_entry(session_id):
+    """
+    Read a session's index entry with one seek and one small parse.
+
+    Returns:
+        Entry dict, or None if the session is not indexed
+    """
+    with index_lock:
+        _load_index_offsets()
+        location = index_offsets.get(session_id)
+    if location is None:
+        return None
+    offset, length = location
+    try:
+        with open(INDEX_PATH, "rb") as f:
+            f.seek(offset)
+            entry = json.loads(f.read(length))
+    except (OSError, ValueError):
+        return None
+    # The index may have been compacted since the offset was looked up
+    if not isinstance(entry, dict) or entry.get("session_id") != session_id:
+        return None
+    return entry
@@ -2,47 +2,103 @@
 Session State Management
 ----------------------
 Tracks exercise sessions, logs rep data, and computes aggregate scores.
+
+Every session is journaled to session_logs/{session_id}.jsonl as it runs
+(see session_journal), so sessions evicted from memory, ended, or left
+behind by a crash are rebuilt by replaying their journal.
 """
+import copy
+import os
+import threading
 import time
 import uuid
 import json
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-from pathlib import Path
-import threading
 from score_config import calculate_rep_score
+from ttl_cache import TTLCache
+from striped_lock import StripedLock
+from session_journal import (
+    LOGS_DIR, append_record, flush_journal, flush_due_journals, iter_journal, iter_records,
+    journal_path, journal_size, append_index_entry, read_index_entry
+)
 
-# Global dictionary to store session data in memory
-active_sessions = {}
+# Memory ceiling for live sessions: at most this many are kept in memory,
+# and sessions unused for SESSION_IDLE_TTL seconds are dropped from memory
+MAX_ACTIVE_SESSIONS = int(os.environ.get("REGENIX_MAX_ACTIVE_SESSIONS", 1000))
+SESSION_IDLE_TTL = float(os.environ.get("REGENIX_SESSION_IDLE_TTL", 30 * 60))
 
-# Thread lock to prevent race conditions when updating session data
-session_lock = threading.Lock()
+# Number of sessions read back from disk whose parsed form is cached
+SESSION_LOG_CACHE_SIZE = int(os.environ.get("REGENIX_SESSION_LOG_CACHE_SIZE", 256))
 
-# Directory for storing session logs
-LOGS_DIR = Path("session_logs")
-LOGS_DIR.mkdir(exist_ok=True)
+# Per-session locks (hash-striped) so that sessions never wait on each other
+SESSION_LOCK_STRIPES = 64
+session_locks = StripedLock(SESSION_LOCK_STRIPES)
 
-def generate_session_id():
-    """Generate a unique session ID"""
-    return str(uuid.uuid4())
+# Evicted sessions whose buffered journal records still need writing
+spill_queue = deque()
 
-def start_session(user_id=None, exercise_type=None):
+# Reps collected per analysis thread instead of being recorded (see collect_reps)
+rep_collectors = threading.local()
+
+@contextmanager
+def collect_reps():
     """
-    Start a new exercise tracking session.
-    
-    Args:
-        user_id: Optional user identifier
-        exercise_type: Optional exercise type
-        
-    Returns:
-        session_id: Unique session identifier
+    Collect the reps recorded on this thread instead of recording them.
+
+    Frame analysis runs under the session's exercise state lock, on an
+    executor thread or in a worker process that does not own the session
+    store; the executor records the collected reps afterwards on its I/O
+    threads (see executor).
+
+    Yields:
+        List that receives the record_rep arguments of each rep
     """
-    session_id = generate_session_id()
+    reps = []
+    rep_collectors.reps = reps
+    try:
+        yield reps
+    finally:
+        rep_collectors.reps = None
+
+def spill_session(session_id, session):
+    """Eviction callback: the journal already holds the session, only its buffer needs writing"""
+    spill_queue.append(session_id)
+
+def flush_spills():
+    """
+    Write the journal buffers of evicted sessions and any buffer that is due.
     
-    session_data = {
+    Called after a session's lock is released, so disk writes never happen
+    while a session lock is held.
+    """
+    while spill_queue:
+        try:
+            session_id = spill_queue.popleft()
+        except IndexError:
+            break
+        flush_journal(session_id)
+    flush_due_journals()
+
+# Sessions in memory, bounded and evicted to disk (see load_session)
+active_sessions = TTLCache(
+    max_entries=MAX_ACTIVE_SESSIONS,
+    ttl=SESSION_IDLE_TTL,
+    on_evict=spill_session
+)
+
+# Sessions parsed from their log file: session_id -> ((mtime, size), session).
+# An entry is only used while the file's mtime and size are unchanged.
+session_log_cache = TTLCache(max_entries=SESSION_LOG_CACHE_SIZE)
+
+def new_session_data(session_id, user_id=None, exercise_type=None, start_time=None):
+    """Empty session record"""
+    return {
         "session_id": session_id,
         "user_id": user_id,
         "exercise_type": exercise_type,
-        "start_time": datetime.now().isoformat(),
+        "start_time": start_time or datetime.now().isoformat(),
         "rep_log": [],
         "completed": False,
         "metrics": {
@@ -52,13 +108,245 @@ def start_session(user_id=None, exercise_type=None):
             "exercises": {}
         }
     }
+
+def new_running_stats():
+    """Empty running statistics of one metric"""
+    return {"count": 0, "mean": 0.0, "m2": 0.0, "min": None, "max": None}
+
+def update_running_stats(stats, value):
+    """Add a value to running statistics (Welford's algorithm)"""
+    stats["count"] += 1
+    delta = value - stats["mean"]
+    stats["mean"] += delta / stats["count"]
+    stats["m2"] += delta * (value - stats["mean"])
+    stats["min"] = value if stats["min"] is None else min(stats["min"], value)
+    stats["max"] = value if stats["max"] is None else max(stats["max"], value)
+
+def summarize_running_stats(stats):
+    """Average, spread and range of a metric from its running statistics"""
+    count = stats["count"]
+    return {
+        "average": stats["mean"],
+        "std_dev": (stats["m2"] / count) ** 0.5 if count else 0.0,
+        "min": stats["min"],
+        "max": stats["max"],
+        "count": count
+    }
+
+def apply_rep(session, rep_data):
+    """Add a rep to a session's log and aggregated metrics"""
+    exercise = rep_data["exercise"]
+    score = rep_data["score"]
+    session["rep_log"].append(rep_data)
+    
+    # Update aggregated metrics
+    session["metrics"]["total_reps"] += 1
+    session["metrics"]["total_score"] += score
+    session["metrics"]["average_score"] = (
+        session["metrics"]["total_score"] / session["metrics"]["total_reps"]
+    )
+    
+    # Per exercise metrics
+    if exercise not in session["metrics"]["exercises"]:
+        session["metrics"]["exercises"][exercise] = {
+            "reps": 0,
+            "total_score": 0,
+            "average_score": 0,
+            "last_score": 0,
+            "feedback_counts": {},
+            "metric_stats": {}
+        }
+    
+    exercise_metrics = session["metrics"]["exercises"][exercise]
+    exercise_metrics["reps"] += 1
+    exercise_metrics["total_score"] += score
+    exercise_metrics["average_score"] = (
+        exercise_metrics["total_score"] / exercise_metrics["reps"]
+    )
+    exercise_metrics["last_score"] = score
+    
+    # Running statistics of every numeric metric, so reports never rescan the log.
+    # Bool metrics count as 0/1, so their average is the share of reps with the flag.
+    metric_stats = exercise_metrics["metric_stats"]
+    for key, value in (rep_data.get("metrics") or {}).items():
+        if isinstance(value, (int, float)):
+            if key not in metric_stats:
+                metric_stats[key] = new_running_stats()
+            update_running_stats(metric_stats[key], value)
+    
+    # Count feedback occurrences
+    for flag in rep_data["feedback_flags"]:
+        if flag not in exercise_metrics["feedback_counts"]:
+            exercise_metrics["feedback_counts"][flag] = 0
+        exercise_metrics["feedback_counts"][flag] += 1
+
+def serialize_metrics(metrics):
+    """
+    Copy of a session's aggregated metrics for responses and the session
+    index: the running statistics of each exercise's metrics are replaced by
+    their summaries (see summarize_running_stats) under "metric_summary".
+    """
+    serialized = {key: value for key, value in metrics.items() if key != "exercises"}
+    serialized["exercises"] = {}
+    for exercise, exercise_metrics in metrics["exercises"].items():
+        serialized_exercise = {
+            key: copy.deepcopy(value) for key, value in exercise_metrics.items() if key != "metric_stats"
+        }
+        serialized_exercise["metric_summary"] = {
+            key: summarize_running_stats(stats)
+            for key, stats in exercise_metrics.get("metric_stats", {}).items()
+        }
+        serialized["exercises"][exercise] = serialized_exercise
+    return serialized
+
+def snapshot_session(session, include_rep_log=True):
+    """
+    Copy of a session that stays consistent while reps are recorded to it.
+    
+    Call with the session's lock held. The metrics are copied by
+    serialize_metrics; logged reps are never changed, so the rep log is
+    copied as a list.
+    """
+    snapshot = {key: value for key, value in session.items() if key not in ("rep_log", "metrics")}
+    snapshot["metrics"] = serialize_metrics(session["metrics"])
+    if include_rep_log:
+        snapshot["rep_log"] = list(session["rep_log"])
+    return snapshot
+
+def replay_session(records):
+    """
+    Rebuild a session from its journal records.
+    
+    Args:
+        records: Records from session_journal.read_journal, "start" first
+    
+    Returns:
+        session: Session data dict, or None if the journal has no start record
+    """
+    if not records or records[0].get("type") != "start":
+        return None
+    
+    start = records[0]
+    session = new_session_data(
+        start["session_id"], start.get("user_id"), start.get("exercise_type"), start["start_time"]
+    )
+    for record in records[1:]:
+        record_type = record.pop("type", None)
+        if record_type == "rep":
+            apply_rep(session, record)
+        elif record_type == "end":
+            session["end_time"] = record["end_time"]
+            session["duration_seconds"] = record["duration_seconds"]
+            session["completed"] = True
+    return session
+
+def rebuild_legacy_session(logged):
+    """Recompute the aggregates of a session saved as one JSON document"""
+    session = new_session_data(
+        logged["session_id"], logged.get("user_id"), logged.get("exercise_type"), logged["start_time"]
+    )
+    for rep_data in logged.get("rep_log", []):
+        apply_rep(session, rep_data)
+    for key in ("end_time", "duration_seconds", "completed"):
+        if key in logged:
+            session[key] = logged[key]
+    return session
+
+def load_session(session_id, restore=False):
+    """
+    Find a session in memory or, failing that, rebuild it from its journal.
+    
+    Call with the session's lock held (session_locks.hold(session_id)) and
+    call flush_spills once it is released.
+    
+    Args:
+        session_id: Session identifier
+        restore: Put a session read from disk back into memory so it can be
+            updated; sessions still in progress are always restored
+    
+    Returns:
+        session: Session data dict, or None if the session does not exist
+    """
+    session = active_sessions.get(session_id)
+    if session is not None:
+        return session
+    
+    session = read_logged_session(session_id)
+    if session is None:
+        return None
+    
+    if restore or not session.get("completed"):
+        # The session is updated in memory from now on
+        session_log_cache.pop(session_id)
+        active_sessions[session_id] = session
+    return session
+
+def read_logged_session(session_id):
+    """
+    Rebuild a session from its journal (or a pre-journal .json log),
+    through a cache that is invalidated when the file's mtime or size change.
     
-    with session_lock:
+    Returns:
+        session: Session data dict, or None if there is no log
+    """
+    flush_journal(session_id)
+    for path, rebuild in (
+        (journal_path(session_id), lambda f: replay_session(list(iter_records(f)))),
+        (LOGS_DIR / f"{session_id}.json", lambda f: rebuild_legacy_session(json.load(f)))
+    ):
+        try:
+            with open(path, "r") as f:
+                stat = os.fstat(f.fileno())
+                signature = (stat.st_mtime_ns, stat.st_size)
+                cached = session_log_cache.get(session_id)
+                if cached is not None and cached[0] == signature:
+                    return cached[1]
+                session = rebuild(f)
+        except (OSError, ValueError, KeyError):
+            continue
+        if session is not None:
+            session_log_cache[session_id] = (signature, session)
+            return session
+    return None
+
+def get_lock_stats():
+    """Contention counters of the session locks"""
+    return session_locks.stats()
+
+def generate_session_id():
+    """Generate a unique session ID"""
+    return str(uuid.uuid4())
+
+def start_session(user_id=None, exercise_type=None):
+    """
+    Start a new exercise tracking session.
+    
+    Args:
+        user_id: Optional user identifier
+        exercise_type: Optional exercise type
+    
+    Returns:
+        session_id: Unique session identifier
+    """
+    session_id = generate_session_id()
+    session_data = new_session_data(session_id, user_id, exercise_type)
+    
+    with session_locks.hold(session_id):
         active_sessions[session_id] = session_data
+        append_record(session_id, {
+            "type": "start",
+            "session_id": session_id,
+            "user_id": user_id,
+            "exercise_type": exercise_type,
+            "start_time": session_data["start_time"]
+        })
+    # Write the start record right away so the session exists on disk
+    flush_journal(session_id)
+    flush_spills()
     
     return session_id
 
-def record_rep(session_id, exercise, feedback_flags, metrics=None):
+def record_rep(session_id, exercise, feedback_flags, metrics=None, timestamp=None):
     """
     Record data for a single rep in a session.
     
@@ -67,18 +355,16 @@ def record_rep(session_id, exercise, feedback_flags, metrics=None):
         exercise: Exercise type
         feedback_flags: List of feedback flags from the exercise
         metrics: Optional dict of additional metrics (angles, positions, etc.)
-        
+        timestamp: ISO time the rep was completed (default: now)
+    
     Returns:
         rep_data: Dictionary with rep information including score
     """
-    if session_id not in active_sessions:
-        return {"error": "Invalid session ID"}
-    
     # Calculate score based on feedback
     score, label = calculate_rep_score(exercise, feedback_flags)
     
     # Create rep record
-    timestamp = datetime.now().isoformat()
+    timestamp = timestamp or datetime.now().isoformat()
     rep_data = {
         "timestamp": timestamp,
         "exercise": exercise,
@@ -87,67 +373,48 @@ def record_rep(session_id, exercise, feedback_flags, metrics=None):
         "score_label": label,
         "metrics": metrics or {}
     }
+    collected = getattr(rep_collectors, "reps", None)
+    if collected is not None:
+        collected.append((session_id, exercise, feedback_flags, metrics, timestamp))
+        return rep_data
     
-    # Update session data
-    with session_lock:
-        session = active_sessions[session_id]
-        session["rep_log"].append(rep_data)
-        
-        # Update aggregated metrics
-        session["metrics"]["total_reps"] += 1
-        session["metrics"]["total_score"] += score
-        session["metrics"]["average_score"] = (
-            session["metrics"]["total_score"] / session["metrics"]["total_reps"]
-        )
-        
-        # Per exercise metrics
-        if exercise not in session["metrics"]["exercises"]:
-            session["metrics"]["exercises"][exercise] = {
-                "reps": 0,
-                "total_score": 0,
-                "average_score": 0,
-                "feedback_counts": {}
-            }
-        
-        exercise_metrics = session["metrics"]["exercises"][exercise]
-        exercise_metrics["reps"] += 1
-        exercise_metrics["total_score"] += score
-        exercise_metrics["average_score"] = (
-            exercise_metrics["total_score"] / exercise_metrics["reps"]
-        )
-        
-        # Count feedback occurrences
-        for flag in feedback_flags:
-            if flag not in exercise_metrics["feedback_counts"]:
-                exercise_metrics["feedback_counts"][flag] = 0
-            exercise_metrics["feedback_counts"][flag] += 1
+    # Update session data and journal the rep
+    with session_locks.hold(session_id):
+        session = load_session(session_id, restore=True)
+        if session is None:
+            return {"error": "Invalid session ID"}
+        apply_rep(session, rep_data)
+        flush_due = append_record(session_id, {"type": "rep", **rep_data})
+    
+    if flush_due:
+        flush_journal(session_id)
+    flush_spills()
     
     return rep_data
 
 def end_session(session_id):
     """
-    End a session and save data to disk.
+    End a session: append the end record to its journal and drop it from memory.
     
     Args:
         session_id: Session identifier
-        
+    
     Returns:
         session_summary: Dictionary with session summary data
     """
-    if session_id not in active_sessions:
-        return {"error": "Invalid session ID"}
-    
-    with session_lock:
-        session = active_sessions[session_id]
+    with session_locks.hold(session_id):
+        session = load_session(session_id)
+        if session is None:
+            return {"error": "Invalid session ID"}
         session["end_time"] = datetime.now().isoformat()
         session["completed"] = True
-        
+    
         # Calculate duration
         start = datetime.fromisoformat(session["start_time"])
         end = datetime.fromisoformat(session["end_time"])
         duration_sec = (end - start).total_seconds()
         session["duration_seconds"] = duration_sec
-        
+    
         # Create summary
         summary = {
             "session_id": session["session_id"],
@@ -159,7 +426,7 @@ def end_session(session_id):
             "average_score": session["metrics"]["average_score"],
             "exercises": {}
         }
-        
+    
         # Add exercise summaries
         for ex_name, ex_data in session["metrics"]["exercises"].items():
             summary["exercises"][ex_name] = {
@@ -172,26 +439,122 @@ def end_session(session_id):
                     reverse=True
                 )[:3]  # Top 3 issues
             }
-        
-        # Save to file
-        filename = f"{LOGS_DIR}/{session_id}.json"
-        with open(filename, "w") as f:
-            json.dump(session, f, indent=2)
-            
-        # Optionally remove from memory to save RAM
-        # del active_sessions[session_id]
-        
+    
+        # Only the footer is left to write; the reps are already journaled
+        append_record(session_id, {
+            "type": "end",
+            "end_time": session["end_time"],
+            "duration_seconds": duration_sec,
+            "total_reps": summary["total_reps"],
+            "average_score": summary["average_score"]
+        })
+    
+        # Remove from memory to save RAM; get_session replays the journal
+        active_sessions.pop(session_id)
+    
+    flush_journal(session_id)
+    index_session(session_id, session)
+    flush_spills()
+    
     return summary
 
+def index_session(session_id, session):
+    """
+    Add an ended session's summary fields to the session index.
+    
+    The entry records the journal size it describes, so it is ignored
+    as soon as anything else is appended to the journal.
+    """
+    with session_locks.hold(session_id):
+        if session_id in active_sessions:
+            # Recorded to again since it ended; the entry would be stale
+            return
+        log_size = journal_size(session_id)
+        entry = snapshot_session(session, include_rep_log=False)
+    if log_size is not None:
+        entry["log_size"] = log_size
+        append_index_entry(entry)
+
+def get_session_overview(session_id):
+    """
+    Retrieve a session without its rep log: everything the summary and
+    report endpoints need.
+    
+    Ended sessions are answered from the session index when it is current,
+    without reading their journal.
+    """
+    with session_locks.hold(session_id):
+        session = active_sessions.get(session_id)
+        if session is not None:
+            return snapshot_session(session, include_rep_log=False)
+    entry = read_index_entry(session_id)
+    if entry is not None and entry.pop("log_size") == journal_size(session_id):
+        return entry
+    return get_session(session_id)
+
 def get_session(session_id):
-    """Retrieve session data"""
-    if session_id in active_sessions:
-        return active_sessions[session_id]
+    """
+    Retrieve session data from memory or, if it was evicted or ended, from its journal.
     
-    # Try to load from disk if not in memory
-    filename = f"{LOGS_DIR}/{session_id}.json"
-    try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except:
+    Returns a snapshot (see snapshot_session), as reps may be recorded while
+    the caller reads it.
+    """
+    with session_locks.hold(session_id):
+        session = load_session(session_id)
+        if session is not None:
+            session = snapshot_session(session)
+    flush_spills()
+    if session is None:
         return {"error": "Session not found"}
+    return session
+
+def iter_session_reps(session_id, after=None, exercise=None):
+    """
+    Iterate over a session's reps without building the whole log.
+    
+    Live sessions are read from memory (reps recorded while iterating are
+    included); other sessions are read lazily from their journal.
+    
+    Args:
+        session_id: Session identifier
+        after: Only yield reps whose index in the session is greater than this
+        exercise: Only yield reps of this exercise
+        
+    Returns:
+        Iterator of (rep_index, rep_data), or None if the session does not exist
+    """
+    start = 0 if after is None else after + 1
+    
+    with session_locks.hold(session_id):
+        session = active_sessions.get(session_id)
+    if session is not None:
+        reps = _iter_rep_log(session["rep_log"], start)
+    else:
+        records = iter_journal(session_id)
+        if records is not None:
+            reps = _iter_journal_reps(records, start)
+        else:
+            session = get_session(session_id)
+            if "error" in session:
+                return None
+            reps = _iter_rep_log(session["rep_log"], start)
+    
+    if exercise is None:
+        return reps
+    return ((index, rep) for index, rep in reps if rep.get("exercise") == exercise)
+
+def _iter_rep_log(rep_log, start):
+    index = start
+    # The log is append-only, so indexing stays valid while it grows
+    while index < len(rep_log):
+        yield index, rep_log[index]
+        index += 1
+
+def _iter_journal_reps(records, start):
+    index = 0
+    for record in records:
+        if record.pop("type", None) != "rep":
+            continue
+        if index >= start:
+            yield index, record
+        index += 1
@@ -2,74 +2,63 @@ import numpy as np
 from state import exercise_state
 from feedback_config import SITUP_CONFIG, FEEDBACK_TO_JOINTS
 from score_config import calculate_rep_score
-
-def calculate_angle(a, b, c):
-    a, b, c = np.array(a), np.array(b), np.array(c)
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-         angle = 360 - angle
-    return angle
-
-def check_neck_strain(nose, neck, shoulder):
-    """
-    Check if there's excessive neck strain by measuring the angle between
-    nose, neck, and shoulders
-    """
-    if not nose or not neck or not shoulder:
-        return False
-        
-    neck_angle = calculate_angle(nose, neck, shoulder)
-    # If neck is too flexed (looking down too much), it might indicate strain
-    return neck_angle < 150
+from geometry import landmarks_to_array, extract_features
+from metrics import NULL_STAGE_TIMER
 
 def process_landmarks(landmarks, tolerance, session_id=None):
     """
     Process landmarks for situp form analysis with enhanced feedback
     """
-    hip_angles = []
-    neck_strain_detected = False
-    
-    # Extract left side landmarks for hip angle calculation
-    try:
-        left_shoulder = [landmarks[11]['x'], landmarks[11]['y']]
-        left_hip = [landmarks[23]['x'], landmarks[23]['y']]
-        left_knee = [landmarks[25]['x'], landmarks[25]['y']]
-        
-        left_hip_angle = calculate_angle(left_shoulder, left_hip, left_knee)
-        hip_angles.append(left_hip_angle)
-        
-        # Check for neck strain
-        nose = [landmarks[0]['x'], landmarks[0]['y']]
-        neck = [(landmarks[11]['x'] + landmarks[12]['x'])/2, 
-                (landmarks[11]['y'] + landmarks[12]['y'])/2 - 0.05]  # Estimate neck position
-        mid_shoulder = [(landmarks[11]['x'] + landmarks[12]['x'])/2,
-                       (landmarks[11]['y'] + landmarks[12]['y'])/2]
-        
-        if check_neck_strain(nose, neck, mid_shoulder):
-            neck_strain_detected = True
-    except Exception:
-        pass
-    
-    # Extract right side landmarks for hip angle calculation
-    try:
-        right_shoulder = [landmarks[12]['x'], landmarks[12]['y']]
-        right_hip = [landmarks[24]['x'], landmarks[24]['y']]
-        right_knee = [landmarks[26]['x'], landmarks[26]['y']]
-        
-        right_hip_angle = calculate_angle(right_shoulder, right_hip, right_knee)
-        hip_angles.append(right_hip_angle)
-    except Exception:
-        pass
+    return process_landmarks_batch(landmarks_to_array(landmarks)[None], tolerance, session_id)[0]
 
-    if not hip_angles:
-        return {"error": "Insufficient landmarks data."}
+def process_landmarks_batch(frames, tolerance, session_id=None, frame_times=None, timer=None):
+    """
+    Process an ordered batch of frames for situp form analysis.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4) from geometry.frames_to_array
+        tolerance: Tolerance threshold
+        session_id: Optional session ID for logging
+        frame_times: Optional per-frame timestamps (unused for situps)
+        timer: Optional metrics.StageTimer the processing stages are charged to
+        
+    Returns:
+        List with the processing result of every frame, in order
+    """
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    
+    features = extract_features(frames)
+    
+    hip_angles = features.hip_angles
+    valid_sides = np.isfinite(hip_angles)
+    # A too-flexed neck (looking down too much) might indicate strain; it is
+    # measured together with the left side
+    neck_strain = valid_sides[..., 0] & (features.neck_angles < 150)
+    
+    timer.mark("geometry")
+    
+    results = []
+    # Frames of one session are evaluated in order, one request at a time
+    with exercise_state.lock(session_id):
+        for angles, valid, neck_strain_detected in zip(hip_angles.tolist(), valid_sides, neck_strain.tolist()):
+            frame_hip_angles = [angle for angle, is_valid in zip(angles, valid) if is_valid]
+            if not frame_hip_angles:
+                results.append({"error": "Insufficient landmarks data."})
+                continue
+            results.append(_evaluate_frame(frame_hip_angles, neck_strain_detected, session_id, timer))
+    
+    return results
 
+def _evaluate_frame(hip_angles, neck_strain_detected, session_id, timer):
+    """
+    Run rep counting, feedback and scoring for one frame of situp measurements
+    """
     # Average the hip angles
     avg_hip_angle = sum(hip_angles) / len(hip_angles)
     
     # Retrieve current state for sit-ups
-    state = exercise_state.get("situps", {"counter": 0, "stage": "up", "feedback": "N/A"})
+    state = exercise_state.get((session_id, "situps"), {"counter": 0, "stage": "up", "feedback": "N/A"})
     stage = state.get("stage", "up")
     counter = state.get("counter", 0)
 
@@ -80,6 +69,8 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         stage = "up"
         counter += 1
 
+    timer.mark("state_machine")
+    
     # Generate detailed feedback
     feedback = []
     
@@ -106,6 +97,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     
     # Log the rep if this is a new rep and we have a session ID
     if counter > state.get("counter", 0) and session_id:
+        timer.mark("feedback")
         try:
             from session_state import record_rep
             metrics = {
@@ -116,6 +108,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         except ImportError:
             # Session state module not available, continue without logging
             pass
+        timer.mark("record_rep")
 
     # Create affected joints and segments arrays for visualization
     affected_joints = []
@@ -169,5 +162,6 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         "affected_segments": affected_segments
     }
     
-    exercise_state["situps"] = new_state
+    timer.mark("feedback")
+    exercise_state[(session_id, "situps")] = new_state
     return new_state
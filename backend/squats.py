@@ -3,139 +3,68 @@ import time
 from state import exercise_state
 from feedback_config import SQUAT_CONFIG, SQUAT_METRICS, ADVANCED_FEEDBACK, FEEDBACK_TO_JOINTS
 from score_config import calculate_rep_score
-
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180.0:
-         angle = 360 - angle
-    return angle
-
-def calculate_knee_projection(hip, knee, ankle):
-    """Calculate how far knee extends beyond toes (normalized by limb length)"""
-    # Convert to numpy arrays for vector math
-    hip = np.array(hip)
-    knee = np.array(knee)
-    ankle = np.array(ankle)
-    
-    # Get the ankle-to-knee vector direction
-    ankle_knee_vector = knee - ankle
-    ankle_knee_length = np.linalg.norm(ankle_knee_vector)
-    if ankle_knee_length == 0:  # Avoid division by zero
-        return 0
-    
-    # Project the knee point onto the vertical line from ankle
-    projection = ankle_knee_vector[0] / ankle_knee_length  # Normalized horizontal component
-    
-    return projection  # Positive means knee is forward of ankle
-
-def calculate_torso_angle(shoulder, hip):
-    """Calculate torso angle from vertical (0 degrees is perfectly upright)"""
-    # Calculate the angle between the torso and the vertical axis
-    vertical_vector = np.array([0, -1])  # Upward vertical vector
-    torso_vector = np.array([shoulder[0] - hip[0], shoulder[1] - hip[1]])
-    
-    # Normalize the torso vector
-    torso_length = np.linalg.norm(torso_vector)
-    if torso_length == 0:  # Avoid division by zero
-        return 0
-    torso_vector = torso_vector / torso_length
-    
-    # Calculate angle using dot product
-    dot_product = np.dot(vertical_vector, torso_vector)
-    angle = np.arccos(np.clip(dot_product, -1.0, 1.0)) * 180.0 / np.pi
-    
-    return angle
-
-def calculate_knee_valgus(hip, knee, ankle):
-    """Calculate knee valgus angle (inward collapse) in the frontal plane"""
-    hip = np.array(hip)
-    knee = np.array(knee)
-    ankle = np.array(ankle)
-    
-    # Create vectors from knee to hip and knee to ankle
-    knee_to_hip = hip - knee
-    knee_to_ankle = ankle - knee
-    
-    # Project vectors onto frontal plane (assuming y is height)
-    knee_to_hip_frontal = np.array([knee_to_hip[0], 0, knee_to_hip[2] if len(knee_to_hip) > 2 else 0])
-    knee_to_ankle_frontal = np.array([knee_to_ankle[0], 0, knee_to_ankle[2] if len(knee_to_ankle) > 2 else 0])
-    
-    # Calculate angle between the two vectors in frontal plane
-    dot_product = np.dot(knee_to_hip_frontal, knee_to_ankle_frontal)
-    magnitude1 = np.linalg.norm(knee_to_hip_frontal)
-    magnitude2 = np.linalg.norm(knee_to_ankle_frontal)
-    
-    if magnitude1 * magnitude2 == 0:  # Avoid division by zero
-        return 0
-    
-    cosine = dot_product / (magnitude1 * magnitude2)
-    angle = np.arccos(np.clip(cosine, -1.0, 1.0)) * 180.0 / np.pi
-    
-    return angle
+from geometry import landmarks_to_array, extract_features
+from metrics import NULL_STAGE_TIMER
 
 def process_landmarks(landmarks, tolerance, session_id=None):
     """
     Process landmarks for squat form analysis with enhanced feedback and advanced metrics
     """
-    knee_angles = []
-    knee_projections = []
-    torso_angles = []
-    knee_valgus_angles = []  # New metric: knee valgus angle
-    
-    # Record timestamp for tempo analysis
-    current_time = time.time()
-    
-    # Extract and calculate left side measurements
-    try:
-        left_shoulder = [landmarks[11]['x'], landmarks[11]['y']]
-        left_hip = [landmarks[23]['x'], landmarks[23]['y']]
-        left_knee = [landmarks[25]['x'], landmarks[25]['y']]
-        left_ankle = [landmarks[27]['x'], landmarks[27]['y']]
-        
-        # Calculate standard metrics
-        left_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-        left_knee_projection = calculate_knee_projection(left_hip, left_knee, left_ankle)
-        left_torso_angle = calculate_torso_angle(left_shoulder, left_hip)
-        
-        # Calculate advanced metrics
-        left_knee_valgus = calculate_knee_valgus(left_hip, left_knee, left_ankle)
-        
-        knee_angles.append(left_knee_angle)
-        knee_projections.append(left_knee_projection)
-        torso_angles.append(left_torso_angle)
-        knee_valgus_angles.append(left_knee_valgus)
-    except Exception as e:
-        pass
+    return process_landmarks_batch(landmarks_to_array(landmarks)[None], tolerance, session_id)[0]
 
-    # Extract and calculate right side measurements
-    try:
-        right_shoulder = [landmarks[12]['x'], landmarks[12]['y']]
-        right_hip = [landmarks[24]['x'], landmarks[24]['y']]
-        right_knee = [landmarks[26]['x'], landmarks[26]['y']]
-        right_ankle = [landmarks[28]['x'], landmarks[28]['y']]
-        
-        # Calculate standard metrics
-        right_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
-        right_knee_projection = calculate_knee_projection(right_hip, right_knee, right_ankle)
-        right_torso_angle = calculate_torso_angle(right_shoulder, right_hip)
-        
-        # Calculate advanced metrics
-        right_knee_valgus = calculate_knee_valgus(right_hip, right_knee, right_ankle)
+def process_landmarks_batch(frames, tolerance, session_id=None, frame_times=None, timer=None):
+    """
+    Process an ordered batch of frames for squat form analysis.
+    
+    Args:
+        frames: Array of shape (frames, 33, 4) from geometry.frames_to_array
+        tolerance: Tolerance threshold
+        session_id: Optional session ID for logging
+        frame_times: Optional per-frame timestamps (seconds) for tempo analysis
+        timer: Optional metrics.StageTimer the processing stages are charged to
         
-        knee_angles.append(right_knee_angle)
-        knee_projections.append(right_knee_projection)
-        torso_angles.append(right_torso_angle)
-        knee_valgus_angles.append(right_knee_valgus)
-    except Exception as e:
-        pass
-
-    if not knee_angles:
-        return {"error": "Insufficient landmarks data."}
+    Returns:
+        List with the processing result of every frame, in order
+    """
+    if frame_times is None:
+        frame_times = [time.time()] * len(frames)
+    
+    if timer is None:
+        timer = NULL_STAGE_TIMER
+    
+    features = extract_features(frames)
+    
+    # Knee angle, knee projection, torso angle and knee valgus of each side
+    measurements = np.stack([
+        features.knee_angles,
+        features.knee_projections,
+        features.torso_angles,
+        features.knee_valgus
+    ], axis=-1)
+    valid_sides = np.isfinite(measurements).all(axis=-1)
+    
+    timer.mark("geometry")
+    
+    results = []
+    # Frames of one session are evaluated in order, one request at a time
+    with exercise_state.lock(session_id):
+        for frame_sides, valid, current_time in zip(measurements.tolist(), valid_sides, frame_times):
+            sides = [side for side, is_valid in zip(frame_sides, valid) if is_valid]
+            if not sides:
+                results.append({"error": "Insufficient landmarks data."})
+                continue
+            
+            # Regroup per-side values into per-measurement lists
+            measurement_lists = [list(values) for values in zip(*sides)]
+            results.append(_evaluate_frame(*measurement_lists, session_id, current_time, timer))
+    
+    return results
 
+def _evaluate_frame(knee_angles, knee_projections, torso_angles, knee_valgus_angles,
+                    session_id, current_time, timer):
+    """
+    Run rep counting, feedback and scoring for one frame of squat measurements
+    """
     # Average the standard measurements
     avg_knee_angle = sum(knee_angles) / len(knee_angles)
     avg_knee_projection = sum(knee_projections) / len(knee_projections)
@@ -146,7 +75,7 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     knee_asymmetry = abs(knee_angles[0] - knee_angles[1]) if len(knee_angles) > 1 else 0
 
     # Retrieve the current state
-    state = exercise_state.get("squats", {
+    state = exercise_state.get((session_id, "squats"), {
         "counter": 0,
         "stage": "up",
         "repCounted": False,
@@ -180,6 +109,8 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         last_stage_time = current_time  # Reset the timer for the next phase
         counter += 1
 
+    timer.mark("state_machine")
+    
     # Generate detailed feedback including advanced metrics
     feedback = []
     
@@ -234,12 +165,14 @@ def process_landmarks(landmarks, tolerance, session_id=None):
     
     # Log the rep if this is a new rep and we have a session ID
     if counter > state.get("counter", 0) and session_id:
+        timer.mark("feedback")
         try:
             from session_state import record_rep
             record_rep(session_id, "squats", feedback, advanced_metrics)
         except ImportError:
             # Session state module not available, continue without logging
             pass
+        timer.mark("record_rep")
 
     # Create affected joints and segments arrays for visualization
     affected_joints = []
@@ -302,5 +235,6 @@ def process_landmarks(landmarks, tolerance, session_id=None):
         "affected_segments": affected_segments
     }
     
-    exercise_state["squats"] = new_state
+    timer.mark("feedback")
+    exercise_state[(session_id, "squats")] = new_state
     return new_state
@@ -1,45 +1,150 @@
 # state.py
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Maximum number of sessions whose exercise state is kept in memory
+MAX_LIVE_SESSIONS = 1000
+
+class SessionStates:
+    """Exercise states of one session, with the lock serializing its frames"""
+    __slots__ = ("states", "last_update", "last_access", "lock", "users")
+
+    def __init__(self, now):
+        self.states = {}        # Exercise name -> state dict.
+        self.last_update = {}   # Exercise name -> time its state was last reset or written.
+        self.last_access = now
+        self.lock = threading.RLock()
+        self.users = 0          # Holders of the lock and threads waiting for it.
 
 class ExerciseStateWrapper:
     """
-    Wrapper for the exercise state dictionary.
-    If an exercise hasn’t been updated for more than reset_timeout seconds,
-    its state is reinitialized on next access.
+    Wrapper for the exercise state, kept separately for every session.
+
+    Keys are (session_id, exercise) tuples; a plain exercise name addresses
+    the state shared by requests without a session ID. If an exercise hasn’t
+    been updated for more than reset_timeout seconds, its state is
+    reinitialized on next access.
+
+    Sessions are kept in least recently used order, so lookups are O(1) and
+    sessions idle for longer than reset_timeout are evicted from the front
+    on every access. At most max_sessions sessions are kept; beyond that the
+    least recently used one is evicted even if it is not idle yet. Sessions
+    whose lock is held or awaited are never evicted, so that all their
+    requests keep sharing one lock; they count as used at every eviction.
     """
-    def __init__(self, reset_timeout=10):
-        self._state = {}        # Internal state storage.
-        self._last_reset = {}   # Timestamps for last reset per exercise.
+    def __init__(self, reset_timeout=10, max_sessions=MAX_LIVE_SESSIONS):
+        self._sessions = OrderedDict()  # session_id -> SessionStates, least recently used first.
         self._reset_timeout = reset_timeout
+        self._max_sessions = max_sessions
+        self._lock = threading.Lock()   # Guards the session table, not the states.
+
+    @staticmethod
+    def _split_key(key):
+        if isinstance(key, tuple):
+            return key
+        return None, key
+
+    def _touch_session(self, session_id, now):
+        """Fetch (or create) a session's states and evict idle sessions; call with self._lock held"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = SessionStates(now)
+        else:
+            self._sessions.move_to_end(session_id)
+            session.last_access = now
+
+        # The table is in access order, so idle sessions are all at the front.
+        # Sessions in use (and the one just touched) move to the back instead;
+        # each is passed over at most once.
+        passed = 0
+        while passed < len(self._sessions):
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if (len(self._sessions) <= self._max_sessions
+                    and now - oldest.last_access <= self._reset_timeout):
+                break
+            if oldest.users or oldest is session:
+                self._sessions.move_to_end(oldest_id)
+                oldest.last_access = now
+                passed += 1
+            else:
+                del self._sessions[oldest_id]
+        return session
 
     def get(self, key, default=None):
+        session_id, exercise = self._split_key(key)
         now = time.time()
-        # If this exercise has never been seen or it was last reset too long ago,
-        # reinitialize its state.
-        if key not in self._state or (now - self._last_reset.get(key, 0)) > self._reset_timeout:
-            self._state[key] = {"repCount": 0, "stage": "down", "feedback": "N/A"}
-            self._last_reset[key] = now
-        return self._state.get(key, default)
+        with self._lock:
+            session = self._touch_session(session_id, now)
+            # If this exercise has never been seen or it was last reset too long ago,
+            # reinitialize its state.
+            if (exercise not in session.states
+                    or (now - session.last_update.get(exercise, 0)) > self._reset_timeout):
+                session.states[exercise] = {"repCount": 0, "stage": "down", "feedback": "N/A"}
+                session.last_update[exercise] = now
+            return session.states.get(exercise, default)
 
     def __getitem__(self, key):
         return self.get(key)
 
     def __setitem__(self, key, value):
-        self._state[key] = value
-        self._last_reset[key] = time.time()
+        session_id, exercise = self._split_key(key)
+        now = time.time()
+        with self._lock:
+            session = self._touch_session(session_id, now)
+            session.states[exercise] = value
+            session.last_update[exercise] = now
+
+    @contextmanager
+    def lock(self, session_id=None):
+        """
+        Hold the lock serializing the frames of one session (reentrant).
+
+        Hold it across the read-evaluate-write cycle of a frame (or a whole
+        batch) so that concurrent requests of the same session cannot
+        interleave; different sessions never wait on each other. Requests
+        without a session ID all share one anonymous session (None), so they
+        are serialized with each other and share its exercise state.
+        """
+        with self._lock:
+            session = self._touch_session(session_id, time.time())
+            session.users += 1
+        try:
+            with session.lock:
+                yield
+        finally:
+            with self._lock:
+                session.users -= 1
 
     def reset_exercise(self, key):
         """
         Force a reset of the state for a given exercise.
         This can be called when a page loads.
         """
-        self._state[key] = {"repCount": 0, "stage": "down", "feedback": "N/A"}
-        self._last_reset[key] = time.time()
+        self[key] = {"repCount": 0, "stage": "down", "feedback": "N/A"}
+
+    def discard_session(self, session_id):
+        """Drop all exercise state of a session (e.g. when it ends)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            if session.users:
+                # Keep the lock its requests are holding or waiting for
+                session.states.clear()
+                session.last_update.clear()
+            else:
+                del self._sessions[session_id]
+
+    def __len__(self):
+        """Number of sessions currently holding state"""
+        return len(self._sessions)
 
     def clear(self):
-        self._state.clear()
-        self._last_reset.clear()
+        with self._lock:
+            self._sessions.clear()
 
-# Global dictionary to hold real-time exercise state.
+# Global per-session store of real-time exercise state.
 # Using our wrapper, which behaves like a normal dict for existing code.
 exercise_state = ExerciseStateWrapper()
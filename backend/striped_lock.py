@@ -0,0 +1,71 @@
+"""
+Striped Locks
+-------------
+A fixed pool of locks indexed by key hash, so that updates to different
+keys (sessions) almost never wait on each other while memory stays bounded
+no matter how many keys exist.
+
+Every acquisition is counted, and acquisitions that found their stripe
+already held are counted as contended together with the time spent waiting.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+class StripedLock:
+    """
+    Pool of locks selected by hash(key) % stripes.
+
+    Args:
+        stripes: Number of locks in the pool
+    """
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def stripe(self, key):
+        """Index of the lock guarding key"""
+        return hash(key) % len(self._locks)
+
+    @contextmanager
+    def hold(self, key):
+        """Hold the lock for key, recording whether it had to be waited for"""
+        lock = self._locks[self.stripe(key)]
+        waited = None
+        if not lock.acquire(blocking=False):
+            started = time.perf_counter()
+            lock.acquire()
+            waited = time.perf_counter() - started
+        try:
+            with self._stats_lock:
+                self.acquisitions += 1
+                if waited is not None:
+                    self.contended += 1
+                    self.wait_time += waited
+                    self.max_wait_time = max(self.max_wait_time, waited)
+            yield
+        finally:
+            lock.release()
+
+    def stats(self):
+        """Acquisition and contention counters"""
+        with self._stats_lock:
+            return {
+                "stripes": len(self._locks),
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "contention_rate": self.contended / self.acquisitions if self.acquisitions else 0.0,
+                "total_wait_ms": round(self.wait_time * 1000, 3),
+                "max_wait_ms": round(self.max_wait_time * 1000, 3)
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.acquisitions = 0
+            self.contended = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
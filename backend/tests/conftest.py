@@ -0,0 +1,34 @@
+"""
+Test configuration: the backend modules import each other as top-level
+modules (run from the backend directory), so the backend directory goes
+on sys.path.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    TestClient of the app (lifespan included), with session journals and
+    calibrations written to a temporary directory.
+    """
+    from fastapi.testclient import TestClient
+
+    import calibration_store
+    import session_journal
+    import session_state
+    from main import app
+
+    monkeypatch.setattr(session_journal, "LOGS_DIR", tmp_path)
+    monkeypatch.setattr(session_journal, "INDEX_PATH", tmp_path / "index.jsonl")
+    monkeypatch.setattr(session_journal, "index_offsets", None)
+    monkeypatch.setattr(session_state, "LOGS_DIR", tmp_path)
+    calibrations = tmp_path / "calibrations"
+    calibrations.mkdir()
+    monkeypatch.setattr(calibration_store, "calibration_dir", calibrations)
+    with TestClient(app) as client:
+        yield client
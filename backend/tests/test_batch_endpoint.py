@@ -0,0 +1,69 @@
+"""Tests for the batched landmarks endpoint"""
+import pytest
+
+from benchmarks.synthetic import generate_sequence, to_landmark_lists
+from main import get_frame_times
+
+# Result fields that depend on when frames were received
+TIMING_FIELDS = {"processing_time_ms", "descent_time", "concentric_time", "last_stage_time"}
+
+@pytest.fixture(scope="module")
+def squat_frames():
+    """Two squat reps of 30 frames each"""
+    return to_landmark_lists(generate_sequence("squats", frame_count=60, frames_per_rep=30))
+
+def start_session(client):
+    return client.post("/session/start", json={"exercise_type": "squats"}).json()["session_id"]
+
+def without_timing(result):
+    return {key: value for key, value in result.items() if key not in TIMING_FIELDS}
+
+def test_reps_are_counted_across_a_batch(client, squat_frames):
+    session_id = start_session(client)
+    response = client.post(
+        f"/landmarks/squats/batch?session_id={session_id}",
+        json={"frames": [{"landmarks": landmarks} for landmarks in squat_frames]}
+    ).json()
+
+    assert response["frame_count"] == 60
+    counters = [result["counter"] for result in response["results"]]
+    assert counters == sorted(counters) and counters[-1] == 2
+    # Each rep is counted once, on the frame that completes it
+    assert sum(after > before for before, after in zip([0] + counters, counters)) == 2
+    summary = client.get(f"/session/{session_id}/summary").json()
+    assert summary["metrics"]["total_reps"] == 2
+
+def test_client_timestamps_are_echoed_per_frame(client, squat_frames):
+    frames = [
+        {"landmarks": landmarks, "timestamp": 1000.0 + 33.3 * index}
+        for index, landmarks in enumerate(squat_frames[:5])
+    ]
+    frames[2]["timestamp"] = None
+    results = client.post("/landmarks/squats/batch", json={"frames": frames}).json()["results"]
+    assert [result.get("timestamp") for result in results] == [
+        frame["timestamp"] for frame in frames
+    ]
+
+def test_frame_times_keep_the_client_spacing_up_to_the_received_time():
+    assert get_frame_times([1000.0, 1100.0, 1400.0], 50.0) == pytest.approx([49.6, 49.7, 50.0])
+    # Without a timestamp for every frame all frames count as received at once
+    assert get_frame_times([1000.0, None], 50.0) == [50.0, 50.0]
+
+def test_a_batch_matches_the_same_frames_sent_one_at_a_time(client, squat_frames):
+    batched = client.post(
+        f"/landmarks/squats/batch?session_id={start_session(client)}",
+        json={"frames": [{"landmarks": landmarks} for landmarks in squat_frames]}
+    ).json()["results"]
+    single_session = start_session(client)
+    singles = [
+        client.post(f"/landmarks/squats?session_id={single_session}", json={"landmarks": landmarks}).json()
+        for landmarks in squat_frames
+    ]
+    assert [without_timing(result) for result in batched] == [without_timing(result) for result in singles]
+
+def test_batches_need_frames_and_a_known_exercise(client, squat_frames):
+    response = client.post("/landmarks/squats/batch", json={"frames": []})
+    assert response.status_code == 400
+    assert response.json() == {"error": "No frames provided"}
+    response = client.post("/landmarks/jumping_jacks/batch", json={"frames": [{"landmarks": squat_frames[0]}]})
+    assert response.status_code == 404
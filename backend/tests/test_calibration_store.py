@@ -0,0 +1,47 @@
+"""Tests for calibration persistence and retention"""
+import os
+import time
+
+import pytest
+
+import calibration_store
+from ttl_cache import TTLCache
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Calibration store persisting to a temporary directory"""
+    monkeypatch.setattr(calibration_store, "calibration_dir", tmp_path)
+    monkeypatch.setattr(calibration_store, "calibrations", TTLCache(max_entries=8))
+    return calibration_store
+
+def age_file(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_cache_hits_keep_the_file_from_being_pruned(store):
+    calibration_id = store.save_calibration({"scaling_factor": 0.5})
+    path = store.calibration_path(calibration_id)
+    # In use for longer than the retention period, served from the cache only
+    age_file(path, store.CALIBRATION_RETENTION + 60)
+    store.calibrations.get(calibration_id)[1] -= store.TOUCH_INTERVAL + 1
+
+    assert store.get_calibration(calibration_id) == {"scaling_factor": 0.5}
+    assert store.prune_calibrations(force=True) == 0
+    assert path.exists()
+
+def test_cache_hits_refresh_the_file_at_most_every_touch_interval(store):
+    calibration_id = store.save_calibration({"scaling_factor": 0.5})
+    path = store.calibration_path(calibration_id)
+    age_file(path, 120)
+    store.get_calibration(calibration_id)
+    assert time.time() - path.stat().st_mtime > 100
+
+def test_unused_files_are_pruned(store):
+    calibration_id = store.save_calibration({"scaling_factor": 0.5})
+    path = store.calibration_path(calibration_id)
+    store.calibrations.clear()
+    age_file(path, store.CALIBRATION_RETENTION + 60)
+
+    assert store.get_calibration(calibration_id) is None
+    assert store.prune_calibrations(force=True) == 1
+    assert not path.exists()
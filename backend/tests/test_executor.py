@@ -0,0 +1,70 @@
+"""Tests for the analysis executor and the ordered recording of reps"""
+import asyncio
+import random
+import time
+
+import pytest
+
+import executor
+import session_journal
+import session_state
+from benchmarks.synthetic import generate_sequence
+from executor import AnalysisExecutor, RepQueue
+from state import exercise_state
+
+@pytest.fixture
+def session_store(tmp_path, monkeypatch):
+    """Session journals in a temporary directory"""
+    monkeypatch.setattr(session_journal, "LOGS_DIR", tmp_path)
+    monkeypatch.setattr(session_state, "LOGS_DIR", tmp_path)
+    yield tmp_path
+    # Buffered records go to the temporary directory too
+    session_journal.flush_all_journals()
+
+def slow_record_rep(recorded):
+    """record_rep stand-in that takes a random while and notes what it got"""
+    def record(session_id, exercise, feedback_flags, metrics=None, timestamp=None):
+        time.sleep(random.uniform(0, 0.005))
+        recorded.append((session_id, metrics["seq"]))
+    return record
+
+def test_rep_queue_records_each_sessions_reps_in_submission_order(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(executor, "record_rep", slow_record_rep(recorded))
+    queue = RepQueue()
+    futures = [
+        queue.submit(session_id, [(session_id, "squats", [], {"seq": seq}, None)])
+        for seq in range(20) for session_id in ("a", "b")
+    ]
+    for future in futures:
+        future.result(timeout=5)
+
+    for session_id in ("a", "b"):
+        assert [seq for sid, seq in recorded if sid == session_id] == list(range(20))
+    # Drained queues are dropped
+    assert queue._queues == {}
+
+def test_concurrent_requests_record_reps_in_the_order_they_happened(session_store, monkeypatch):
+    # Recording takes a random while, so batches recorded concurrently would overtake each other
+    record_rep = session_state.record_rep
+    def slow_record(*rep):
+        time.sleep(random.uniform(0, 0.01))
+        return record_rep(*rep)
+    monkeypatch.setattr(executor, "record_rep", slow_record)
+
+    session_id = session_state.start_session(exercise_type="squats")
+    frames = generate_sequence("squats", frame_count=600, frames_per_rep=30)
+    chunks = [frames[start:start + 10] for start in range(0, len(frames), 10)]
+
+    async def run():
+        analysis = AnalysisExecutor("thread", 4)
+        return await asyncio.gather(*(
+            analysis.analyze("squats", chunk, 0.1, session_id) for chunk in chunks
+        ))
+
+    asyncio.run(run())
+    reps = session_state.get_session(session_id)["rep_log"]
+    assert len(reps) == exercise_state[(session_id, "squats")]["counter"] > 1
+    # Timestamps are those of the reps' completion, in the order the counter reached them
+    timestamps = [rep["timestamp"] for rep in reps]
+    assert timestamps == sorted(timestamps)
@@ -0,0 +1,112 @@
+"""Tests for the compiled deadlift forest"""
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+import deadlift_model
+from forest_compiler import (
+    CompiledForest, compile_pipeline, fold_scaler_thresholds, load_forest, probe_rows, save_forest
+)
+from landmarks import landmarks as LANDMARK_COLUMNS
+
+def fitted_pipeline(features=6, seed=0, columns=None):
+    """A small scaled forest on random data, fitted on a DataFrame if columns are given"""
+    rng = np.random.default_rng(seed)
+    rows = rng.normal(loc=3.0, scale=0.01, size=(300, features))
+    labels = np.where(rows[:, 0] + rows[:, 1] > 6.0, "up", "down")
+    pipeline = make_pipeline(StandardScaler(), RandomForestClassifier(n_estimators=10, random_state=seed))
+    return pipeline.fit(rows if columns is None else pd.DataFrame(rows, columns=columns), labels), rows
+
+def test_folded_thresholds_split_raw_values_like_the_scaler():
+    rng = np.random.default_rng(1)
+    thresholds = rng.normal(size=200).astype(np.float32).astype(np.float64)
+    mean, scale = rng.normal(size=200), rng.uniform(0.001, 10.0, size=200)
+    folded = fold_scaler_thresholds(thresholds, mean, scale)
+
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32).astype(np.float64) <= thresholds
+
+    assert goes_left(folded).all()
+    assert not goes_left(np.nextafter(folded, np.inf)).any()
+
+def test_compiled_probabilities_are_bit_for_bit_the_pipelines():
+    pipeline, rows = fitted_pipeline()
+    arrays = compile_pipeline(pipeline)
+    compiled = CompiledForest(arrays)
+    rows = np.concatenate([rows, probe_rows(arrays, rows.mean(axis=0))])
+
+    assert np.array_equal(compiled.predict_proba(rows), pipeline.predict_proba(rows))
+    assert list(compiled.classes_) == ["down", "up"]
+
+def test_column_order_reads_rows_in_another_order():
+    pipeline, rows = fitted_pipeline()
+    order = np.array([3, 0, 5, 1, 4, 2])
+    compiled = CompiledForest(compile_pipeline(pipeline, order))
+    # Model feature i is input column order[i]
+    shuffled = np.empty_like(rows)
+    shuffled[:, order] = rows
+    assert np.array_equal(compiled.predict_proba(shuffled), pipeline.predict_proba(rows))
+
+def test_rows_of_the_wrong_width_are_rejected():
+    compiled = CompiledForest(compile_pipeline(fitted_pipeline()[0]))
+    with pytest.raises(ValueError, match="Expected rows of 6 features"):
+        compiled.predict_proba(np.zeros((2, 5)))
+
+def test_only_a_forest_behind_a_scaler_is_compiled():
+    pipeline, _ = fitted_pipeline()
+    with pytest.raises(ValueError):
+        compile_pipeline(make_pipeline(StandardScaler(), StandardScaler(), pipeline.steps[-1][1]))
+
+def test_saved_forests_load_with_their_metadata(tmp_path):
+    pipeline, rows = fitted_pipeline()
+    arrays = compile_pipeline(pipeline)
+    save_forest(arrays, tmp_path / "forest.npz", source_sha256="abc")
+    forest, metadata = load_forest(tmp_path / "forest.npz")
+    assert metadata == {"source_sha256": "abc"}
+    assert np.array_equal(forest.predict_proba(rows), pipeline.predict_proba(rows))
+
+    arrays["format_version"] = np.array(99)
+    with pytest.raises(ValueError, match="Unsupported compiled forest format 99"):
+        CompiledForest(arrays)
+
+@pytest.fixture
+def model_paths(tmp_path):
+    """A deadlift-style pickle, fitted on the landmark columns in shuffled order"""
+    columns = [str(column) for column in np.random.default_rng(2).permutation(LANDMARK_COLUMNS)]
+    pipeline, _ = fitted_pipeline(features=len(columns), columns=columns)
+    path = tmp_path / "deadlift.pkl"
+    with open(path, "wb") as f:
+        pickle.dump(pipeline, f)
+    return path, tmp_path / "deadlift_forest.npz"
+
+def test_compiled_model_matches_the_pickle_on_frames(model_paths):
+    path, output_path = model_paths
+    deadlift_model.compile_model(path, output_path)
+    compiled, column_order = deadlift_model.load_compiled_model(output_path, path)
+    assert column_order is None
+    model, pickle_order = deadlift_model.load_model(path)
+    assert pickle_order is not None
+
+    frames = np.random.default_rng(3).normal(loc=3.0, scale=0.01, size=(50, 33, 4))
+    assert np.array_equal(
+        compiled.predict_proba(deadlift_model.frames_to_features(frames)),
+        model.predict_proba(deadlift_model.frames_to_features(frames, pickle_order))
+    )
+
+def test_a_forest_compiled_from_another_pickle_is_refused(model_paths):
+    path, output_path = model_paths
+    deadlift_model.compile_model(path, output_path)
+    with open(path, "ab") as f:
+        f.write(b"retrained")
+    with pytest.raises(ValueError, match="was not compiled from the current"):
+        deadlift_model.load_compiled_model(output_path, path)
+    # Without the pickle deployed there is nothing to check against
+    path.unlink()
+    assert deadlift_model.load_compiled_model(output_path, path)[0].n_features_in_ == 132
@@ -0,0 +1,101 @@
+"""Tests for the binary landmark frame encoding"""
+import uuid
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_sequence, to_landmark_lists
+from frame_codec import (
+    FRAME_SIZE, HEADERED_FRAME_SIZE, FrameDecodeError, decode_frames, encode_frames,
+    is_binary_content_type
+)
+
+@pytest.fixture(scope="module")
+def frames():
+    return generate_sequence("squats", frame_count=4).astype("<f4")
+
+def test_raw_frames_round_trip(frames):
+    body = encode_frames(frames)
+    assert len(body) == 4 * FRAME_SIZE
+    decoded, timestamps, session_id = decode_frames(body)
+    assert np.array_equal(decoded, frames)
+    assert (timestamps, session_id) == (None, None)
+
+def test_headered_frames_round_trip(frames):
+    session_id = str(uuid.uuid4())
+    body = encode_frames(frames, timestamps=[10.0, 20.0, 30.5, 40.0], session_id=session_id)
+    assert len(body) == 4 * HEADERED_FRAME_SIZE
+    decoded, timestamps, decoded_session = decode_frames(body)
+    assert np.array_equal(decoded, frames)
+    assert timestamps == [10.0, 20.0, 30.5, 40.0]
+    assert decoded_session == session_id
+
+def test_headers_without_a_session(frames):
+    _, timestamps, session_id = decode_frames(encode_frames(frames[:1], timestamps=[5.0]))
+    assert (timestamps, session_id) == ([5.0], None)
+
+def test_decoded_frames_view_the_body(frames):
+    decoded, _, _ = decode_frames(encode_frames(frames))
+    assert not decoded.flags.owndata
+
+@pytest.mark.parametrize("body, message", [
+    (b"", "Empty frame payload"),
+    (b"\x00" * (FRAME_SIZE + 4), "multiple of 528 bytes"),
+    (b"RGXF" + b"\x00" * 100, "multiple of 560 bytes"),
+])
+def test_truncated_payloads_are_rejected(body, message):
+    with pytest.raises(FrameDecodeError, match=message):
+        decode_frames(body)
+
+def test_truncated_headered_frames_are_rejected(frames):
+    body = encode_frames(frames[:2], timestamps=[1.0, 2.0])
+    with pytest.raises(FrameDecodeError):
+        decode_frames(body[:-1])
+
+@pytest.mark.parametrize("offset, value", [(4, 2), (HEADERED_FRAME_SIZE, ord("X"))])
+def test_invalid_headers_are_rejected(frames, offset, value):
+    # An unknown version in the first header, a bad magic in the second
+    body = bytearray(encode_frames(frames[:2], timestamps=[1.0, 2.0]))
+    body[offset] = value
+    with pytest.raises(FrameDecodeError, match="Invalid frame header"):
+        decode_frames(bytes(body))
+
+def test_binary_content_types():
+    assert is_binary_content_type("application/octet-stream")
+    assert is_binary_content_type("Application/X-Regenix-Frames; charset=binary")
+    assert not is_binary_content_type("application/json")
+    assert not is_binary_content_type(None)
+
+def test_octet_stream_requests_match_json_requests(client, frames):
+    # Separate sessions, so that both requests analyze a first frame
+    sessions = [client.post("/session/start", json={}).json()["session_id"] for _ in range(2)]
+    json_result = client.post(
+        f"/landmarks/squats?session_id={sessions[0]}", json={"landmarks": to_landmark_lists(frames[:1])[0]}
+    ).json()
+    binary_result = client.post(
+        f"/landmarks/squats?session_id={sessions[1]}", content=encode_frames(frames[:1]),
+        headers={"Content-Type": "application/octet-stream"}
+    ).json()
+    for result in (json_result, binary_result):
+        del result["processing_time_ms"], result["last_stage_time"]
+    assert binary_result == json_result
+
+def test_octet_stream_requests_take_the_session_from_the_header(client):
+    session_id = client.post("/session/start", json={}).json()["session_id"]
+    two_reps = generate_sequence("squats", frame_count=60, frames_per_rep=30)
+    body = encode_frames(two_reps, timestamps=list(range(60)), session_id=session_id)
+    response = client.post(
+        "/landmarks/squats/batch", content=body, headers={"Content-Type": "application/octet-stream"}
+    ).json()
+    assert response["results"][-1]["counter"] == 2
+    assert [result["timestamp"] for result in response["results"]] == list(range(60))
+    assert client.get(f"/session/{session_id}/summary").json()["metrics"]["total_reps"] == 2
+
+def test_octet_stream_errors(client, frames):
+    binary = {"Content-Type": "application/octet-stream"}
+    response = client.post("/landmarks/squats", content=b"\x00" * 10, headers=binary)
+    assert response.status_code == 400
+    assert "multiple of 528 bytes" in response.json()["error"]
+    response = client.post("/landmarks/squats", content=encode_frames(frames[:2]), headers=binary)
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Expected exactly one frame")
@@ -0,0 +1,126 @@
+"""
+Tests that the geometry backends compute the same features: the Numba and
+plain Python kernels bit for bit, the NumPy path to rounding.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import geometry
+from benchmarks.synthetic import EXERCISES, generate_sequence, to_landmark_lists
+from geometry import extract_features, frames_to_array, landmarks_to_array, set_geometry_backend
+import geometry_kernels
+from geometry_kernels import NUMBA_AVAILABLE
+
+requires_numba = pytest.mark.skipif(not NUMBA_AVAILABLE, reason="Numba is not installed")
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    backend = geometry.GEOMETRY_BACKEND
+    yield
+    set_geometry_backend(backend)
+
+def features(frames, backend):
+    set_geometry_backend(backend)
+    return extract_features(frames).matrix
+
+def exercise_batches():
+    """Frame batches of every exercise, clean and with jitter, dropped landmarks and poor visibility"""
+    for exercise in EXERCISES:
+        yield exercise, generate_sequence(exercise, 120, 60, noise=0.0, dropout=0.0, seed=1)
+        yield f"{exercise}-noisy", generate_sequence(
+            exercise, 120, 60, noise=0.01, dropout=0.05, visibility_loss=0.1, seed=2
+        )
+
+def edge_case_frames():
+    """Frames from landmark dicts with missing entries, degenerate and vertical poses"""
+    frames = [to_landmark_lists(generate_sequence("squats", 1, 60, noise=0.0, dropout=0.0))[0]]
+    missing = [dict(landmark) for landmark in frames[0]]
+    missing[25] = None                        # Left knee not detected
+    missing[12] = {"y": 0.3, "z": 0.0}        # Right shoulder without x
+    frames.append(missing[:30])               # Truncated frame
+    frames.append([{"x": 0.5, "y": 0.1 * (i % 10), "z": 0.0, "visibility": 1.0} for i in range(33)])
+    frames.append([{"x": 0.5, "y": 0.5, "z": 0.0, "visibility": 1.0}] * 33)
+    return frames_to_array(frames)
+
+BATCHES = list(exercise_batches()) + [("edge-cases", edge_case_frames())]
+
+@requires_numba
+@pytest.mark.parametrize("name, frames", BATCHES, ids=[name for name, _ in BATCHES])
+def test_numba_and_python_kernels_are_identical(name, frames):
+    numba_matrix = features(frames, "numba")
+    python_matrix = features(frames, "python")
+    assert np.array_equal(numba_matrix, python_matrix, equal_nan=True)
+
+@pytest.mark.parametrize("name, frames", BATCHES, ids=[name for name, _ in BATCHES])
+def test_numpy_path_matches_the_kernels(name, frames):
+    python_matrix = features(frames, "python")
+    numpy_matrix = features(frames, "numpy")
+    assert np.array_equal(np.isnan(python_matrix), np.isnan(numpy_matrix))
+    assert np.allclose(numpy_matrix, python_matrix, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+def test_missing_landmarks_give_nan_features():
+    frames = edge_case_frames()
+    for backend in ("python", "numpy") + (("numba",) if NUMBA_AVAILABLE else ()):
+        result = features(frames[1:2], backend)
+        knee_angles = result[0, :2]
+        assert np.isnan(knee_angles[0]) and not np.isnan(knee_angles[1])
+
+@pytest.mark.parametrize("exercise", EXERCISES)
+def test_single_frame_matches_its_batch(exercise):
+    landmark_lists = to_landmark_lists(
+        generate_sequence(exercise, 30, 30, noise=0.005, dropout=0.02, seed=3)
+    )
+    batch = frames_to_array(landmark_lists)
+    backends = ("python", "numpy") + (("numba",) if NUMBA_AVAILABLE else ())
+    for backend in backends:
+        batch_matrix = features(batch, backend)
+        for index in (0, 14, 29):
+            single = features(landmarks_to_array(landmark_lists[index])[None], backend)
+            assert single.shape == (1, batch_matrix.shape[1])
+            assert np.array_equal(single[0], batch_matrix[index], equal_nan=True)
+
+def test_auto_backend_resolution():
+    set_geometry_backend("auto")
+    if NUMBA_AVAILABLE:
+        assert geometry.resolve_geometry_backend(1) == "numba"
+        assert geometry.resolve_geometry_backend(1000) == "numba"
+    else:
+        assert geometry.resolve_geometry_backend(1) == "python"
+        assert geometry.resolve_geometry_backend(geometry.VECTORIZE_MIN_FRAMES) == "numpy"
+
+# Imports geometry (which warms up the kernels) and reports Numba's cache counters
+CACHE_PROBE = """
+import json
+import geometry, geometry_kernels
+stats = geometry_kernels.batch_features.stats
+print(json.dumps([sum(stats.cache_hits.values()), sum(stats.cache_misses.values())]))
+"""
+
+@requires_numba
+def test_second_import_loads_the_kernels_from_numbas_cache(tmp_path):
+    backend_dir = os.path.dirname(os.path.abspath(geometry_kernels.__file__))
+    env = dict(os.environ, NUMBA_CACHE_DIR=str(tmp_path), REGENIX_GEOMETRY_BACKEND="auto")
+
+    def import_counters():
+        output = subprocess.run(
+            [sys.executable, "-c", CACHE_PROBE], cwd=backend_dir, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    assert import_counters() == [0, 1]
+    cache_files = sorted(path.name for path in tmp_path.rglob("*.nb[ic]"))
+    assert cache_files
+    assert import_counters() == [1, 0]
+    # Loading from the cache writes no new index or code files
+    assert sorted(path.name for path in tmp_path.rglob("*.nb[ic]")) == cache_files
+
+@requires_numba
+def test_python_kernels_are_not_compiled():
+    assert not hasattr(geometry_kernels.python_batch_features, "py_func")
+    assert hasattr(geometry_kernels.numba_batch_features, "py_func")
@@ -0,0 +1,103 @@
+"""Tests for request metrics and the /metrics endpoint"""
+import re
+
+import pytest
+
+import metrics
+from metrics import (
+    MAX_VALUE_US, SUB_BUCKETS, LatencyHistogram, NULL_STAGE_TIMER, StageTimer, bucket_bounds,
+    bucket_index
+)
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    """Empty metric tables, so that tests see only their own requests"""
+    for name in ("stage_histograms", "request_histograms", "request_counts", "error_counts"):
+        monkeypatch.setattr(metrics, name, {})
+    monkeypatch.setattr(metrics, "in_flight_requests", 0)
+
+def fake_clock(monkeypatch, times):
+    ticks = iter(times)
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: next(ticks))
+
+def test_buckets_hold_their_values_within_the_relative_precision():
+    values = list(range(2 * SUB_BUCKETS)) + [1000, 4097, 123456, 10 ** 7, MAX_VALUE_US]
+    for value in values:
+        low, high = bucket_bounds(bucket_index(value))
+        assert low <= value <= high
+        assert high - low + 1 <= max(1, 2 * low / SUB_BUCKETS)
+    # Buckets are contiguous
+    for index in range(1, bucket_index(10 ** 6)):
+        assert bucket_bounds(index)[0] == bucket_bounds(index - 1)[1] + 1
+
+def test_recording_counts_the_bucket_of_each_value():
+    histogram = LatencyHistogram()
+    for seconds in (0.0, 0.000050, 0.0015, 3.2, 10 ** 6):
+        histogram.record(seconds)
+    for value in (0, 50, 1500, 3_200_000, MAX_VALUE_US):
+        assert histogram._counts[bucket_index(value)] == 1
+    assert histogram.count == 5
+    assert histogram.max == 10 ** 6
+
+def test_quantiles_are_within_the_bucket_precision():
+    histogram = LatencyHistogram()
+    assert histogram.quantiles() is None
+    for millis in range(1, 1001):
+        histogram.record(millis / 1000)
+    for quantile, value in zip((0.5, 0.9, 0.99), histogram.quantiles()):
+        assert value == pytest.approx(quantile, rel=1 / SUB_BUCKETS)
+    assert histogram.sum == pytest.approx(500.5)
+    # Never above the largest value recorded
+    single = LatencyHistogram()
+    single.record(0.0015)
+    assert single.quantiles([1.0]) == [pytest.approx(0.0015, rel=1 / SUB_BUCKETS)]
+    assert single.quantiles([1.0])[0] <= 0.0015
+
+def test_stage_timer_charges_the_time_between_marks(monkeypatch):
+    fake_clock(monkeypatch, [10.0, 10.5, 11.0, 11.25, 12.0])
+    timer = StageTimer()
+    timer.mark("decode")
+    timer.mark("geometry")
+    timer.mark("decode")
+    # 0.5 s measured elsewhere, the remaining 0.25 s were spent waiting
+    timer.absorb({"geometry": 0.5}, "queue_wait")
+    assert timer.durations == {"decode": 0.75, "geometry": 1.0, "queue_wait": 0.25}
+    assert timer.elapsed() == 2.0
+
+def test_null_timer_records_nothing():
+    NULL_STAGE_TIMER.mark("decode")
+    NULL_STAGE_TIMER.absorb({"geometry": 1.0}, "queue_wait")
+    assert NULL_STAGE_TIMER.durations == {}
+
+def sample(text, name, **labels):
+    """Value of one sample in the exposition text"""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    if labels:
+        name += "{" + label_text + "}"
+    match = re.search(rf"^{re.escape(name)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+def test_metrics_endpoint_reports_requests_stages_and_errors(client, fresh_metrics):
+    landmarks = [{"x": 0.5, "y": 0.5, "z": 0.0, "visibility": 1.0}] * 33
+    session_id = client.post("/session/start", json={}).json()["session_id"]
+    for _ in range(3):
+        response = client.post(f"/landmarks/squats?session_id={session_id}", json={"landmarks": landmarks})
+        assert response.status_code == 200
+    client.post("/landmarks/squats", json={})
+    client.post("/landmarks/jumping_jacks", json={"landmarks": landmarks})
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert sample(text, "regenix_requests_total", endpoint="landmarks", exercise="squats") == 4
+    assert sample(text, "regenix_requests_total", endpoint="landmarks", exercise="unknown") == 1
+    assert sample(text, "regenix_errors_total", endpoint="landmarks", type="no_landmarks") == 1
+    assert sample(text, "regenix_errors_total", endpoint="landmarks", type="exercise_not_found") == 1
+    # Only successful requests are timed
+    assert sample(text, "regenix_request_latency_seconds_count", endpoint="landmarks", exercise="squats") == 3
+    for stage in ("decode", "extract", "geometry", "encode"):
+        assert sample(text, "regenix_stage_latency_seconds_count", exercise="squats", stage=stage) == 3
+        assert sample(text, "regenix_stage_latency_seconds", exercise="squats", stage=stage, quantile=0.5) >= 0
+    assert sample(text, "regenix_in_flight_requests") == 0
+    assert "# TYPE regenix_io_queue_depth gauge" in text
+    assert "# TYPE regenix_stage_latency_seconds summary" in text
@@ -0,0 +1,64 @@
+"""Tests for the asyncio micro-batching scheduler"""
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from micro_batch import AsyncMicroBatcher, BatchQueueFull
+
+def blocking_batch_fn(release):
+    """Batch function that doubles its rows once release is set"""
+    def batch_fn(rows):
+        release.wait(5)
+        return rows * 2
+    return batch_fn
+
+def test_results_are_sliced_per_submission():
+    async def run():
+        batcher = AsyncMicroBatcher(lambda rows: rows * 2, max_batch_rows=8, max_wait_ms=1)
+        first, second = np.ones((2, 3)), np.full((3, 3), 5.0)
+        results = await asyncio.gather(batcher.submit(first), batcher.submit(second))
+        return batcher, results
+
+    batcher, (first, second) = asyncio.run(run())
+    assert np.array_equal(first, np.full((2, 3), 2.0))
+    assert np.array_equal(second, np.full((3, 3), 10.0))
+    assert batcher.stats()["batches"] == 1
+
+def test_rows_of_running_batches_count_against_the_queue_limit():
+    release = threading.Event()
+
+    async def run():
+        batcher = AsyncMicroBatcher(blocking_batch_fn(release), max_batch_rows=2, max_wait_ms=1,
+                                    max_queue_rows=4)
+        # Both full batches are dispatched at once: one runs, one waits for the worker
+        accepted = [asyncio.create_task(batcher.submit(np.ones((2, 1)))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert batcher.stats()["queued_rows"] == 0
+        assert batcher.stats()["in_flight_rows"] == 4
+
+        with pytest.raises(BatchQueueFull):
+            await batcher.submit(np.ones((1, 1)))
+        assert batcher.stats()["rejected"] == 1
+
+        release.set()
+        results = await asyncio.gather(*accepted)
+        # Finished batches free their rows
+        assert batcher.stats()["in_flight_rows"] == 0
+        results.append(await batcher.submit(np.ones((2, 1))))
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        release.set()
+    assert all(np.array_equal(result, np.full((2, 1), 2.0)) for result in results)
+
+def test_oversized_submission_is_accepted_when_nothing_is_pending():
+    async def run():
+        batcher = AsyncMicroBatcher(lambda rows: rows, max_batch_rows=2, max_wait_ms=1,
+                                    max_queue_rows=4)
+        return await batcher.submit(np.ones((6, 1)))
+
+    assert len(asyncio.run(run())) == 6
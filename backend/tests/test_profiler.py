@@ -0,0 +1,127 @@
+"""Tests for the sampling profiler and its admin endpoints"""
+import threading
+import time
+
+import pytest
+
+import profiler
+from profiler import ProfilerBusy, profile_request, start_capture, stop_capture
+from routers import admin_router
+
+@pytest.fixture(autouse=True)
+def no_capture(monkeypatch):
+    """No capture running or recorded before the test, none left running after it"""
+    monkeypatch.setattr(profiler, "active_capture", None)
+    monkeypatch.setattr(profiler, "last_capture", None)
+    yield
+    stop_capture()
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def spin_for_profiler(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def test_threads_working_for_a_capture_are_sampled():
+    capture = start_capture(seconds=5, interval_ms=1)
+
+    def work():
+        capture.enter_thread()
+        try:
+            spin_for_profiler(0.2)
+        finally:
+            capture.exit_thread()
+
+    worker = threading.Thread(target=work)
+    worker.start()
+    worker.join()
+    stop_capture()
+
+    assert not capture.running
+    assert capture.samples > 0
+    top = capture.collapsed().splitlines()[0]
+    assert "spin_for_profiler (tests/test_profiler.py:" in top
+    assert top.split(";")[-1].startswith("spin_for_profiler")
+    profile = capture.speedscope()
+    assert "spin_for_profiler" in {frame["name"] for frame in profile["shared"]["frames"]}
+    assert profile["profiles"][0]["endValue"] == pytest.approx(capture.samples * 0.001)
+
+def test_unregistered_threads_are_not_sampled():
+    capture = start_capture(seconds=5, interval_ms=1)
+    spin_for_profiler(0.05)
+    stop_capture()
+    assert (capture.samples, capture.collapsed()) == (0, "")
+
+def test_capture_stops_after_its_requests():
+    capture = start_capture(requests=2, interval_ms=1)
+    profiled = [profile_request("squats") for _ in range(3)]
+    assert profiled == [capture, capture, None]
+    for request in profiled[:2]:
+        request.end_request()
+    assert wait_for(lambda: profiler.active_capture is None)
+    assert capture.status()["running"] is False
+    assert capture.status()["requests_profiled"] == 2
+    # Nothing to profile once it has stopped
+    assert profile_request("squats") is None
+
+def test_captures_of_one_exercise_skip_the_others():
+    capture = start_capture(exercise="deadlifts")
+    assert profile_request("squats") is None
+    assert profile_request("deadlifts") is capture
+
+def test_only_one_capture_runs_at_a_time():
+    start_capture()
+    with pytest.raises(ProfilerBusy):
+        start_capture()
+    stop_capture()
+    assert wait_for(lambda: profiler.active_capture is None)
+    start_capture()
+
+@pytest.fixture
+def admin(client, monkeypatch):
+    """The client, with the admin endpoints enabled"""
+    monkeypatch.setattr(admin_router, "ADMIN_TOKEN", "secret")
+    client.headers["X-Admin-Token"] = "secret"
+    return client
+
+def test_admin_endpoints_need_the_token(client, monkeypatch):
+    assert client.get("/admin/profiler").status_code == 404
+    monkeypatch.setattr(admin_router, "ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profiler").status_code == 403
+    assert client.get("/admin/profiler", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiler", headers={"X-Admin-Token": "secret"}).json() == {"running": False}
+
+def test_profiling_requests_through_the_admin_endpoints(admin):
+    assert admin.get("/admin/profiler/result").status_code == 404
+    status = admin.post("/admin/profiler/start", params={"requests": 1, "exercise": "squats"}).json()
+    assert status["running"] is True
+    assert (status["max_requests"], status["exercise"]) == (1, "squats")
+    assert admin.post("/admin/profiler/start").status_code == 409
+
+    landmarks = [{"x": 0.5, "y": 0.5, "z": 0.0, "visibility": 1.0}] * 33
+    session_id = admin.post("/session/start", json={}).json()["session_id"]
+    admin.post(f"/landmarks/squats?session_id={session_id}", json={"landmarks": landmarks})
+    assert wait_for(lambda: not admin.get("/admin/profiler").json()["running"])
+    assert admin.get("/admin/profiler").json()["requests_profiled"] == 1
+
+    collapsed = admin.get("/admin/profiler/result")
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    assert 'collapsed.txt"' in collapsed.headers["content-disposition"]
+    speedscope = admin.get("/admin/profiler/result", params={"format": "speedscope"})
+    assert speedscope.json()["exporter"] == "regenix-profiler"
+    assert 'speedscope.json"' in speedscope.headers["content-disposition"]
+    assert admin.get("/admin/profiler/result", params={"format": "pprof"}).status_code == 422
+
+def test_stopping_through_the_admin_endpoints(admin):
+    admin.post("/admin/profiler/start", params={"seconds": 60})
+    status = admin.post("/admin/profiler/stop").json()
+    assert status["running"] is False
+    assert status["elapsed_seconds"] < 60
+    assert admin.post("/admin/profiler/start", params={"seconds": 301}).status_code == 422
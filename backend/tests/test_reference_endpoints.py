@@ -0,0 +1,84 @@
+"""Tests for the reference skeleton and trajectory endpoints"""
+import numpy as np
+import pytest
+
+from reference_poses import (
+    LANDMARK_INDICES, T_POSE_REFERENCE, calibrate_user_skeleton, get_reference_skeleton,
+    get_reference_trajectory
+)
+
+def t_pose_landmarks(scale, offset):
+    """The reference T-pose scaled and moved, as a 33-landmark list"""
+    landmarks = [{"x": 0.0, "y": 0.0}] * 33
+    for name, index in LANDMARK_INDICES.items():
+        x, y = T_POSE_REFERENCE[name]
+        landmarks[index] = {"x": x * scale + offset[0], "y": y * scale + offset[1]}
+    return landmarks
+
+def points(skeleton):
+    """(x, y) of the landmarks a skeleton has, NaN for the others"""
+    return np.array([(point["x"], point["y"]) if point else (np.nan, np.nan) for point in skeleton])
+
+@pytest.mark.parametrize("progress", [0.0, 0.37, 0.5, 0.999, 1.0])
+def test_skeletons_follow_the_reference_pose(client, progress):
+    response = client.get("/reference/skeleton/squats", params={"progress": progress}).json()
+    assert (response["exercise"], response["progress"]) == ("squats", progress)
+    # Looked up in the precomputed table, so within a progress step of the exact pose
+    assert np.allclose(
+        points(response["reference_skeleton"]), points(get_reference_skeleton("squats", progress)),
+        atol=1e-3, equal_nan=True
+    )
+
+@pytest.mark.parametrize("progress", [-0.2, 1.5])
+def test_out_of_range_progress_extends_the_reference_curve(client, progress):
+    response = client.get("/reference/skeleton/squats", params={"progress": progress})
+    assert response.status_code == 200
+    assert response.json()["reference_skeleton"] == get_reference_skeleton("squats", progress)
+
+def test_skeletons_need_a_numeric_progress(client):
+    assert client.get("/reference/skeleton/squats", params={"progress": "half"}).status_code == 422
+
+def test_calibrated_skeletons(client):
+    landmarks = t_pose_landmarks(0.5, (0.3, 0.1))
+    calibration_id = client.post("/reference/calibrate", json={"landmarks": landmarks}).json()["calibration_id"]
+    response = client.get(
+        "/reference/skeleton/squats", params={"progress": 0.42, "calibration_id": calibration_id}
+    ).json()
+    expected = get_reference_skeleton("squats", 0.42, calibrate_user_skeleton(landmarks))
+    assert np.allclose(points(response["reference_skeleton"]), points(expected), atol=1e-3, equal_nan=True)
+
+@pytest.mark.parametrize("steps", [2, 7, 1000])
+def test_trajectories_have_the_requested_steps(client, steps):
+    response = client.get("/reference/trajectory/bicep_curls", params={"steps": steps}).json()
+    indices, frames = get_reference_trajectory("bicep_curls", steps)
+    assert response["steps"] == steps
+    assert response["landmark_indices"] == indices
+    assert np.allclose(response["frames"], frames)
+    assert np.array(response["frames"]).shape == (steps, len(indices), 2)
+
+@pytest.mark.parametrize("steps", [0, 1, 1001])
+def test_trajectory_steps_are_bounded(client, steps):
+    assert client.get("/reference/trajectory/squats", params={"steps": steps}).status_code == 422
+
+def test_binary_trajectories_match_json_ones(client):
+    params = {"steps": 4}
+    json_frames = client.get("/reference/trajectory/squats", params=params).json()["frames"]
+    response = client.get(
+        "/reference/trajectory/squats", params=params, headers={"Accept": "application/octet-stream"}
+    )
+    assert response.headers["content-type"] == "application/octet-stream"
+    shape = tuple(int(size) for size in response.headers["X-Trajectory-Shape"].split(","))
+    frames = np.frombuffer(response.content, dtype="<f4").reshape(shape)
+    assert np.array_equal(frames, np.array(json_frames, dtype="<f4"))
+
+def test_calibrated_trajectories(client):
+    landmarks = t_pose_landmarks(1.2, (-0.1, 0.0))
+    calibration_id = client.post("/reference/calibrate", json={"landmarks": landmarks}).json()["calibration_id"]
+    response = client.get(
+        "/reference/trajectory/squats", params={"steps": 5, "calibration_id": calibration_id}
+    ).json()
+    _, frames = get_reference_trajectory("squats", 5, calibrate_user_skeleton(landmarks))
+    assert np.allclose(response["frames"], frames)
+
+def test_trajectories_of_unknown_exercises_are_not_found(client):
+    assert client.get("/reference/trajectory/jumping_jacks").status_code == 404
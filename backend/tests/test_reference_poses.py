@@ -0,0 +1,80 @@
+"""Tests for reference skeleton calibration"""
+import numpy as np
+import pytest
+
+from reference_poses import (
+    T_POSE_REFERENCE, LANDMARK_INDICES, REFERENCE_ANGLES, apply_calibration, build_skeleton,
+    build_progress_lookup, calibrate_user_skeleton, estimate_progress, get_reference_trajectory,
+    interpolate_angle
+)
+
+# Every joint curve that moves: (exercise, joint, start_angle, end_angle, mid_ratio)
+MOVING_JOINTS = [
+    (exercise, joint, *params)
+    for exercise, joints in REFERENCE_ANGLES.items()
+    for joint, params in joints.items()
+    if params[0] != params[1]
+]
+
+def t_pose_landmarks(scale, offset):
+    """The reference T-pose scaled and moved, as a 33-landmark list"""
+    landmarks = [{"x": 0.0, "y": 0.0}] * 33
+    for name, index in LANDMARK_INDICES.items():
+        x, y = T_POSE_REFERENCE[name]
+        landmarks[index] = {"x": x * scale + offset[0], "y": y * scale + offset[1]}
+    return landmarks
+
+def test_calibration_maps_the_t_pose_onto_the_user():
+    calibration = calibrate_user_skeleton(t_pose_landmarks(0.5, (0.3, 0.1)))
+    skeleton = apply_calibration({name: list(point) for name, point in T_POSE_REFERENCE.items()}, calibration)
+    for name, (x, y) in T_POSE_REFERENCE.items():
+        assert skeleton[name] == pytest.approx([x * 0.5 + 0.3, y * 0.5 + 0.1])
+
+def test_calibration_without_landmarks_leaves_the_skeleton_unchanged():
+    calibration = calibrate_user_skeleton([])
+    assert build_skeleton("squats", 0.3, calibration) == build_skeleton("squats", 0.3)
+
+def test_calibrated_trajectory_matches_single_skeletons():
+    calibration = calibrate_user_skeleton(t_pose_landmarks(1.2, (-0.1, 0.0)))
+    indices, frames = get_reference_trajectory("bicep_curls", 5, calibration)
+    names = {index: name for name, index in LANDMARK_INDICES.items()}
+    for step, progress in enumerate(np.linspace(0.0, 1.0, 5)):
+        skeleton = build_skeleton("bicep_curls", progress, calibration)
+        expected = [skeleton[names[index]] for index in indices]
+        assert np.allclose(frames[step], expected)
+
+@pytest.mark.parametrize("exercise, joint, start, end, mid_ratio", MOVING_JOINTS)
+def test_angle_curves_are_continuous_at_the_phase_boundary(exercise, joint, start, end, mid_ratio):
+    assert interpolate_angle(start, end, 0.0, mid_ratio) == start
+    assert interpolate_angle(start, end, 1.0, mid_ratio) == pytest.approx(end)
+    # The first phase covers mid_ratio of the motion and the second picks up there
+    at_boundary = start + (end - start) * mid_ratio
+    for progress in (np.nextafter(mid_ratio, 0.0), mid_ratio, np.nextafter(mid_ratio, 1.0)):
+        assert interpolate_angle(start, end, progress, mid_ratio) == pytest.approx(at_boundary)
+
+@pytest.mark.parametrize("exercise, joint, start, end, mid_ratio", MOVING_JOINTS)
+def test_angle_curves_are_monotonic_and_the_same_for_arrays(exercise, joint, start, end, mid_ratio):
+    progress = np.linspace(0.0, 1.0, 501)
+    angles = interpolate_angle(start, end, progress, mid_ratio)
+    steps = np.diff(angles) * np.sign(end - start)
+    assert (steps >= 0).all()
+    # No jump anywhere: a step is never far above the average step
+    assert steps.max() < 3 * abs(end - start) / len(steps)
+    assert np.allclose(angles, [interpolate_angle(start, end, p, mid_ratio) for p in progress])
+
+def test_progress_lookups_are_sorted_by_angle():
+    angles, progress = build_progress_lookup(165, 45, 0.5)
+    assert (np.diff(angles) > 0).all()
+    assert (progress[0], progress[-1]) == (1.0, 0.0)
+
+@pytest.mark.parametrize("exercise, joint, start, end, mid_ratio", MOVING_JOINTS)
+def test_estimated_progress_inverts_the_reference_curve(exercise, joint, start, end, mid_ratio):
+    progress = np.linspace(0.0, 1.0, 41)
+    angles = interpolate_angle(start, end, progress, mid_ratio)
+    assert np.allclose(estimate_progress(exercise, joint, angles), progress, atol=2e-3)
+    assert estimate_progress(exercise, joint, float(angles[10])) == pytest.approx(progress[10], abs=2e-3)
+
+def test_estimated_progress_is_clamped_and_needs_a_moving_joint():
+    assert estimate_progress("squats", "knee", [200.0, 60.0]).tolist() == [0.0, 1.0]
+    assert estimate_progress("pushups", "body", 180.0) is None
+    assert estimate_progress("jumping_jacks", "knee", 90.0) is None
@@ -0,0 +1,73 @@
+"""Tests for rep list pagination and NDJSON streaming"""
+import json
+
+import pytest
+
+import session_state
+
+EXERCISES = ["squats", "pushups", "squats", "squats", "pushups"]
+
+@pytest.fixture(params=["live", "ended"])
+def session_id(request, client):
+    """A session with five reps, still live or ended (and read back from its journal)"""
+    session_id = client.post("/session/start", json={}).json()["session_id"]
+    for number, exercise in enumerate(EXERCISES):
+        client.post(f"/session/{session_id}/record", json={
+            "exercise": exercise, "feedback_flags": [], "metrics": {"number": number}
+        })
+    if request.param == "ended":
+        client.post(f"/session/{session_id}/end")
+        assert session_id not in session_state.active_sessions
+    return session_id
+
+def numbers(reps):
+    return [rep["metrics"]["number"] for rep in reps]
+
+def test_all_reps_without_a_limit(client, session_id):
+    page = client.get(f"/session/{session_id}/reps").json()
+    assert [rep["rep_index"] for rep in page["reps"]] == [0, 1, 2, 3, 4]
+    assert numbers(page["reps"]) == [0, 1, 2, 3, 4]
+    assert (page["rep_count"], page["next_cursor"], page["has_more"]) == (5, 4, False)
+
+def test_pages_follow_the_cursor(client, session_id):
+    pages, after = [], None
+    while True:
+        params = {"limit": 2} if after is None else {"limit": 2, "after": after}
+        page = client.get(f"/session/{session_id}/reps", params=params).json()
+        pages.append(numbers(page["reps"]))
+        after = page["next_cursor"]
+        if not page["has_more"]:
+            break
+    assert pages == [[0, 1], [2, 3], [4]]
+
+def test_a_full_last_page_is_not_followed_by_more(client, session_id):
+    page = client.get(f"/session/{session_id}/reps", params={"after": 2, "limit": 2}).json()
+    assert numbers(page["reps"]) == [3, 4]
+    assert (page["next_cursor"], page["has_more"]) == (4, False)
+    # Past the end the cursor stays where it was
+    page = client.get(f"/session/{session_id}/reps", params={"after": 4}).json()
+    assert (page["reps"], page["next_cursor"], page["has_more"]) == ([], 4, False)
+
+def test_exercise_pages_use_session_wide_cursors(client, session_id):
+    url = f"/session/{session_id}/exercise/squats/reps"
+    page = client.get(url, params={"limit": 2}).json()
+    assert page["exercise"] == "squats"
+    assert [rep["rep_index"] for rep in page["reps"]] == [0, 2]
+    assert (page["next_cursor"], page["has_more"]) == (2, True)
+    page = client.get(url, params={"after": 2, "limit": 2}).json()
+    assert [rep["rep_index"] for rep in page["reps"]] == [3]
+    assert page["has_more"] is False
+
+def test_ndjson_streams_one_rep_per_line(client, session_id):
+    ndjson = {"Accept": "application/x-ndjson"}
+    response = client.get(f"/session/{session_id}/reps", params={"after": 0, "limit": 3}, headers=ndjson)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    reps = [json.loads(line) for line in response.text.splitlines()]
+    assert [rep["rep_index"] for rep in reps] == [1, 2, 3]
+    assert numbers(reps) == [1, 2, 3]
+
+    response = client.get(f"/session/{session_id}/exercise/pushups/reps", headers=ndjson)
+    assert [json.loads(line)["rep_index"] for line in response.text.splitlines()] == [1, 4]
+
+def test_unknown_sessions_are_not_found(client):
+    assert client.get("/session/missing/reps").status_code == 404
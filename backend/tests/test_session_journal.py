@@ -0,0 +1,109 @@
+"""Tests for the buffered session journal"""
+import time
+
+import pytest
+
+import session_journal
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    """Journal files and the session index in a temporary directory, flushed after 50 ms"""
+    monkeypatch.setattr(session_journal, "LOGS_DIR", tmp_path)
+    monkeypatch.setattr(session_journal, "JOURNAL_FLUSH_INTERVAL", 0.05)
+    monkeypatch.setattr(session_journal, "INDEX_PATH", tmp_path / "index.jsonl")
+    monkeypatch.setattr(session_journal, "index_offsets", None)
+    yield tmp_path
+    session_journal.stop_flusher()
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_flusher_writes_buffers_once_due(journal_dir):
+    session_journal.append_record("idle", {"type": "rep", "score": 90})
+    path = session_journal.journal_path("idle")
+    assert not path.exists()
+    # No further records or requests: only the flusher writes the buffer
+    session_journal.start_flusher()
+    assert wait_for(path.exists)
+    assert path.read_text() == '{"type":"rep","score":90}\n'
+    assert "idle" not in session_journal.journal_buffers
+
+def test_stop_flusher_writes_remaining_buffers(journal_dir, monkeypatch):
+    monkeypatch.setattr(session_journal, "JOURNAL_FLUSH_INTERVAL", 60.0)
+    session_journal.start_flusher()
+    session_journal.append_record("pending", {"type": "rep", "score": 70})
+    session_journal.stop_flusher()
+    assert session_journal.flusher_thread is None
+    assert session_journal.journal_path("pending").read_text() == '{"type":"rep","score":70}\n'
+
+def test_flush_due_journals_reports_the_next_due_time(journal_dir):
+    assert session_journal.flush_due_journals() is None
+    session_journal.append_record("fresh", {"type": "rep"})
+    wait = session_journal.flush_due_journals()
+    assert 0 < wait <= 0.05
+    assert wait_for(lambda: session_journal.flush_due_journals() is None)
+    assert session_journal.journal_path("fresh").exists()
+
+def test_records_after_a_torn_line_are_read_back(journal_dir):
+    path = session_journal.journal_path("crashed")
+    # A crash mid-write left half a record at the end of the journal
+    path.write_text('{"type":"start","session_id":"crashed"}\n{"type":"rep","sco')
+    session_journal.append_record("crashed", {"type": "rep", "score": 80})
+    session_journal.flush_journal("crashed")
+
+    records = session_journal.read_journal("crashed")
+    assert records == [{"type": "start", "session_id": "crashed"}, {"type": "rep", "score": 80}]
+
+def reload_index():
+    """Forget the index offsets, as after a restart"""
+    session_journal.index_offsets = None
+
+def test_index_keeps_the_latest_entry_of_each_session(journal_dir):
+    session_journal.append_index_entry({"session_id": "a", "total_reps": 1})
+    session_journal.append_index_entry({"session_id": "b", "total_reps": 2})
+    session_journal.append_index_entry({"session_id": "a", "total_reps": 3})
+    assert session_journal.read_index_entry("a") == {"session_id": "a", "total_reps": 3}
+    reload_index()
+    assert session_journal.read_index_entry("a") == {"session_id": "a", "total_reps": 3}
+    assert session_journal.read_index_entry("b") == {"session_id": "b", "total_reps": 2}
+    assert session_journal.read_index_entry("c") is None
+
+def test_index_is_compacted_once_mostly_superseded(journal_dir, monkeypatch):
+    monkeypatch.setattr(session_journal, "INDEX_COMPACT_BYTES", 200)
+    session_journal.append_index_entry({"session_id": "kept", "total_reps": 5})
+    for reps in range(20):
+        session_journal.append_index_entry({"session_id": "rewritten", "total_reps": reps})
+        # Never more than the threshold or the live entries of superseded bytes
+        assert session_journal.index_stale_bytes <= 200
+    lines = session_journal.INDEX_PATH.read_text().splitlines()
+    assert len(lines) < 10
+    assert lines[0] == '{"session_id":"kept","total_reps":5}'
+
+    reload_index()
+    assert session_journal.read_index_entry("kept") == {"session_id": "kept", "total_reps": 5}
+    assert session_journal.read_index_entry("rewritten") == {"session_id": "rewritten", "total_reps": 19}
+
+def test_offsets_from_before_a_compaction_find_no_entry(journal_dir, monkeypatch):
+    session_journal.append_index_entry({"session_id": "a", "total_reps": 1})
+    session_journal.append_index_entry({"session_id": "b", "total_reps": 2})
+    stale_offsets = dict(session_journal.index_offsets)
+    monkeypatch.setattr(session_journal, "INDEX_COMPACT_BYTES", 0)
+    for reps in range(3, 6):
+        session_journal.append_index_entry({"session_id": "a", "total_reps": reps})
+    assert session_journal.index_offsets["b"] != stale_offsets["b"]
+    # A reader that looked up b's offset before the rewrite reads another line
+    monkeypatch.setattr(session_journal, "index_offsets", stale_offsets)
+    assert session_journal.read_index_entry("b") is None
+
+def test_index_entries_after_a_torn_line_are_read_back(journal_dir):
+    session_journal.INDEX_PATH.write_text('{"session_id":"a","total_reps":1}\n{"session_id":"b","tot')
+    session_journal.append_index_entry({"session_id": "c", "total_reps": 4})
+    reload_index()
+    assert session_journal.read_index_entry("a") == {"session_id": "a", "total_reps": 1}
+    assert session_journal.read_index_entry("b") is None
+    assert session_journal.read_index_entry("c") == {"session_id": "c", "total_reps": 4}
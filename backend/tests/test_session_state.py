@@ -0,0 +1,37 @@
+"""Tests for session aggregates and the session copies handed out"""
+import pytest
+
+from session_state import apply_rep, new_session_data, snapshot_session
+
+def rep(metrics, score=80):
+    return {"exercise": "situps", "score": score, "feedback_flags": [], "metrics": metrics}
+
+def test_snapshots_carry_metric_summaries_not_running_stats():
+    session = new_session_data("s1")
+    for angle in (100, 104):
+        apply_rep(session, rep({"hip_angle": angle}))
+
+    exercise = snapshot_session(session)["metrics"]["exercises"]["situps"]
+    assert "metric_stats" not in exercise
+    assert exercise["metric_summary"]["hip_angle"] == {
+        "average": 102.0, "std_dev": 2.0, "min": 100, "max": 104, "count": 2
+    }
+
+def test_bool_metrics_average_to_the_share_of_reps():
+    session = new_session_data("s1")
+    for strain in (True, False, False, False):
+        apply_rep(session, rep({"neck_strain": strain}))
+
+    summary = snapshot_session(session)["metrics"]["exercises"]["situps"]["metric_summary"]
+    assert summary["neck_strain"]["average"] == pytest.approx(0.25)
+    assert (summary["neck_strain"]["min"], summary["neck_strain"]["max"]) == (False, True)
+
+def test_snapshots_do_not_change_with_later_reps():
+    session = new_session_data("s1")
+    apply_rep(session, rep({"hip_angle": 100}))
+    snapshot = snapshot_session(session)
+    apply_rep(session, rep({"hip_angle": 120}))
+
+    assert snapshot["metrics"]["total_reps"] == 1
+    assert len(snapshot["rep_log"]) == 1
+    assert snapshot["metrics"]["exercises"]["situps"]["metric_summary"]["hip_angle"]["max"] == 100
@@ -0,0 +1,67 @@
+"""Tests for the per-session exercise state store"""
+import threading
+
+from state import ExerciseStateWrapper
+
+def session_lock(store, session_id):
+    return store._sessions[session_id].lock
+
+def test_sessions_in_use_are_not_evicted_beyond_the_limit():
+    store = ExerciseStateWrapper(max_sessions=2)
+    with store.lock("busy"):
+        held = session_lock(store, "busy")
+        for session_id in ("a", "b", "c"):
+            store[(session_id, "squats")] = {"counter": 1}
+        assert "busy" in store._sessions
+        assert len(store) == 2
+        # A request arriving now waits for the same lock
+        with store.lock("busy"):
+            assert session_lock(store, "busy") is held
+    # Once released the session is evictable again
+    for session_id in ("d", "e"):
+        store[(session_id, "squats")] = {"counter": 1}
+    assert "busy" not in store._sessions
+
+def test_sessions_in_use_are_not_evicted_when_idle(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("state.time.time", lambda: now[0])
+    store = ExerciseStateWrapper(reset_timeout=10)
+    with store.lock("slow"):
+        now[0] += 60
+        store[("other", "squats")] = {"counter": 1}
+        assert "slow" in store._sessions
+    now[0] += 60
+    store[("other", "squats")] = {"counter": 2}
+    assert "slow" not in store._sessions
+
+def test_requests_of_one_session_are_serialized_across_evictions():
+    store = ExerciseStateWrapper(max_sessions=1)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with store.lock("s"):
+            entered.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait(5)
+    store[("other", "squats")] = {"counter": 1}
+    try:
+        # Still the lock the first request holds
+        assert not session_lock(store, "s").acquire(timeout=0.05)
+    finally:
+        release.set()
+        holder.join()
+
+def test_discarding_a_session_in_use_keeps_its_lock():
+    store = ExerciseStateWrapper()
+    with store.lock("s"):
+        store[("s", "squats")] = {"counter": 3}
+        held = session_lock(store, "s")
+        store.discard_session("s")
+        assert store.get(("s", "squats"))["repCount"] == 0
+        assert session_lock(store, "s") is held
+    store.discard_session("s")
+    assert len(store) == 0
@@ -0,0 +1,61 @@
+"""Tests for the landmark stream WebSocket endpoint"""
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from benchmarks.synthetic import generate_sequence, to_landmark_lists
+from frame_codec import encode_frames
+
+@pytest.fixture(scope="module")
+def squat_frames():
+    """Two squat reps of 30 frames each"""
+    return generate_sequence("squats", frame_count=60, frames_per_rep=30)
+
+def test_json_frames_are_analyzed_and_their_frame_id_echoed(client, squat_frames):
+    with client.websocket_connect("/ws/landmarks/squats") as ws:
+        ws.send_json({"landmarks": to_landmark_lists(squat_frames[:1])[0], "frame_id": 7})
+        result = ws.receive_json()
+    assert "error" not in result
+    assert result["frame_id"] == 7
+    assert result["counter"] == 0
+    assert "processing_time_ms" in result
+
+def test_binary_frames_are_analyzed_with_their_timestamp(client, squat_frames):
+    with client.websocket_connect("/ws/landmarks/squats") as ws:
+        ws.send_bytes(encode_frames(squat_frames[:1], timestamps=[1234.5]))
+        result = ws.receive_json()
+    assert "error" not in result
+    assert result["timestamp"] == 1234.5
+    assert "counter" in result
+
+def test_a_streamed_session_counts_and_records_its_reps(client, squat_frames):
+    session_id = client.post("/session/start", json={"exercise_type": "squats"}).json()["session_id"]
+    with client.websocket_connect(f"/ws/landmarks/squats?session_id={session_id}") as ws:
+        for frame in squat_frames:
+            ws.send_bytes(encode_frames(frame[None]))
+            result = ws.receive_json()
+    assert result["counter"] == 2
+    summary = client.get(f"/session/{session_id}/summary").json()
+    assert summary["metrics"]["total_reps"] == 2
+
+def test_malformed_messages_get_an_error_reply_and_keep_the_stream_open(client, squat_frames):
+    with client.websocket_connect("/ws/landmarks/squats") as ws:
+        ws.send_text("{not json")
+        assert ws.receive_json()["error"].startswith("Processing error")
+        ws.send_bytes(b"\x00" * 100)
+        assert "multiple of 528 bytes" in ws.receive_json()["error"]
+        ws.send_bytes(encode_frames(squat_frames[:2]))
+        assert ws.receive_json() == {"error": "Expected exactly one frame per message"}
+        ws.send_json({"frame_id": 9})
+        assert ws.receive_json() == {"error": "No landmarks provided", "frame_id": 9}
+
+        ws.send_json({"landmarks": to_landmark_lists(squat_frames[:1])[0], "frame_id": 10})
+        result = ws.receive_json()
+    assert "error" not in result
+    assert result["frame_id"] == 10
+
+def test_unknown_exercises_close_the_stream(client):
+    with client.websocket_connect("/ws/landmarks/jumping_jacks") as ws:
+        assert ws.receive_json() == {"error": "Exercise not found"}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
@@ -0,0 +1,136 @@
+"""
+Bounded TTL Cache
+-----------------
+Dict-like in-memory cache bounded by entry count and idle time.
+
+Entries are kept in least recently used order, so lookups, inserts and
+evictions are all O(1): expired entries are always at the front and are
+swept lazily on every write, and the least recently used entry is dropped
+when the cache is full. An optional on_evict(key, value) callback runs for
+every entry that is evicted (not for explicit pop/clear), outside the
+cache lock, e.g. to spill the value to disk.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with idle expiry.
+
+    Args:
+        max_entries: Maximum number of entries (None for unbounded)
+        ttl: Seconds an entry may stay unused before it expires (None for no expiry)
+        on_evict: Optional callback(key, value) for evicted entries
+        clock: Time source, time.monotonic by default
+    """
+    def __init__(self, max_entries=None, ttl=None, on_evict=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._clock = clock
+        self._data = OrderedDict()   # key -> [value, last_access], least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _is_expired(self, last_access, now):
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def _evict_locked(self, now):
+        """Pop expired and overflowing entries; call with the lock held"""
+        evicted = []
+        while self._data:
+            key, (value, last_access) = next(iter(self._data.items()))
+            over_capacity = self.max_entries is not None and len(self._data) > self.max_entries
+            if not over_capacity and not self._is_expired(last_access, now):
+                break
+            self._data.popitem(last=False)
+            evicted.append((key, value))
+        self.evictions += len(evicted)
+        return evicted
+
+    def _notify(self, evicted):
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def get(self, key, default=None):
+        """Return the value for key (marking it as recently used), or default"""
+        now = self._clock()
+        evicted = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._is_expired(entry[1], now):
+                del self._data[key]
+                self.evictions += 1
+                evicted.append((key, entry[0]))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                entry[1] = now
+                self._data.move_to_end(key)
+                value = entry[0]
+        self._notify(evicted)
+        return value
+
+    def __getitem__(self, key):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        now = self._clock()
+        with self._lock:
+            self._data[key] = [value, now]
+            self._data.move_to_end(key)
+            evicted = self._evict_locked(now)
+        self._notify(evicted)
+
+    def __contains__(self, key):
+        """Membership test that does not count as a use of the entry"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._is_expired(entry[1], self._clock())
+
+    def __len__(self):
+        return len(self._data)
+
+    def pop(self, key, default=None):
+        """Remove key without calling on_evict"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def expire(self):
+        """Evict all expired entries now; returns how many were evicted"""
+        with self._lock:
+            evicted = self._evict_locked(self._clock())
+        self._notify(evicted)
+        return len(evicted)
+
+    def items(self):
+        """Snapshot of the (key, value) pairs, least recently used first"""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Current size and hit/miss/eviction counters"""
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }